@@ -0,0 +1,230 @@
+"""
+Benchmark the catalogue pages and API against a synthetic catalogue.
+
+For each catalogue size the script builds a throwaway test database, fills
+it with `manage.py gen_catalogue`, then drives the endpoints of
+catalogue/urls.py (all but /metrics and the tracklist bulk endpoint)
+through the Django test client, recording latency
+percentiles, query counts and peak Python memory. Results go to a JSON file
+that a later run can be compared against:
+
+    python benchmarks/api_bench.py --sizes 1000 10000 100000 --out bench.json
+    python benchmarks/api_bench.py --sizes 1000 --compare bench.json
+
+The album response cache is swapped for a dummy backend unless --with-cache
+is given, so the numbers reflect the work done per request.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "musicdb_project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import (CaptureQueriesContext,  # noqa: E402
+                               override_settings, setup_test_environment)
+from django.urls import reverse  # noqa: E402
+
+from catalogue.models import (Album, AlbumTracklistItem,  # noqa: E402
+                              MusicManagerUser, Song)
+
+# every alias, including CATALOGUE_API_CACHE's
+DUMMY_CACHE = {alias: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+               for alias in settings.CACHES}
+
+
+def _json_body(make):
+    """Request kwargs factory: a fresh JSON body for every iteration."""
+    return lambda: {"data": json.dumps(make()),
+                    "content_type": "application/json"}
+
+
+def _endpoints():
+    """
+    (name, method, url, body factory) for the URLs in catalogue/urls.py,
+    except /metrics and api_tracklists_bulk.
+    """
+    album = Album.objects.order_by("id").first()
+    song = Song.objects.order_by("id").first()
+    track = AlbumTracklistItem.objects.filter(album=album).first()
+    spares = iter(Song.objects.exclude(albumtracklistitem__album=album)
+                  .values_list("id", flat=True)[:10000])
+    counter = iter(range(10 ** 9))
+    return [
+        ("album_list", "get", reverse("album_list"), None),
+        ("album_detail", "get", reverse("album_detail", args=[album.id]), None),
+        ("album_detail_slug", "get",
+         reverse("album_detail_slug", args=[album.id, album.slug]), None),
+        ("create_album", "get", reverse("create_album"), None),
+        ("album_edit", "get", reverse("album_edit", args=[album.id]), None),
+        ("album_delete", "get", reverse("album_delete", args=[album.id]), None),
+        ("add_track", "get", reverse("add_track", args=[album.id]), None),
+        ("edit_track", "get",
+         reverse("edit_track", args=[album.id, track.id]), None),
+        ("delete_track", "get",
+         reverse("delete_track", args=[album.id, track.id]), None),
+        ("api_home", "get", reverse("api_home"), None),
+        ("api_songs", "get", reverse("api_songs"), None),
+        ("api_songs_page", "get", reverse("api_songs") + "?limit=50", None),
+        ("api_song_detail", "get",
+         reverse("api_song_detail", args=[song.id]), None),
+        ("api_albums", "get", reverse("api_albums"), None),
+        ("api_albums_page", "get", reverse("api_albums") + "?limit=50", None),
+        ("api_album_detail", "get",
+         reverse("api_album_detail", args=[album.id]), None),
+        ("api_tracklists", "get", reverse("api_tracklists"), None),
+        ("api_tracklist_detail", "get",
+         reverse("api_tracklist_detail", args=[track.id]), None),
+        ("api_albums_cache", "get", reverse("api_albums_cache"), None),
+        ("api_search", "get", reverse("api_search") + "?" + urlencode(
+            {"q": album.title.split()[0]}), None),
+        ("api_songs_post", "post", reverse("api_songs"),
+         _json_body(lambda: {"title": "Bench", "length": 120})),
+        # albums are unique per title/artist/format
+        ("api_albums_post", "post", reverse("api_albums"),
+         _json_body(lambda: {"title": f"Bench {next(counter)}",
+                             "artist": "Bench", "price": "1.00",
+                             "format": "DD", "release_date": "2020-01-01"})),
+        ("api_tracklists_post", "post", reverse("api_tracklists"),
+         _json_body(lambda: {"album": album.id, "song": next(spares)})),
+        ("api_songs_bulk", "post", reverse("api_songs_bulk"),
+         _json_body(lambda: [{"title": f"Bulk {i}", "length": 100}
+                             for i in range(100)])),
+    ]
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def _request(client, method, url, body):
+    response = getattr(client, method)(url, **(body() if body else {}))
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def _measure(client, method, url, body, iterations):
+    timings, queries = [], 0
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = _request(client, method, url, body)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(ctx.captured_queries))
+
+    # tracemalloc slows allocation down, so memory gets its own request
+    tracemalloc.start()
+    _request(client, method, url, body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "status": response.status_code,
+        "iterations": iterations,
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p90_ms": round(_percentile(timings, 90), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": queries,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_size(n_albums, tracks_per_album, iterations, seed):
+    call_command("gen_catalogue", albums=n_albums,
+                 tracks_per_album=tracks_per_album, seed=seed, clear=True,
+                 stdout=open(os.devnull, "w"))
+    user, _ = User.objects.get_or_create(username="bench-editor")
+    MusicManagerUser.objects.get_or_create(
+        user=user, defaults={"display_name": "Bench", "permission": "editor"})
+    # a broken view is recorded with its 500 instead of aborting the run
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+
+    results = {}
+    for name, method, url, body in _endpoints():
+        # full-table endpoints get fewer rounds on big catalogues
+        rounds = iterations if n_albums < 10000 or "page" in name or \
+            "detail" in name or method == "post" else max(3, iterations // 10)
+        results[name] = _measure(client, method, url, body, rounds)
+        print(f"  {name:<24} {results[name]['status']} "
+              f"p50={results[name]['p50_ms']:>10.2f}ms "
+              f"q={results[name]['queries']:<4} "
+              f"peak={results[name]['peak_kib']:>10.1f}KiB")
+    return results
+
+
+def compare(current, baseline):
+    print("\nchange in p50 / queries vs baseline:")
+    for size, endpoints in current["sizes"].items():
+        old_endpoints = baseline.get("sizes", {}).get(size, {})
+        for name, stats in endpoints.items():
+            old = old_endpoints.get(name)
+            if not old:
+                continue
+            delta = ((stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+                     if old["p50_ms"] else 0.0)
+            print(f"  {size:>7} {name:<24} {delta:+7.1f}%  "
+                  f"queries {old['queries']} -> {stats['queries']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--tracks-per-album", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_output.json")
+    parser.add_argument("--compare", help="Earlier results file to diff.")
+    parser.add_argument("--with-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    setup_test_environment()
+    # 500s are recorded in the results; their tracebacks are just noise here
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    report = {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "tracks_per_album": args.tracks_per_album,
+        "sizes": {},
+    }
+    settings_override = {} if args.with_cache else {"CACHES": DUMMY_CACHE}
+    try:
+        with override_settings(**settings_override):
+            for size in args.sizes:
+                print(f"{size} albums x {args.tracks_per_album} tracks")
+                report["sizes"][str(size)] = run_size(
+                    size, args.tracks_per_album, args.iterations, args.seed)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {args.out}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
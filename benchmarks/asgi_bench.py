@@ -0,0 +1,231 @@
+"""
+Compare sync WSGI and async ASGI throughput for the read API under load.
+
+The script builds a throwaway test database filled by `manage.py
+gen_catalogue`, then fires the same mix of read requests at two in-process
+handlers:
+
+  wsgi  Django's WSGIHandler with the sync views, driven by a thread pool
+        the size of a typical gthread worker (--threads)
+  asgi  Django's ASGIHandler with catalogue/async_api_views.py routed in
+        (CATALOGUE_ASYNC_API), driven by one event loop
+
+keeping --concurrency requests in flight, and reports requests/second and
+latency percentiles for each concurrency level:
+
+    python benchmarks/asgi_bench.py --albums 2000 --concurrency 16 64 256
+
+No server sockets are involved, so the numbers isolate the Django/ORM side;
+run a real server (gunicorn vs uvicorn) for end-to-end figures.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "musicdb_project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import (override_settings,  # noqa: E402
+                               setup_test_environment)
+from django.urls import clear_url_caches, reverse  # noqa: E402
+
+from catalogue.models import Album, Song  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from api_bench import DUMMY_CACHE, _percentile  # noqa: E402
+
+
+def _urls():
+    """The read mix: detail lookups plus a paginated page of each list."""
+    album_ids = list(Album.objects.order_by("id").values_list("id", flat=True)[:50])
+    song_ids = list(Song.objects.order_by("id").values_list("id", flat=True)[:50])
+    urls = []
+    for album_id, song_id in zip(album_ids, song_ids):
+        urls += [reverse("api_album_detail", args=[album_id]),
+                 reverse("api_song_detail", args=[song_id])]
+    urls += [reverse("api_albums") + "?limit=50",
+             reverse("api_songs") + "?limit=50"] * 10
+    return urls
+
+
+def _use_async_views(enabled):
+    # catalogue/urls.py picks the view module at import time
+    import catalogue.urls
+    import musicdb_project.urls
+
+    with override_settings(CATALOGUE_ASYNC_API=enabled):
+        importlib.reload(catalogue.urls)
+        importlib.reload(musicdb_project.urls)
+    clear_url_caches()
+
+
+def _summary(latencies, elapsed, statuses):
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "errors": sum(1 for s in statuses if s >= 400),
+    }
+
+
+def run_wsgi(urls, total, concurrency, threads):
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    local = threading.local()
+
+    def one(url):
+        split = urlsplit(url)
+        environ = factory._base_environ(
+            PATH_INFO=split.path, QUERY_STRING=split.query,
+            REQUEST_METHOD="GET")
+        started = time.perf_counter()
+
+        def start_response(status, headers, exc_info=None):
+            local.status = int(status.split()[0])
+
+        body = handler(environ, start_response)
+        for _ in body:
+            pass
+        body.close()
+        return (time.perf_counter() - started) * 1000, local.status
+
+    latencies, statuses = [], []
+    # the pool is what caps requests in flight under WSGI
+    with ThreadPoolExecutor(max_workers=min(threads, concurrency)) as pool:
+        started = time.perf_counter()
+        for latency, status in pool.map(one, (urls[i % len(urls)]
+                                              for i in range(total))):
+            latencies.append(latency)
+            statuses.append(status)
+        elapsed = time.perf_counter() - started
+        # each pool thread opened its own connection
+        pool.map(lambda _: connections.close_all(), range(threads))
+    return _summary(latencies, elapsed, statuses)
+
+
+async def _asgi_request(app, url):
+    split = urlsplit(url)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "root_path": "",
+        "path": split.path, "raw_path": split.path.encode(),
+        "query_string": split.query.encode(),
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    sent = asyncio.Event()
+    request_sent = False
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await sent.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body"):
+            sent.set()
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return (time.perf_counter() - started) * 1000, status
+
+
+async def _run_asgi(urls, total, concurrency):
+    app = ASGIHandler()
+    queue = iter(urls[i % len(urls)] for i in range(total))
+    latencies, statuses = [], []
+
+    async def client():
+        for url in queue:
+            latency, status = await _asgi_request(app, url)
+            latencies.append(latency)
+            statuses.append(status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return _summary(latencies, time.perf_counter() - started, statuses)
+
+
+def run_asgi(urls, total, concurrency):
+    return asyncio.run(_run_asgi(urls, total, concurrency))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--albums", type=int, default=2000)
+    parser.add_argument("--tracks-per-album", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[16, 64, 256])
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="Requests per mode and concurrency level.")
+    parser.add_argument("--threads", type=int, default=8,
+                        help="WSGI worker threads (gunicorn --threads).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="asgi_bench_output.json")
+    parser.add_argument("--with-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    report = {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "albums": args.albums,
+        "threads": args.threads,
+        "results": {},
+    }
+    settings_override = {} if args.with_cache else {"CACHES": DUMMY_CACHE}
+    try:
+        with override_settings(**settings_override):
+            call_command("gen_catalogue", albums=args.albums,
+                         tracks_per_album=args.tracks_per_album,
+                         seed=args.seed, clear=True,
+                         stdout=open(os.devnull, "w"))
+            urls = _urls()
+            for concurrency in args.concurrency:
+                _use_async_views(False)
+                wsgi = run_wsgi(urls, args.requests, concurrency, args.threads)
+                _use_async_views(True)
+                asgi = run_asgi(urls, args.requests, concurrency)
+                report["results"][str(concurrency)] = {"wsgi": wsgi, "asgi": asgi}
+                for mode, stats in (("wsgi", wsgi), ("asgi", asgi)):
+                    print(f"  c={concurrency:<5} {mode}  {stats['rps']:>9.1f} req/s "
+                          f"p50={stats['p50_ms']:>9.2f}ms "
+                          f"p99={stats['p99_ms']:>9.2f}ms "
+                          f"errors={stats['errors']}")
+    finally:
+        _use_async_views(False)
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
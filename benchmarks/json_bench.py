@@ -0,0 +1,150 @@
+"""
+Micro-benchmark of album list encoding.
+
+Builds --albums in-memory albums (no database) with --tracks tracks each,
+a --covered fraction of them with resized cover variants, as model
+instances and as the values_list() rows the unpaginated album list reads,
+and times turning them into a response body:
+
+    django    django.http.JsonResponse over _serialize_albums() dicts
+    dicts     catalogue.encoding.dumps() over the same dicts
+    rows      api_views._encode_album_rows() straight from the row tuples
+
+once per wire format and installed backend: stdlib (JsonResponse's
+format), stdlib-compact and orjson-compact (CATALOGUE_JSON_COMPACT).
+Reports the median of --repeat runs and checks that "dicts" and "rows"
+write the same bytes.
+--fields times a sparse fieldset (?fields=) instead of every field:
+
+    python benchmarks/json_bench.py --albums 10000 --repeat 5
+    python benchmarks/json_bench.py --fields id,title,artist,price
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "musicdb_project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.http import JsonResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import (override_settings,  # noqa: E402
+                               setup_test_environment)
+from django.urls import reverse  # noqa: E402
+
+from catalogue import encoding  # noqa: E402
+from catalogue.api_views import (_encode_album_rows,  # noqa: E402
+                                 _serialize_albums)
+from catalogue.fieldsets import ALBUM_FIELDS  # noqa: E402
+from catalogue.models import Album, AlbumTracklistItem, Song  # noqa: E402
+
+AlbumRow = namedtuple("AlbumRow", (
+    "id", "total_playtime", "description", "release_date", "cover_image",
+    "cover_variants", "title", "artist", "price", "format", "slug"))
+
+
+def _catalogue(n_albums, n_tracks, covered):
+    """(albums as model instances, album rows, track rows)."""
+    albums, album_rows, track_rows = [], [], []
+    song_id = 0
+    for pk in range(1, n_albums + 1):
+        album = Album(
+            id=pk, title=f"Album {pk} – “live”", artist=f"Artist {pk % 500}",
+            description=f"Liner notes for album {pk}. " * 8,
+            price=Decimal("9.99"), format="CD",
+            release_date=date(2000, 1, 1) + timedelta(days=pk % 7000),
+            cover_variants={"digest": f"{pk:064x}", "widths": [160, 320, 640]}
+            if pk % 100 < covered * 100 else {},
+            slug=f"album-{pk}")
+        album.tracklist = []
+        playtime = 0
+        for position in range(1, n_tracks + 1):
+            song_id += 1
+            song = Song(id=song_id, title=f"Track {position} of {pk}",
+                        length=180 + position)
+            playtime += song.length
+            album.tracklist.append(
+                AlbumTracklistItem(album=album, song=song, position=position))
+            track_rows.append((pk, song.id, song.title, song.length))
+        album.total_playtime = playtime
+        albums.append(album)
+        album_rows.append(AlbumRow(
+            pk, playtime, album.description, album.release_date,
+            album.cover_image.name, album.cover_variants, album.title,
+            album.artist, album.price, album.format, album.slug))
+    return albums, album_rows, track_rows
+
+
+def _time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--albums", type=int, default=10000)
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--covered", type=float, default=0.1)
+    parser.add_argument("--fields", default=",".join(ALBUM_FIELDS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default="json_bench_output.json")
+    args = parser.parse_args(argv)
+
+    setup_test_environment()
+    request = RequestFactory().get(reverse("api_albums"))
+    albums, album_rows, track_rows = _catalogue(args.albums, args.tracks,
+                                                args.covered)
+    fields = tuple(f for f in ALBUM_FIELDS if f in args.fields.split(","))
+    if "tracks" not in fields:
+        track_rows = []  # _album_row_querysets() skips the tracklist query
+    backends = {"stdlib": {"CATALOGUE_JSON_BACKEND": "stdlib",
+                           "CATALOGUE_JSON_COMPACT": False},
+                "stdlib-compact": {"CATALOGUE_JSON_BACKEND": "stdlib",
+                                   "CATALOGUE_JSON_COMPACT": True}}
+    if encoding.orjson:
+        backends["orjson-compact"] = {"CATALOGUE_JSON_BACKEND": "orjson",
+                                      "CATALOGUE_JSON_COMPACT": True}
+
+    report = {"albums": args.albums, "tracks": args.tracks,
+              "covered": args.covered, "fields": fields, "repeat": args.repeat, "results": {}}
+    ms, body = _time(lambda: JsonResponse(
+        _serialize_albums(albums, request, fields), safe=False).content, args.repeat)
+    report["results"]["django"] = {"ms": round(ms, 2), "bytes": len(body)}
+    print(f"{'django':<22} {ms:>9.1f} ms  {len(body):>11,} bytes")
+
+    for name, conf in backends.items():
+        with override_settings(**conf):
+            dicts_ms, dicts = _time(lambda: encoding.dumps(
+                _serialize_albums(albums, request, fields)), args.repeat)
+            rows_ms, rows = _time(lambda: _encode_album_rows(
+                album_rows, track_rows, request, fields), args.repeat)
+        report["results"][f"dicts+{name}"] = {"ms": round(dicts_ms, 2),
+                                              "bytes": len(dicts)}
+        report["results"][f"rows+{name}"] = {"ms": round(rows_ms, 2),
+                                             "bytes": len(rows),
+                                             "identical": rows == dicts}
+        print(f"{'dicts+' + name:<22} {dicts_ms:>9.1f} ms  {len(dicts):>11,} bytes")
+        print(f"{'rows+' + name:<22} {rows_ms:>9.1f} ms  {len(rows):>11,} bytes"
+              f"  {'identical' if rows == dicts else 'DIFFERENT'}")
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
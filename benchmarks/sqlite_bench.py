@@ -0,0 +1,173 @@
+"""
+Mixed read/write concurrency benchmark for the SQLite database profiles.
+
+For each profile (MUSICDB_DB_PROFILE, see musicdb_project/settings.py) the
+script starts a child process on a fresh on-disk database, fills it with
+`manage.py gen_catalogue`, and runs --threads client threads for
+--duration seconds. Each thread sends requests through the Django test
+client (so connections are opened and closed as they would be per request):
+reads hit the album/song detail and page endpoints, and --write-ratio of
+requests POST to /api/songs/bulk/, which reads and then writes inside one
+transaction. It reports throughput, latency and failed requests
+("database is locked") per profile:
+
+    python benchmarks/sqlite_bench.py --threads 16 --duration 10
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PROFILES = ("basic", "production")
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def worker(args):
+    """Child process body: one profile, settings already chosen by env."""
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "musicdb_project.settings")
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test import Client
+    from django.test.utils import override_settings, setup_test_environment
+    from django.urls import reverse
+
+    from catalogue.models import Album, Song
+
+    setup_test_environment()
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    devnull = open(os.devnull, "w")
+    call_command("migrate", verbosity=0, stdout=devnull)
+    call_command("gen_catalogue", albums=args.albums, tracks_per_album=10,
+                 seed=0, clear=True, stdout=devnull)
+    album_ids = list(Album.objects.values_list("id", flat=True))
+    song_ids = list(Song.objects.values_list("id", flat=True))
+    connections.close_all()
+
+    stop = threading.Event()
+    results = {"read": [], "write": [], "errors": 0}
+    lock = threading.Lock()
+
+    def client_thread(seed):
+        rng = random.Random(seed)
+        client = Client(raise_request_exception=False)
+        counter = 0
+        while not stop.is_set():
+            if rng.random() < args.write_ratio:
+                kind = "write"
+                counter += 1
+                body = [{"title": f"Load {seed}-{counter}-{i}", "length": 100}
+                        for i in range(10)]
+                started = time.perf_counter()
+                response = client.post(reverse("api_songs_bulk"),
+                                       json.dumps(body),
+                                       content_type="application/json")
+            else:
+                kind = "read"
+                url = rng.choice((
+                    reverse("api_album_detail", args=[rng.choice(album_ids)]),
+                    reverse("api_song_detail", args=[rng.choice(song_ids)]),
+                    reverse("api_songs") + "?limit=50",
+                ))
+                started = time.perf_counter()
+                response = client.get(url)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if response.status_code >= 500:
+                    results["errors"] += 1
+                else:
+                    results[kind].append(elapsed)
+        connections.close_all()
+
+    # the response cache would hide the database from the read path
+    with override_settings(CACHES={
+            alias: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+            for alias in settings.CACHES}):
+        threads = [threading.Thread(target=client_thread, args=(i,))
+                   for i in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    report = {"errors": results["errors"]}
+    for kind in ("read", "write"):
+        timings = results[kind]
+        report[kind] = {
+            "requests": len(timings),
+            "rps": round(len(timings) / elapsed, 1),
+            "p50_ms": round(_percentile(timings, 50), 2),
+            "p99_ms": round(_percentile(timings, 99), 2),
+            "mean_ms": round(statistics.fmean(timings), 2) if timings else 0.0,
+        }
+    print(json.dumps(report))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES),
+                        choices=PROFILES)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--albums", type=int, default=1000)
+    parser.add_argument("--out", default="sqlite_bench_output.json")
+    parser.add_argument("--worker", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        return worker(args)
+
+    report = {"threads": args.threads, "duration": args.duration,
+              "write_ratio": args.write_ratio, "profiles": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in args.profiles:
+            env = dict(os.environ,
+                       MUSICDB_DB_PROFILE=profile,
+                       MUSICDB_SQLITE_PATH=os.path.join(tmp, f"{profile}.sqlite3"))
+            child = subprocess.run(
+                [sys.executable, __file__, "--worker",
+                 "--threads", str(args.threads),
+                 "--duration", str(args.duration),
+                 "--write-ratio", str(args.write_ratio),
+                 "--albums", str(args.albums)],
+                env=env, capture_output=True, text=True, check=True)
+            stats = json.loads(child.stdout.strip().splitlines()[-1])
+            report["profiles"][profile] = stats
+            print(f"{profile:<11} reads {stats['read']['rps']:>8.1f}/s "
+                  f"p99={stats['read']['p99_ms']:>8.1f}ms  "
+                  f"writes {stats['write']['rps']:>7.1f}/s "
+                  f"p99={stats['write']['p99_ms']:>8.1f}ms  "
+                  f"errors={stats['errors']}")
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,26 @@
 from django.contrib import admin
-from .models import Song, Album, AlbumTracklistItem, MusicManagerUser
+from . import jobs
+from .models import (Song, Album, AlbumStats, AlbumTracklistItem, Job,
+                     MusicManagerUser)
 
 admin.site.register(Song)
 admin.site.register(Album)
 admin.site.register(AlbumTracklistItem)
 admin.site.register(MusicManagerUser)
+admin.site.register(AlbumStats)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "key", "status", "attempts", "run_after",
+                    "locked_by", "updated_at")
+    list_filter = ("status", "kind")
+    search_fields = ("key",)
+    readonly_fields = ("created_at", "updated_at", "locked_by", "locked_at",
+                       "last_error")
+    actions = ["retry_jobs"]
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(self, request, queryset):
+        count = jobs.retry(queryset)
+        self.message_user(request, f"{count} job(s) queued for retry.")
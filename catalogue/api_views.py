@@ -1,8 +1,20 @@
-from django.http import JsonResponse, HttpResponseNotAllowed
+from functools import partial
+
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotAllowed
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from . import bulk, cache, encoding, metrics, search
+from .covers import variant_urls
+from .encoding import CONTENT_TYPE, JsonResponse
+from .fieldsets import ALBUM_FIELDS, album_columns, album_fields
+from .conditional import (album_version, albums_version, conditional,
+                          song_version, songs_version, tracklists_version)
 from .models import Song, Album, AlbumTracklistItem
+from .pagination import PaginationError, is_paginated, keyset_paginate
+from .streaming import stream_response, wants_stream
+from .utils import filter_albums_by_stats, uses_album_stats
 import json
 
 # Helper: shorten text for description_short
@@ -13,43 +25,297 @@ def _short(text, n=100):
         return ""
     return text[:n] + ("…" if len(text) > n else "")
 
-# Helper: serialize album to match API samples
+# Helper: album queryset with everything the serializer needs for
+# ``fields``, so a page of albums costs two queries (albums + tracklists)
+# however long it is, or one without tracks
+
+
+def _tracklist_queryset():
+    # album_id first so the prefetch for a page of albums is read in
+    # tracklist_album_position_idx order instead of sorted afterwards
+    return (AlbumTracklistItem.objects
+            .select_related("song")
+            .order_by("album_id", "position", "id"))
+
+
+def _album_queryset(fields=ALBUM_FIELDS, stats=False):
+    """``stats``: annotate the playtime stats even if they aren't shown."""
+    albums = Album.objects.only(*album_columns(fields))
+    if stats or "total_playtime" in fields:
+        albums = albums.with_cached_stats()
+    if "tracks" in fields:
+        albums = albums.prefetch_related(
+            Prefetch("albumtracklistitem_set",
+                     queryset=_tracklist_queryset(), to_attr="tracklist"))
+    return albums
+
+# Helper: absolute URL prefixes, resolved once per request instead of per row
+
+
+def _url_prefixes(request):
+    return {
+        "album": request.build_absolute_uri(reverse("api_albums")),
+        "song": request.build_absolute_uri(reverse("api_songs")),
+    }
 
 
-def _serialize_album(album, request):
-    tracks = (AlbumTracklistItem.objects
-              .filter(album=album)
-              .select_related("song")
-              .order_by("position", "id"))
+def _cover_srcset(variants, request):
     return {
-        "id": album.id,
-        "total_playtime": sum(t.song.length for t in tracks),
-        "description_short": _short(album.description, 100),
-        "release_year": album.release_date.year if album.release_date else None,
-        "tracks": [{
-            "id": t.song.id,
-            "url": request.build_absolute_uri(
-                reverse("api_song_detail", args=[t.song.id])
-            ),
-            "title": t.song.title,
-            "length": t.song.length
-        } for t in tracks],
-        "url": request.build_absolute_uri(
-            reverse("api_album_detail", args=[album.id])
-        ),
-        "cover_image": (
-            request.build_absolute_uri(album.cover_image.url)
-            if getattr(album, "cover_image", None) else ""
-        ),
-        "title": album.title,
-        "description": album.description,
-        "artist": album.artist,
-        "price": str(album.price),
-        "format": album.format,
-        "release_date": album.release_date.isoformat() if album.release_date else None,
-        "slug": album.slug,
+        ext: ", ".join(f"{request.build_absolute_uri(url)} {w}w"
+                       for w, url in urls)
+        for ext, urls in variant_urls(variants or {}).items()
+        if urls
     }
 
+# Helper: serialize album to match API samples
+# (album must come from _album_queryset(fields))
+
+
+def _album_tracks(album, request, prefixes):
+    song_prefix = prefixes["song"]
+    return [{
+        "id": t.song.id,
+        "url": f"{song_prefix}{t.song.id}/",
+        "title": t.song.title,
+        "length": t.song.length
+    } for t in album.tracklist]
+
+
+def _album_cover(album, request, prefixes):
+    return (request.build_absolute_uri(album.cover_image.url)
+            if getattr(album, "cover_image", None) else "")
+
+
+_ALBUM_VALUES = {
+    "id": lambda a, req, p: a.id,
+    "total_playtime": lambda a, req, p: a.total_playtime,
+    "description_short": lambda a, req, p: _short(a.description, 100),
+    "release_year":
+        lambda a, req, p: a.release_date.year if a.release_date else None,
+    "tracks": _album_tracks,
+    "url": lambda a, req, p: f"{p['album']}{a.id}/",
+    "cover_image": _album_cover,
+    "cover_srcset": lambda a, req, p: _cover_srcset(a.cover_variants, req),
+    "title": lambda a, req, p: a.title,
+    "description": lambda a, req, p: a.description,
+    "artist": lambda a, req, p: a.artist,
+    "price": lambda a, req, p: str(a.price),
+    "format": lambda a, req, p: a.format,
+    "release_date":
+        lambda a, req, p: a.release_date.isoformat() if a.release_date else None,
+    "slug": lambda a, req, p: a.slug,
+}
+
+
+def _serialize_album(album, request, prefixes=None, fields=ALBUM_FIELDS):
+    if prefixes is None:
+        prefixes = _url_prefixes(request)
+    return {name: _ALBUM_VALUES[name](album, request, prefixes)
+            for name in fields}
+
+
+def _serialize_albums(albums, request, fields=ALBUM_FIELDS):
+    prefixes = _url_prefixes(request)
+    return [_serialize_album(a, request, prefixes, fields) for a in albums]
+
+# Helper: lean rows for the song and tracklist lists. values_list(named=True)
+# rows carry the attributes the serializers, pagination and streaming read
+# (id, title, song_id, ...), so no model instance is built per row, and the
+# unpaginated lists go from the rows straight to JSON bytes. The _encode_*
+# functions write the same bytes as dumps() of the matching _serialize_*.
+
+SONG_ROW_FIELDS = ("id", "title", "length")
+TRACKLIST_ROW_FIELDS = ("id", "position", "song_id", "album_id")
+
+
+def _song_rows():
+    return Song.objects.values_list(*SONG_ROW_FIELDS, named=True)
+
+
+def _tracklist_rows():
+    return (AlbumTracklistItem.objects.order_by("id")
+            .values_list(*TRACKLIST_ROW_FIELDS, named=True))
+
+
+def _int(value):
+    return b"null" if value is None else b"%d" % value
+
+
+def _song_template(prefixes):
+    return encoding.object_template(
+        ("id", b"%d"),
+        ("url", b'"' + encoding.fragment(prefixes["song"]) + b'%d/"'),
+        "title", "length")
+
+
+def _encode_song_rows(rows, request):
+    string = encoding.string_encoder()
+    template = _song_template(_url_prefixes(request))
+    return b"[" + encoding.separators()[0].join(
+        template % (pk, pk, string(title), _int(length))
+        for pk, title, length in rows) + b"]"
+
+
+def _encode_tracklist_rows(rows, request):
+    template = encoding.object_template(
+        ("id", b"%d"), "position", ("song", b"%d"), ("album", b"%d"))
+    return b"[" + encoding.separators()[0].join(
+        template % (pk, _int(position), song_id, album_id)
+        for pk, position, song_id, album_id in rows) + b"]"
+
+# Helper: the whole album collection straight from values_list() rows to
+# JSON bytes, for the unpaginated list. Writes the same bytes as
+# dumps(_serialize_albums(...)) without building model instances or dicts;
+# keep _AlbumRowEncoder in step with _ALBUM_VALUES.
+
+TRACK_ROW_FIELDS = ("album_id", "song_id", "song__title", "song__length")
+
+
+def _album_row_querysets(albums, fields=ALBUM_FIELDS):
+    """(album rows, track rows) for a queryset from _album_queryset(fields)."""
+    albums = albums.prefetch_related(None)
+    columns = album_columns(fields)
+    if "total_playtime" in fields:
+        columns.append("total_playtime")
+    if "tracks" in fields:
+        tracks = (AlbumTracklistItem.objects
+                  .filter(album__in=albums.values("id"))
+                  .order_by("album_id", "position", "id")
+                  .values_list(*TRACK_ROW_FIELDS))
+    else:
+        tracks = AlbumTracklistItem.objects.none()
+    return albums.values_list(*columns, named=True), tracks
+
+
+class _AlbumRowEncoder:
+    """One method per album field, each writing that field's JSON bytes."""
+
+    def __init__(self, request, fields, track_rows):
+        prefixes = _url_prefixes(request)
+        self.request = request
+        self.string = string = encoding.string_encoder()
+        self.template = encoding.object_template(*fields)
+        self.sep = encoding.separators()[0]
+        self.encoders = [getattr(self, name) for name in fields]
+        self.album_url = b'"' + encoding.fragment(prefixes["album"]) + b'%d/"'
+        self.cover_url = Album._meta.get_field("cover_image").storage.url
+        self.covers = {}  # most albums share the default cover
+
+        track_template = _song_template(prefixes)
+        self.tracklists = {}
+        for album_id, song_id, title, length in track_rows:
+            self.tracklists.setdefault(album_id, []).append(
+                track_template % (song_id, song_id, string(title), _int(length)))
+
+    def encode(self, rows):
+        template, encoders = self.template, self.encoders
+        return b"[" + self.sep.join(
+            template % tuple([encode(row) for encode in encoders])
+            for row in rows) + b"]"
+
+    def id(self, row):
+        return b"%d" % row.id
+
+    def total_playtime(self, row):
+        return b"%d" % row.total_playtime
+
+    def description_short(self, row):
+        return self.string(_short(row.description, 100))
+
+    def release_year(self, row):
+        return _int(row.release_date.year) if row.release_date else b"null"
+
+    def tracks(self, row):
+        return b"[" + self.sep.join(self.tracklists.get(row.id, ())) + b"]"
+
+    def url(self, row):
+        return self.album_url % row.id
+
+    def cover_image(self, row):
+        cover = row.cover_image
+        encoded = self.covers.get(cover)
+        if encoded is None:
+            encoded = self.covers[cover] = self.string(
+                self.request.build_absolute_uri(self.cover_url(cover))
+                if cover else "")
+        return encoded
+
+    def cover_srcset(self, row):
+        if not row.cover_variants:
+            return b"{}"
+        return encoding.dumps(_cover_srcset(row.cover_variants, self.request))
+
+    def title(self, row):
+        return self.string(row.title)
+
+    def description(self, row):
+        return self.string(row.description)
+
+    def artist(self, row):
+        return self.string(row.artist)
+
+    def price(self, row):
+        return self.string(str(row.price))
+
+    def format(self, row):
+        return self.string(row.format)
+
+    def release_date(self, row):
+        return (self.string(row.release_date.isoformat())
+                if row.release_date else b"null")
+
+    def slug(self, row):
+        return self.string(row.slug)
+
+
+def _encode_album_rows(album_rows, track_rows, request, fields=ALBUM_FIELDS):
+    return _AlbumRowEncoder(request, fields, track_rows).encode(album_rows)
+
+
+def _serialize_songs(songs, request):
+    song_prefix = _url_prefixes(request)["song"]
+    return [{
+        "id": s.id,
+        "url": f"{song_prefix}{s.id}/",
+        "title": s.title,
+        "length": s.length
+    } for s in songs]
+
+
+def _serialize_tracklist_items(items, request):
+    return [{
+        "id": t.id,
+        "position": t.position,
+        "song": t.song_id,
+        "album": t.album_id,
+    } for t in items]
+
+# Helper: list response, cursor-paginated when the client asks for it
+# (?limit=&cursor=), streamed for exports (?stream=1 or NDJSON Accept),
+# otherwise the whole collection as a bare array (written by ``encode`` when
+# the list has a row encoder)
+
+
+def _list_response(request, queryset, serialize, encode=None):
+    try:
+        page = keyset_paginate(request, queryset)
+    except PaginationError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if page is None:
+        if wants_stream(request):
+            return stream_response(request, queryset, serialize)
+        with metrics.serialization():
+            if encode is not None:
+                return HttpResponse(encode(queryset, request),
+                                    content_type=CONTENT_TYPE)
+            return JsonResponse(serialize(queryset, request), safe=False)
+    with metrics.serialization():
+        return JsonResponse({
+            "results": serialize(page.rows, request),
+            "next": page.next,
+            "prev": page.prev,
+        })
+
 # Root API
 
 
@@ -58,21 +324,18 @@ def api_home(request):
         "albums": request.build_absolute_uri(reverse("api_albums")),
         "songs": request.build_absolute_uri(reverse("api_songs")),
         "tracklist": request.build_absolute_uri(reverse("api_tracklists")),
+        "search": request.build_absolute_uri(reverse("api_search")),
     })
 
 # SONGS
 
 
 @csrf_exempt
+@conditional(songs_version)
 def api_songs(request):
     if request.method == "GET":
-        data = [{
-            "id": s.id,
-            "url": request.build_absolute_uri(reverse("api_song_detail", args=[s.id])),
-            "title": s.title,
-            "length": s.length
-        } for s in Song.objects.all()]
-        return JsonResponse(data, safe=False)
+        return _list_response(request, _song_rows(), _serialize_songs,
+                              _encode_song_rows)
 
     if request.method == "POST":
         data = json.loads(request.body or "{}")
@@ -87,6 +350,18 @@ def api_songs(request):
 
 
 @csrf_exempt
+def api_songs_bulk(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        results = bulk.bulk_upsert_songs(json.loads(request.body or "[]"))
+    except ValueError as e:  # bad JSON or bulk.BulkError
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(bulk.summarize(results))
+
+
+@csrf_exempt
+@conditional(song_version)
 def api_song_detail(request, id):
     song = get_object_or_404(Song, id=id)
 
@@ -120,11 +395,50 @@ def api_song_detail(request, id):
 
 
 # ALBUMS
+def _wants_collection(request):
+    return not is_paginated(request) and not wants_stream(request)
+
+
+def _album_list_queryset(params):
+    """(albums, fields) for the album list. Raises ValueError."""
+    fields = album_fields(params)
+    albums = _album_queryset(fields, stats=uses_album_stats(params))
+    return filter_albums_by_stats(albums, params), fields
+
+
+def _album_list_response(request):
+    try:
+        albums, fields = _album_list_queryset(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if _wants_collection(request):
+        album_rows, track_rows = _album_row_querysets(albums, fields)
+        with metrics.serialization():
+            body = _encode_album_rows(album_rows, track_rows, request, fields)
+        return HttpResponse(body, content_type=CONTENT_TYPE)
+    return _list_response(request, albums,
+                          partial(_serialize_albums, fields=fields))
+
+
 @csrf_exempt
+@conditional(albums_version)
 def api_albums(request):
     if request.method == "GET":
-        data = [_serialize_album(a, request) for a in Album.objects.all()]
-        return JsonResponse(data, safe=False)
+        if "ordering" in request.GET and is_paginated(request):
+            return JsonResponse(
+                {"error": "ordering cannot be combined with cursor pagination."},
+                status=400
+            )
+        if wants_stream(request):
+            return _album_list_response(request)
+        key = cache.albums_key(request)
+        body = cache.lookup(key)
+        if body is not None:
+            return HttpResponse(body, content_type=CONTENT_TYPE)
+        response = _album_list_response(request)
+        if response.status_code == 200:
+            cache.store(key, response.content)
+        return response
 
     if request.method == "POST":
         data = json.loads(request.body or "{}")
@@ -141,25 +455,32 @@ def api_albums(request):
     return HttpResponseNotAllowed(["GET", "POST"])
 
 
+@conditional(album_version)
 def api_album_detail(request, id):
     if request.method != "GET":
         return HttpResponseNotAllowed(["GET"])
-    album = get_object_or_404(Album, id=id)
-    return JsonResponse(_serialize_album(album, request))
+    try:
+        fields = album_fields(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    album = get_object_or_404(_album_queryset(fields), id=id)
+    with metrics.serialization():
+        return JsonResponse(_serialize_album(album, request, fields=fields))
+
+
+def api_albums_cache(request):
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    return JsonResponse(cache.snapshot())
 
 
 # TRACKLISTS
 @csrf_exempt
+@conditional(tracklists_version)
 def api_tracklists(request):
     if request.method == "GET":
-        items = AlbumTracklistItem.objects.all().order_by("id")
-        data = [{
-            "id": t.id,
-            "position": t.position,
-            "song": t.song_id,
-            "album": t.album_id,
-        } for t in items]
-        return JsonResponse(data, safe=False)
+        return _list_response(request, _tracklist_rows(),
+                              _serialize_tracklist_items, _encode_tracklist_rows)
 
     if request.method == "POST":
         data = json.loads(request.body or "{}")
@@ -181,6 +502,20 @@ def api_tracklists(request):
     return HttpResponseNotAllowed(["GET", "POST"])
 
 
+@csrf_exempt
+def api_tracklists_bulk(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        results = bulk.bulk_upsert_tracklist(
+            json.loads(request.body or "[]"),
+            on_conflict=request.GET.get("on_conflict", "ignore"),
+        )
+    except ValueError as e:  # bad JSON or bulk.BulkError
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(bulk.summarize(results))
+
+
 def api_tracklist_detail(request, id):
     if request.method != "GET":
         return HttpResponseNotAllowed(["GET"])
@@ -191,3 +526,45 @@ def api_tracklist_detail(request, id):
         "song": t.song_id,
         "album": t.album_id,
     })
+
+
+# SEARCH
+def api_search(request):
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    fmt = request.GET.get("format") or None
+    kinds = request.GET.get("type") or "album,song"
+    try:
+        year = int(request.GET["year"]) if request.GET.get("year") else None
+        limit = min(int(request.GET.get("limit", search.DEFAULT_LIMIT)),
+                    search.MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({"error": "year and limit must be integers."},
+                            status=400)
+    if fmt and fmt not in dict(Album.FORMAT_CHOICES):
+        return JsonResponse({"error": f"Unknown format {fmt!r}."}, status=400)
+
+    albums, songs = search.search(
+        request.GET.get("q", ""), fmt=fmt, year=year, limit=max(limit, 1),
+        kinds=kinds.split(","))
+    prefixes = _url_prefixes(request)
+    return JsonResponse({
+        "query": request.GET.get("q", ""),
+        "albums": [{
+            "id": pk,
+            "url": f"{prefixes['album']}{pk}/",
+            "title": title,
+            "artist": artist,
+            "format": fmt_,
+            "release_year": release_date.year if release_date else None,
+            "score": score,
+        } for pk, title, artist, fmt_, release_date, score in albums],
+        "songs": [{
+            "id": pk,
+            "url": f"{prefixes['song']}{pk}/",
+            "title": title,
+            "artist": artist,
+            "length": length,
+            "score": score,
+        } for pk, title, artist, length, score in songs],
+    })
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CatalogueConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalogue'
+
+    def ready(self):
+        from . import signals  # noqa: F401
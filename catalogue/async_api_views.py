@@ -0,0 +1,134 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from . import api_views, cache, metrics
+from .api_views import (_album_list_queryset, _album_queryset,
+                        _album_row_querysets, _encode_album_rows,
+                        _encode_song_rows, _serialize_album, _serialize_albums,
+                        _serialize_songs, _song_rows, _wants_collection)
+from .encoding import CONTENT_TYPE, JsonResponse
+from .fieldsets import album_fields
+from .conditional import (aalbum_version, aalbums_version, aconditional,
+                          asong_version, asongs_version)
+from .models import Song
+from .pagination import PaginationError, akeyset_paginate, is_paginated
+from .streaming import astream_response, wants_stream
+
+# ASGI-native versions of the read endpoints.
+#
+# Under ASGI a sync view is run in a worker thread (sync_to_async), so the
+# thread pool caps how many requests are in flight. These views read through
+# the async ORM (aget/afirst/aiterator/async for) and return the same payloads
+# as api_views; writes are handed to the sync views. catalogue/urls.py routes
+# api_albums, api_album_detail, api_songs and api_song_detail here when
+# CATALOGUE_ASYNC_API is on, which musicdb_project/asgi.py enables.
+
+
+def _reads(request):
+    return request.method in ("GET", "HEAD")
+
+# Helper: async twin of api_views._list_response
+
+
+async def _list_response(request, queryset, serialize, encode=None):
+    try:
+        page = await akeyset_paginate(request, queryset)
+    except PaginationError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if page is None:
+        if wants_stream(request):
+            return astream_response(request, queryset, serialize)
+        rows = [row async for row in queryset]
+        with metrics.serialization():
+            if encode is not None:
+                return HttpResponse(encode(rows, request),
+                                    content_type=CONTENT_TYPE)
+            return JsonResponse(serialize(rows, request), safe=False)
+    with metrics.serialization():
+        return JsonResponse({
+            "results": serialize(page.rows, request),
+            "next": page.next,
+            "prev": page.prev,
+        })
+
+# SONGS
+
+
+@csrf_exempt
+@aconditional(asongs_version)
+async def api_songs(request):
+    if not _reads(request):
+        return await sync_to_async(api_views.api_songs)(request)
+    return await _list_response(request, _song_rows(), _serialize_songs,
+                                _encode_song_rows)
+
+
+@csrf_exempt
+@aconditional(asong_version)
+async def api_song_detail(request, id):
+    if not _reads(request):
+        return await sync_to_async(api_views.api_song_detail)(request, id)
+    song = await aget_object_or_404(Song, id=id)
+    return JsonResponse({
+        "id": song.id,
+        "url": request.build_absolute_uri(reverse("api_song_detail", args=[song.id])),
+        "title": song.title,
+        "length": song.length
+    })
+
+# ALBUMS
+
+
+async def _album_list_response(request):
+    try:
+        albums, fields = _album_list_queryset(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if _wants_collection(request):
+        album_rows, track_rows = _album_row_querysets(albums, fields)
+        track_rows = [row async for row in track_rows]
+        album_rows = [row async for row in album_rows]
+        with metrics.serialization():
+            body = _encode_album_rows(album_rows, track_rows, request, fields)
+        return HttpResponse(body, content_type=CONTENT_TYPE)
+    return await _list_response(request, albums,
+                                partial(_serialize_albums, fields=fields))
+
+
+@csrf_exempt
+@aconditional(aalbums_version)
+async def api_albums(request):
+    if not _reads(request):
+        return await sync_to_async(api_views.api_albums)(request)
+    if "ordering" in request.GET and is_paginated(request):
+        return JsonResponse(
+            {"error": "ordering cannot be combined with cursor pagination."},
+            status=400
+        )
+    if wants_stream(request):
+        return await _album_list_response(request)
+    key = await cache.aalbums_key(request)
+    body = await cache.alookup(key)
+    if body is not None:
+        return HttpResponse(body, content_type=CONTENT_TYPE)
+    response = await _album_list_response(request)
+    if response.status_code == 200:
+        await cache.astore(key, response.content)
+    return response
+
+
+@aconditional(aalbum_version)
+async def api_album_detail(request, id):
+    if not _reads(request):
+        return await sync_to_async(api_views.api_album_detail)(request, id)
+    try:
+        fields = album_fields(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    album = await aget_object_or_404(_album_queryset(fields), id=id)
+    with metrics.serialization():
+        return JsonResponse(_serialize_album(album, request, fields=fields))
@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class RoleModelBackend(ModelBackend):
+    """ModelBackend that loads the MusicManagerUser with the user (one join
+    instead of a second query the first time the role is needed)."""
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = (UserModel._default_manager
+                    .select_related("musicmanageruser").get(pk=user_id))
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,199 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache
+from .models import Album, AlbumStats, AlbumTracklistItem, Song
+
+# Bulk writes for the API (and importers).
+#
+# Each call validates the whole batch up front with a constant number of
+# queries, writes the valid rows with bulk_create / bulk_update inside one
+# transaction and returns one result dict per input item, in input order:
+#     {"index": i, "status": "created" | "updated" | "skipped" | "error",
+#      "id": <pk or None>, "error": <message, only for errors>}
+# bulk_create bypasses model signals, so the AlbumStats rows of touched
+# albums are rebuilt and the album response cache is invalidated here.
+
+BATCH_SIZE = 500
+
+
+class BulkError(ValueError):
+    pass
+
+
+def _error(index, message):
+    return {"index": index, "status": "error", "id": None, "error": message}
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BulkError(f"{name} must be an integer.")
+
+
+def _after_write(album_ids):
+    if album_ids:
+        AlbumStats.rebuild(album_ids=album_ids)
+    cache.bump_version()
+    transaction.on_commit(cache.bump_version)
+
+
+def _clean_song(item):
+    if not isinstance(item, dict):
+        raise BulkError("Each item must be an object.")
+    fields = {}
+    if "title" in item:
+        fields["title"] = str(item["title"])
+    if "artist" in item:
+        fields["artist"] = str(item["artist"])
+    if "length" in item:
+        fields["length"] = _int(item["length"], "length")
+        if fields["length"] < 10:
+            raise BulkError("Song must be at least 10 seconds long.")
+    return fields
+
+
+def bulk_upsert_songs(items):
+    """Create songs without an "id"; update title/length/artist of those with one."""
+    if not isinstance(items, list):
+        raise BulkError("Expected a JSON array.")
+
+    results = [None] * len(items)
+    to_create, to_update = [], []
+    for index, item in enumerate(items):
+        try:
+            fields = _clean_song(item)
+            pk = _int(item["id"], "id") if item.get("id") is not None else None
+        except BulkError as e:
+            results[index] = _error(index, str(e))
+            continue
+        if pk is None:
+            fields.setdefault("title", "")
+            to_create.append((index, Song(**fields)))
+        else:
+            to_update.append((index, pk, fields))
+
+    existing = Song.objects.in_bulk([pk for _, pk, _ in to_update])
+    now = timezone.now()
+    changed, update_fields = [], {"updated_at"}
+    for index, pk, fields in to_update:
+        song = existing.get(pk)
+        if song is None:
+            results[index] = _error(index, f"Song {pk} does not exist.")
+            continue
+        for name, value in fields.items():
+            setattr(song, name, value)
+        song.updated_at = now
+        update_fields.update(fields)
+        changed.append(song)
+        results[index] = {"index": index, "status": "updated", "id": pk}
+
+    with transaction.atomic():
+        created = Song.objects.bulk_create(
+            [song for _, song in to_create], batch_size=BATCH_SIZE)
+        if changed:
+            Song.objects.bulk_update(
+                changed, sorted(update_fields), batch_size=BATCH_SIZE)
+        album_ids = []
+        if changed and "length" in update_fields:
+            album_ids = list(AlbumTracklistItem.objects
+                             .filter(song__in=changed)
+                             .values_list("album_id", flat=True)
+                             .distinct())
+        _after_write(album_ids)
+
+    for (index, _), song in zip(to_create, created):
+        results[index] = {"index": index, "status": "created", "id": song.id}
+    return results
+
+
+def bulk_upsert_tracklist(items, on_conflict="ignore"):
+    """
+    Add (album, song, position) items. An existing (album, song) pair is
+    left alone with on_conflict="ignore" or gets its position updated with
+    on_conflict="update".
+    """
+    if on_conflict not in ("ignore", "update"):
+        raise BulkError("on_conflict must be 'ignore' or 'update'.")
+    if not isinstance(items, list):
+        raise BulkError("Expected a JSON array.")
+
+    results = [None] * len(items)
+    cleaned = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise BulkError("Each item must be an object.")
+            album_id = _int(item.get("album"), "album")
+            song_id = _int(item.get("song"), "song")
+            position = item.get("position")
+            if position is not None:
+                position = _int(position, "position")
+        except BulkError as e:
+            results[index] = _error(index, str(e))
+            continue
+        cleaned.append((index, album_id, song_id, position))
+
+    album_ids = {c[1] for c in cleaned}
+    song_ids = {c[2] for c in cleaned}
+    known_albums = set(Album.objects.filter(id__in=album_ids)
+                       .values_list("id", flat=True))
+    known_songs = set(Song.objects.filter(id__in=song_ids)
+                      .values_list("id", flat=True))
+    existing = set(AlbumTracklistItem.objects
+                   .filter(album_id__in=album_ids, song_id__in=song_ids)
+                   .values_list("album_id", "song_id"))
+
+    rows, seen = [], set()
+    for index, album_id, song_id, position in cleaned:
+        pair = (album_id, song_id)
+        if album_id not in known_albums:
+            results[index] = _error(index, f"Album {album_id} does not exist.")
+        elif song_id not in known_songs:
+            results[index] = _error(index, f"Song {song_id} does not exist.")
+        elif pair in seen:
+            results[index] = _error(index, "Duplicate album/song pair in batch.")
+        else:
+            seen.add(pair)
+            if pair not in existing:
+                status = "created"
+            else:
+                status = "updated" if on_conflict == "update" else "skipped"
+            results[index] = {"index": index, "status": status, "id": pair}
+            rows.append(AlbumTracklistItem(
+                album_id=album_id, song_id=song_id, position=position))
+
+    with transaction.atomic():
+        if on_conflict == "update":
+            AlbumTracklistItem.objects.bulk_create(
+                rows, batch_size=BATCH_SIZE, update_conflicts=True,
+                unique_fields=["album", "song"],
+                update_fields=["position", "updated_at"])
+        else:
+            AlbumTracklistItem.objects.bulk_create(
+                rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        ids = dict(((a, s), pk) for pk, a, s in AlbumTracklistItem.objects
+                   .filter(album_id__in={a for a, _ in seen},
+                           song_id__in={s for _, s in seen})
+                   .values_list("id", "album_id", "song_id"))
+        _after_write({a for a, _ in seen})
+
+    # results carry the (album, song) pair until the ids are known
+    for result in results:
+        if result["status"] != "error":
+            result["id"] = ids.get(result["id"])
+    return results
+
+
+def summarize(results):
+    counts = {"created": 0, "updated": 0, "skipped": 0, "error": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "skipped": counts["skipped"],
+        "errors": counts["error"],
+        "results": results,
+    }
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import routers
+
+# Versioned response cache for the album collection.
+#
+# Entries are keyed by a version token plus the absolute request URL (the
+# payload embeds absolute URLs and the query string selects filters/pages).
+# Writes to Album, Song or AlbumTracklistItem replace the token (see
+# signals.py; bulk writers bump it themselves), which orphans every old entry at once; the backend's TTL and
+# MAX_ENTRIES culling then reclaim them. The token is random rather than a
+# counter so an evicted version key can never resurrect stale entries.
+#
+# Responses built from a read replica are keyed by that replica: they match
+# its snapshot, not the primary's, and `manage.py sync_replicas` bumps the
+# version once the replicas have caught up.
+#
+# The token is only useful if every process sees the same one: a write in
+# one worker (or in a run_workers job) must invalidate the others' entries.
+# CATALOGUE_API_CACHE therefore has to name a shared backend; check
+# catalogue.W001 warns when it is the per-process local memory cache.
+#
+# Settings: CATALOGUE_API_CACHE (cache alias, default "default") and
+# CATALOGUE_API_CACHE_TTL (seconds, default 300).
+
+_VERSION_KEY = "catalogue:albums:version"
+
+# per-process hit/miss counters, exposed by api_views.api_albums_cache
+stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, "CATALOGUE_API_CACHE", "default")]
+
+
+def _ttl():
+    return getattr(settings, "CATALOGUE_API_CACHE_TTL", 300)
+
+
+def _new_token():
+    return uuid.uuid4().hex
+
+
+def current_version():
+    return _cache().get_or_set(_VERSION_KEY, _new_token, timeout=None)
+
+
+def bump_version():
+    _cache().set(_VERSION_KEY, _new_token(), timeout=None)
+
+
+def _request_part(request):
+    url = request.build_absolute_uri().encode()
+    digest = hashlib.md5(url, usedforsecurity=False).hexdigest()
+    return f"{routers.read_alias() or routers.PRIMARY}:{digest}"
+
+
+def albums_key(request):
+    return f"catalogue:albums:{current_version()}:{_request_part(request)}"
+
+
+def _count(body):
+    with _stats_lock:
+        stats["hits" if body is not None else "misses"] += 1
+    return body
+
+
+def lookup(key):
+    return _count(_cache().get(key))
+
+
+def store(key, body):
+    _cache().set(key, body, timeout=_ttl())
+
+
+# async twins for the ASGI views (catalogue/async_api_views.py)
+
+
+async def acurrent_version():
+    return await _cache().aget_or_set(_VERSION_KEY, _new_token, timeout=None)
+
+
+async def aalbums_key(request):
+    return f"catalogue:albums:{await acurrent_version()}:{_request_part(request)}"
+
+
+async def alookup(key):
+    return _count(await _cache().aget(key))
+
+
+async def astore(key, body):
+    await _cache().aset(key, body, timeout=_ttl())
+
+
+def snapshot():
+    with _stats_lock:
+        hits, misses = stats["hits"], stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+        "version": current_version(),
+    }
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if not isinstance(_cache(), LocMemCache):
+        return []
+    return [checks.Warning(
+        "CATALOGUE_API_CACHE uses the local memory cache, so a write in one "
+        "process doesn't invalidate the album responses cached by the others.",
+        hint="Point CATALOGUE_API_CACHE at a shared cache (file, Redis, "
+             "Memcached) unless the site runs as a single process.",
+        id="catalogue.W001",
+    )]
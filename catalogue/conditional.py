@@ -0,0 +1,193 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from . import cache, routers
+from .fieldsets import album_fields
+from .models import Album, Song
+
+# Version lookups for conditional GETs (ETag / Last-Modified).
+#
+# Detail lookups are one indexed aggregate query and collections reuse the
+# album cache's version token, so neither scans a table. Both run before the
+# view so a matching If-None-Match / If-Modified-Since request can be
+# answered with 304 without serializing anything. They are written as
+# version functions returning (etag, last_modified); conditional() turns one
+# into a django.views.decorators.http.condition decorator, and _memoized makes
+# the etag and last-modified halves share a single lookup per request.
+# The a*_version twins run the same lookups through the async ORM for the
+# ASGI views, which are wrapped with aconditional() instead.
+
+
+def _memoized(lookup):
+    def version(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        memo = request.__dict__.setdefault("_catalogue_versions", {})
+        key = (lookup.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in memo:
+            memo[key] = lookup(request, *args, **kwargs)
+        return memo[key]
+    return version
+
+
+def _amemoized(lookup):
+    async def version(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        memo = request.__dict__.setdefault("_catalogue_versions", {})
+        key = (lookup.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in memo:
+            memo[key] = await lookup(request, *args, **kwargs)
+        return memo[key]
+    return version
+
+
+def _etag(*parts):
+    raw = "|".join(str(p) for p in parts).encode()
+    return hashlib.md5(raw, usedforsecurity=False).hexdigest()
+
+
+def _latest(*stamps):
+    stamps = [s for s in stamps if s is not None]
+    return max(stamps) if stamps else None
+
+
+def _album_aggregates():
+    return {
+        "album": Max("updated_at"),
+        "stats": Max("stats__last_modified"),
+        "items": Max("albumtracklistitem__updated_at"),
+        "songs": Max("albumtracklistitem__song__updated_at"),
+        "rows": Count("albumtracklistitem"),
+    }
+
+
+def _fields_tag(request):
+    # the representation is chosen by ?fields= / ?include=; None if they are
+    # invalid, so the view answers 400 rather than a conditional 304
+    try:
+        return ",".join(album_fields(request.GET))
+    except ValueError:
+        return None
+
+
+def _album_result(id, fields, agg):
+    if agg["album"] is None:
+        return None
+    latest = _latest(agg["album"], agg["stats"], agg["items"], agg["songs"])
+    return _etag("album", id, fields, latest.isoformat(), agg["rows"]), latest
+
+
+def _song_result(id, updated_at):
+    if updated_at is None:
+        return None
+    return _etag("song", id, updated_at.isoformat()), updated_at
+
+
+@_memoized
+def album_version(request, id):
+    fields = _fields_tag(request)
+    if fields is None:
+        return None
+    agg = Album.objects.filter(id=id).aggregate(**_album_aggregates())
+    return _album_result(id, fields, agg)
+
+
+@_amemoized
+async def aalbum_version(request, id):
+    fields = _fields_tag(request)
+    if fields is None:
+        return None
+    agg = await Album.objects.filter(id=id).aaggregate(**_album_aggregates())
+    return _album_result(id, fields, agg)
+
+
+@_memoized
+def song_version(request, id):
+    updated_at = (Song.objects.filter(id=id)
+                  .values_list("updated_at", flat=True).first())
+    return _song_result(id, updated_at)
+
+
+@_amemoized
+async def asong_version(request, id):
+    updated_at = await (Song.objects.filter(id=id)
+                        .values_list("updated_at", flat=True).afirst())
+    return _song_result(id, updated_at)
+
+
+def _collection_result(request, name, token):
+    # the token changes on every catalogue write, deletes included (see
+    # cache.py); the query string selects the representation (filters, page,
+    # stream) and the read alias the snapshot it was built from. There is no
+    # Last-Modified: no timestamp moves when a row is deleted.
+    alias = routers.read_alias() or routers.PRIMARY
+    return _etag(name, token, alias, request.get_full_path()), None
+
+
+@_memoized
+def albums_version(request):
+    return _collection_result(request, "albums", cache.current_version())
+
+
+@_amemoized
+async def aalbums_version(request):
+    return _collection_result(request, "albums",
+                              await cache.acurrent_version())
+
+
+@_memoized
+def songs_version(request):
+    return _collection_result(request, "songs", cache.current_version())
+
+
+@_amemoized
+async def asongs_version(request):
+    return _collection_result(request, "songs",
+                              await cache.acurrent_version())
+
+
+@_memoized
+def tracklists_version(request):
+    return _collection_result(request, "tracklists", cache.current_version())
+
+
+def conditional(version_func):
+    """View decorator: ETag / Last-Modified / 304 handling from version_func."""
+    def etag(request, *args, **kwargs):
+        version = version_func(request, *args, **kwargs)
+        return version[0] if version else None
+
+    def last_modified(request, *args, **kwargs):
+        version = version_func(request, *args, **kwargs)
+        return version[1] if version else None
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def aconditional(version_func):
+    """conditional() for async views, with an async ``version_func``."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            version = await version_func(request, *args, **kwargs)
+            etag, last_modified = version or (None, None)
+            etag = quote_etag(etag) if etag else None
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if timestamp and not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(timestamp)
+                if etag:
+                    response.headers.setdefault("ETag", etag)
+            return response
+        return inner
+    return decorator
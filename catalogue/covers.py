@@ -0,0 +1,132 @@
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import VARIANTS_PREFIX
+
+# Resized cover variants.
+#
+# Each uploaded cover is decoded once and re-encoded at a few fixed widths
+# (never upscaled) as WebP and JPEG. Variants are stored content-addressed:
+#     album_covers/variants/<digest[:2]>/<digest>-<width>.<ext>
+# where digest is the SHA-256 of the source bytes and the encoding settings,
+# so identical covers share files and a URL never changes meaning (safe to
+# cache forever). Album.cover_variants records the source name, digest and
+# widths so read paths build srcset URLs without touching storage.
+# Sources and variants both live in the cover_image field's storage, and
+# `manage.py gc_media` removes variants no album's digest refers to.
+
+WIDTHS = (160, 320, 640)
+FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+           "jpeg": ("JPEG", {"quality": 82, "optimize": True,
+                             "progressive": True})}
+# bump when WIDTHS/FORMATS change so new settings get new file names
+PIPELINE_VERSION = "1"
+
+logger = logging.getLogger(__name__)
+
+
+def variant_name(digest, width, ext):
+    return f"{VARIANTS_PREFIX}{digest[:2]}/{digest}-{width}.{ext}"
+
+
+def variant_digest(name):
+    """The source digest a variant_name() belongs to."""
+    return name.rsplit("/", 1)[-1].split("-", 1)[0]
+
+
+def _storage():
+    from .models import Album
+
+    return Album.cover_image.field.storage
+
+
+def variant_urls(variants):
+    """{ext: [(width, url), ...]} for a cover_variants dict."""
+    digest = variants.get("digest")
+    if not digest:
+        return {}
+    storage = _storage()
+    return {ext: [(w, storage.url(variant_name(digest, w, ext)))
+                  for w in variants.get("widths", [])]
+            for ext in FORMATS}
+
+
+def srcsets(variants):
+    """{ext: "url 160w, url 320w"} for a cover_variants dict."""
+    return {ext: ", ".join(f"{url} {w}w" for w, url in urls)
+            for ext, urls in variant_urls(variants).items() if urls}
+
+
+def _encode(image, fmt, options):
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    buf = BytesIO()
+    image.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def render_variants(data):
+    """Return (digest, {(width, ext): bytes}) for the source image bytes."""
+    digest = hashlib.sha256(PIPELINE_VERSION.encode() + data).hexdigest()
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    out = {}
+    for width in WIDTHS:
+        if width >= image.width:
+            break
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for ext, (fmt, options) in FORMATS.items():
+            out[(width, ext)] = _encode(resized, fmt, options)
+    return digest, out
+
+
+def build_variants(album):
+    """
+    Generate and store the variants of ``album``'s cover and record them on
+    the row. Unreadable or missing covers are recorded with no widths so
+    they are not retried on every save.
+    """
+    from . import cache
+    from .models import Album
+
+    name = album.cover_image.name if album.cover_image else ""
+    variants = {"source": name, "digest": "", "widths": []}
+    storage = _storage()
+    if name:
+        try:
+            with storage.open(name, "rb") as fh:
+                data = fh.read()
+            digest, rendered = render_variants(data)
+        except FileNotFoundError:
+            # e.g. the model's default_cover.jpg was never uploaded
+            logger.debug("Cover %s of album %s not found", name, album.pk)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            logger.warning("Cannot build cover variants for album %s (%s)",
+                           album.pk, name, exc_info=True)
+        else:
+            for (width, ext), content in rendered.items():
+                # an existing variant is kept and touched, so gc_media
+                # cannot collect it before the row below refers to it
+                storage.save(variant_name(digest, width, ext),
+                             ContentFile(content))
+            variants.update(
+                digest=digest, widths=sorted({w for w, _ in rendered}))
+
+    album.cover_variants = variants
+    Album.objects.filter(pk=album.pk).update(
+        cover_variants=variants, updated_at=timezone.now())
+    cache.bump_version()
+    return variants
+
+
+def needs_variants(album):
+    name = album.cover_image.name if album.cover_image else ""
+    return (album.cover_variants or {}).get("source", "") != name
@@ -0,0 +1,142 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+# Pluggable JSON encoding for API responses.
+#
+# By default responses are byte for byte what django.http.JsonResponse
+# writes: ", " and ": " separators and non-ASCII text as \uXXXX escapes.
+# CATALOGUE_JSON_COMPACT = True opts in to "," / ":" and raw UTF-8, which
+# is smaller and is the only format orjson can write. Any JSON parser reads
+# both the same.
+#
+# dumps() encodes with the backend named by CATALOGUE_JSON_BACKEND: "orjson"
+# (an optional dependency, several times faster; compact format only),
+# "stdlib" (json's C encoder) or "auto", the default, which picks orjson
+# when it is installed and the compact format is on. Both backends hand
+# anything that isn't a JSON type to DjangoJSONEncoder.default, so switching
+# backends doesn't change the bytes of a response (floats aside: orjson
+# writes 1e20, json 1e+20). JsonResponse is django.http.JsonResponse built
+# on dumps().
+#
+# The hot list endpoints skip dicts altogether: object_template() compiles
+# one object shape into a bytes %-template, and the per-model serializers
+# in api_views fill it straight from values_list() tuples.
+
+BACKENDS = ("auto", "orjson", "stdlib")
+CONTENT_TYPE = "application/json; charset=utf-8"
+
+_default = DjangoJSONEncoder().default
+# json.dumps(..., cls=DjangoJSONEncoder), as django.http.JsonResponse calls it
+_stdlib = json.JSONEncoder(default=_default)
+_stdlib_compact = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False,
+                                   default=_default)
+_escape_ascii = json.encoder.encode_basestring_ascii
+_escape_utf8 = json.encoder.encode_basestring
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def compact():
+    return getattr(settings, "CATALOGUE_JSON_COMPACT", False)
+
+
+def backend():
+    name = getattr(settings, "CATALOGUE_JSON_BACKEND", "auto")
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(
+            f"CATALOGUE_JSON_BACKEND must be one of {', '.join(BACKENDS)}.")
+    if name == "orjson" and orjson is None:
+        raise ImproperlyConfigured(
+            "CATALOGUE_JSON_BACKEND is 'orjson' but orjson is not installed.")
+    if name == "orjson" and not compact():
+        raise ImproperlyConfigured(
+            "CATALOGUE_JSON_BACKEND is 'orjson', which only writes the "
+            "compact format: set CATALOGUE_JSON_COMPACT = True.")
+    if name == "auto":
+        return "orjson" if orjson is not None and compact() else "stdlib"
+    return name
+
+
+def separators():
+    """The (item, key) separators of the configured format, as bytes."""
+    return (b",", b":") if compact() else (b", ", b": ")
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+
+def _stdlib_dumps(obj):
+    return (_stdlib_compact if compact() else _stdlib).encode(obj).encode()
+
+
+def _escaper():
+    return _escape_utf8 if compact() else _escape_ascii
+
+
+def _stdlib_str(value):
+    return b"null" if value is None else _escape_ascii(value).encode()
+
+
+def _stdlib_utf8_str(value):
+    return b"null" if value is None else _escape_utf8(value).encode()
+
+
+def _orjson_str(value):
+    return orjson.dumps(value)  # None -> b"null"
+
+
+def dumps(obj):
+    """Encode ``obj`` as JSON bytes with the configured backend."""
+    return (_orjson_dumps if backend() == "orjson" else _stdlib_dumps)(obj)
+
+
+def string_encoder():
+    """The backend's str -> JSON bytes function (None encodes as null)."""
+    if backend() == "orjson":
+        return _orjson_str
+    return _stdlib_utf8_str if compact() else _stdlib_str
+
+
+def fragment(text):
+    """``text`` escaped for use inside a string literal of a template."""
+    return _escaper()(text)[1:-1].encode().replace(b"%", b"%%")
+
+
+def object_template(*fields):
+    """
+    Compile one JSON object shape into a bytes %-template.
+
+    Each field is a key, filled with already-encoded JSON (%b), or a
+    (key, format) pair whose format is spliced in as is, e.g.
+    ("id", b"%d") or ("url", b'"' + fragment(prefix) + b'%d/"').
+    """
+    item_sep, key_sep = separators()
+    escape = _escaper()
+    parts = []
+    for field in fields:
+        key, fmt = (field, b"%b") if isinstance(field, str) else field
+        parts.append(escape(key).encode() + key_sep + fmt)
+    return b"{" + item_sep.join(parts) + b"}"
+
+
+class JsonResponse(HttpResponse):
+    """django.http.JsonResponse, encoded with dumps()."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False.")
+        kwargs.setdefault("content_type", CONTENT_TYPE)
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,52 @@
+# Sparse fieldsets for the album API.
+#
+# Album fields, in response order. ?fields= picks a comma-separated subset
+# and ?include=tracks adds the nested tracks to it. ALBUM_COLUMNS maps each
+# field to the Album columns it reads; the api_views querysets select only
+# those, so unrequested fields cost no SQL (no tracklist query without
+# tracks, no stats join without total_playtime).
+
+ALBUM_FIELDS = ("id", "total_playtime", "description_short", "release_year",
+                "tracks", "url", "cover_image", "cover_srcset", "title",
+                "description", "artist", "price", "format", "release_date",
+                "slug")
+ALBUM_INCLUDES = ("tracks",)
+ALBUM_COLUMNS = {
+    "description_short": ("description",),
+    "release_year": ("release_date",),
+    "cover_image": ("cover_image",),
+    "cover_srcset": ("cover_variants",),
+    "title": ("title",),
+    "description": ("description",),
+    "artist": ("artist",),
+    "price": ("price",),
+    "format": ("format",),
+    "release_date": ("release_date",),
+    "slug": ("slug",),
+}
+
+
+def album_fields(params):
+    """
+    The fields asked for with ?fields= and ?include=, in ALBUM_FIELDS order
+    (all of them without ?fields=). Raises ValueError on an unknown name.
+    """
+    include = [name for name in params.get("include", "").split(",") if name]
+    for name in include:
+        if name not in ALBUM_INCLUDES:
+            raise ValueError(f"Cannot include {name!r}.")
+    wanted = {name for name in params.get("fields", "").split(",") if name}
+    if not wanted:
+        return ALBUM_FIELDS
+    unknown = sorted(wanted.difference(ALBUM_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown field {unknown[0]!r}.")
+    wanted.update(include)
+    return tuple(name for name in ALBUM_FIELDS if name in wanted)
+
+
+def album_columns(fields):
+    columns = {"id"}
+    for name in fields:
+        columns.update(ALBUM_COLUMNS.get(name, ()))
+    return sorted(columns)
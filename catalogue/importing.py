@@ -0,0 +1,403 @@
+import csv
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import cache
+from .models import Album, AlbumStats, AlbumTracklistItem, MusicManagerUser, Song
+
+# Streaming catalogue import.
+#
+# Input is read record by record (never loaded whole) from one of:
+#   json    the sample_data.json shape: {"users": [...], "albums": [...],
+#           "songs": [...]}; each array is streamed element by element
+#   ndjson  one object per line with a "type" of "user", "album" or "song"
+#   csv     one kind of record per file (--kind), a header row naming the
+#           same fields; a song's "albums" column is "|"-separated
+#
+# Songs carry the tracklist: {"title", "runtime" (or "length"), "artist",
+# "albums": [album references]}. New tracks are appended to their album's
+# tracklist in the order songs appear; tracks already on it keep their
+# position. Albums are upserted on (title, artist, format). A reference is
+# an album title, or a {"title", "artist", "format"} object when titles
+# clash; a bare title shared by several albums resolves to the one by the
+# song's artist, and is an error if that is still ambiguous. Songs are keyed
+# on (title, artist). The key maps (and each album's last position) are
+# preloaded so every lookup is in memory, and each batch is written with
+# upserting bulk_create calls in its own transaction, so re-running an
+# import updates rows instead of duplicating them. The same transaction
+# rebuilds the touched albums' AlbumStats and bumps the cache version, so
+# a bad record part-way through leaves the batches before it consistent.
+
+BATCH_SIZE = 2000
+READ_SIZE = 1 << 16
+
+FORMATS = {}
+for code, label in Album.FORMAT_CHOICES:
+    FORMATS[code.lower()] = code
+    FORMATS[label.lower()] = code
+
+
+class CatalogueImportError(ValueError):
+    pass
+
+
+# ---- readers --------------------------------------------------------------
+
+
+class _JsonSectionStream:
+    """
+    Yield (section, item) pairs from {"section": [item, ...], ...} while
+    holding at most one item (plus a read chunk) in memory.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.fh.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise CatalogueImportError("Unexpected end of JSON input.")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise CatalogueImportError(
+                f"Expected {char!r} in JSON input, got {self.buf[self.pos]!r}.")
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self._fill():
+                    raise CatalogueImportError("Malformed JSON input.")
+                continue
+            # a number at the end of the buffer may continue in the next read
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            section = self._value()
+            self._expect(":")
+            if self._peek() == "[":
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield section, self._value()
+                        if self._peek() == "]":
+                            self.pos += 1
+                            break
+                        self._expect(",")
+            else:
+                self._value()
+            if self._peek() == "}":
+                return
+            self._expect(",")
+
+
+_JSON_SECTIONS = {"users": "user", "albums": "album", "songs": "song"}
+
+
+def read_json(fh):
+    for section, item in _JsonSectionStream(fh):
+        if section in _JSON_SECTIONS:
+            yield _JSON_SECTIONS[section], item
+
+
+def read_ndjson(fh):
+    for lineno, line in enumerate(fh, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise CatalogueImportError(f"Line {lineno}: {e}")
+        kind = item.pop("type", None)
+        if kind not in ("user", "album", "song"):
+            raise CatalogueImportError(
+                f"Line {lineno}: unknown record type {kind!r}.")
+        yield kind, item
+
+
+def read_csv(fh, kind):
+    for row in csv.DictReader(fh):
+        if kind == "song" and "albums" in row:
+            row["albums"] = [a for a in row["albums"].split("|") if a]
+        yield kind, row
+
+
+def open_records(path, fmt=None, kind=None):
+    """Return (file handle, record iterator) for ``path``."""
+    fmt = fmt or path.rsplit(".", 1)[-1].lower()
+    fh = io.open(path, encoding="utf-8", newline="" if fmt == "csv" else None)
+    if fmt == "json":
+        return fh, read_json(fh)
+    if fmt in ("ndjson", "jsonl"):
+        return fh, read_ndjson(fh)
+    if fmt == "csv":
+        if kind not in ("user", "album", "song"):
+            fh.close()
+            raise CatalogueImportError(
+                "CSV input needs --kind user, album or song.")
+        return fh, read_csv(fh, kind)
+    fh.close()
+    raise CatalogueImportError(f"Unknown input format {fmt!r}.")
+
+
+# ---- importer -------------------------------------------------------------
+
+
+def _truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+class CatalogueImporter:
+    def __init__(self, batch_size=BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.counts = {"user": 0, "album": 0, "song": 0, "track": 0}
+        self.albums = {}         # title -> {(artist, format): id}
+        self.songs = {}          # (title, artist) -> (id, length)
+        self.tracks = set()      # (album id, song id) already on a tracklist
+        self.positions = {}      # album id -> last position used
+        self.pending = {"album": [], "song": []}
+        self.started = None
+
+    def _load_keys(self):
+        for pk, title, artist, fmt in Album.objects.values_list(
+                "id", "title", "artist", "format").iterator():
+            self.albums.setdefault(title, {})[(artist, fmt)] = pk
+        for pk, title, artist, length in Song.objects.values_list(
+                "id", "title", "artist", "length").iterator():
+            self.songs[(title, artist)] = (pk, length)
+        self.tracks.update(AlbumTracklistItem.objects.values_list(
+            "album_id", "song_id").iterator())
+        self.positions.update(AlbumTracklistItem.objects.values("album_id")
+                              .annotate(last=Max("position"))
+                              .values_list("album_id", "last"))
+
+    def run(self, records):
+        self.started = time.monotonic()
+        self._load_keys()
+        for kind, item in records:
+            if kind == "user":
+                self._import_user(item)
+            elif kind == "album":
+                self._queue("album", item)
+            else:
+                # songs reference albums: make sure queued albums exist first
+                if self.pending["album"]:
+                    self._flush_albums()
+                self._queue("song", item)
+        self._flush_albums()
+        self._flush_songs()
+        return self.counts
+
+    def rate(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return sum(self.counts.values()) / elapsed, elapsed
+
+    def _queue(self, kind, item):
+        self.pending[kind].append(item)
+        if len(self.pending[kind]) >= self.batch_size:
+            if kind == "album":
+                self._flush_albums()
+            else:
+                self._flush_songs()
+
+    def _report(self):
+        rows_per_sec, elapsed = self.rate()
+        self.progress(
+            f"{self.counts['album']} albums, {self.counts['song']} songs, "
+            f"{self.counts['track']} tracks in {elapsed:.1f}s "
+            f"({rows_per_sec:,.0f} rows/s)")
+
+    # users are few and need password hashing; they go through the ORM
+    def _import_user(self, item):
+        user, created = User.objects.get_or_create(username=item["username"])
+        if created:
+            user.set_password(item.get("password") or None)
+        user.is_superuser = _truthy(item.get("is_superuser", False))
+        user.is_staff = _truthy(item.get("is_staff", False))
+        user.save()
+        MusicManagerUser.objects.update_or_create(
+            user=user,
+            defaults={"display_name": item.get("display_name", user.username),
+                      "permission": item.get("permission", "viewer")},
+        )
+        self.counts["user"] += 1
+
+    def _album_row(self, item):
+        fmt = FORMATS.get(str(item.get("format", "DD")).strip().lower())
+        if fmt is None:
+            raise CatalogueImportError(
+                f"Unknown album format {item.get('format')!r}.")
+        title = item["title"]
+        try:
+            price = Decimal(str(item.get("price", 0)))
+        except InvalidOperation:
+            raise CatalogueImportError(
+                f"Album {title!r}: invalid price {item.get('price')!r}.")
+        return Album(
+            title=title,
+            description=item.get("description", ""),
+            artist=item.get("artist", ""),
+            price=price,
+            format=fmt,
+            release_date=item["release_date"],
+            slug=slugify(title),
+        )
+
+    @transaction.atomic
+    def _flush_albums(self):
+        batch, self.pending["album"] = self.pending["album"], []
+        if not batch:
+            return
+        rows = {}
+        for item in batch:
+            row = self._album_row(item)
+            rows[(row.title, row.artist, row.format)] = row
+        rows = list(rows.values())
+        Album.objects.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=["title", "artist", "format"],
+            update_fields=["description", "price", "release_date", "slug",
+                           "updated_at"])
+        missing = [r for r in rows if r.pk is None]
+        if missing:
+            # backends that cannot return ids from an upsert
+            found = {(t, a, f): pk for pk, t, a, f in Album.objects.filter(
+                title__in={r.title for r in missing}).values_list(
+                "id", "title", "artist", "format")}
+            for row in missing:
+                row.pk = found[(row.title, row.artist, row.format)]
+        for row in rows:
+            self.albums.setdefault(row.title, {})[(row.artist, row.format)] = row.pk
+        self._refresh_albums({row.pk for row in rows})
+        self.counts["album"] += len(rows)
+        self._report()
+
+    def _album_ref(self, item, ref):
+        """(id, artist) of the album a song's ``ref`` names."""
+        if isinstance(ref, dict):
+            title, artist = ref.get("title"), ref.get("artist")
+            fmt = FORMATS.get(str(ref.get("format", "")).strip().lower())
+        else:
+            title, artist, fmt = ref, None, None
+        matches = [(pk, key[0]) for key, pk in self.albums.get(title, {}).items()
+                   if artist in (None, key[0]) and fmt in (None, key[1])]
+        if len(matches) > 1 and artist is None and item.get("artist"):
+            matches = [m for m in matches if m[1] == item["artist"]] or matches
+        if not matches:
+            raise CatalogueImportError(
+                f"Song {item.get('title')!r} references unknown album {ref!r}.")
+        if len(matches) > 1:
+            raise CatalogueImportError(
+                f"Song {item.get('title')!r}: album {ref!r} is ambiguous; "
+                f"give its artist and format.")
+        return matches[0]
+
+    @transaction.atomic
+    def _flush_songs(self):
+        batch, self.pending["song"] = self.pending["song"], []
+        if not batch:
+            return
+
+        new_songs, changed_songs, tracks, touched = {}, {}, [], set()
+        for item in batch:
+            album_refs = [self._album_ref(item, ref)
+                          for ref in item.get("albums") or []]
+            artist = (item.get("artist")
+                      or (album_refs[0][1] if album_refs else None)
+                      or "Unknown Artist")
+            length = int(item.get("runtime", item.get("length", 10)))
+            key = (item["title"], artist)
+            if key in self.songs:
+                pk, old_length = self.songs[key]
+                if old_length != length:
+                    changed_songs[key] = Song(
+                        pk=pk, title=key[0], artist=artist, length=length)
+            else:
+                new_songs[key] = Song(
+                    title=key[0], artist=artist, length=length)
+            tracks.append((key, [pk for pk, _ in album_refs]))
+
+        created = Song.objects.bulk_create(list(new_songs.values()))
+        for song in created:
+            self.songs[(song.title, song.artist)] = (song.pk, song.length)
+        if changed_songs:
+            for song in changed_songs.values():
+                self.songs[(song.title, song.artist)] = (song.pk, song.length)
+                song.updated_at = timezone.now()
+            Song.objects.bulk_update(
+                list(changed_songs.values()), ["length", "updated_at"])
+            touched.update(
+                AlbumTracklistItem.objects
+                .filter(song__in=list(changed_songs.values()))
+                .values_list("album_id", flat=True))
+
+        items = {}
+        for key, album_ids in tracks:
+            song_id = self.songs[key][0]
+            for album_id in album_ids:
+                if (album_id, song_id) in self.tracks:
+                    continue
+                self.tracks.add((album_id, song_id))
+                position = self.positions.get(album_id, 0) + 1
+                self.positions[album_id] = position
+                items[(album_id, song_id)] = AlbumTracklistItem(
+                    album_id=album_id, song_id=song_id, position=position)
+                touched.add(album_id)
+        AlbumTracklistItem.objects.bulk_create(
+            list(items.values()), ignore_conflicts=True)
+        self._refresh_albums(touched)
+
+        self.counts["song"] += len(batch)
+        self.counts["track"] += len(items)
+        self._report()
+
+    def _refresh_albums(self, album_ids):
+        # bulk writes bypass the model signals; this runs in the batch's
+        # transaction, so a later failing record can't leave committed
+        # albums without stats or behind a stale cache version
+        touched = sorted(album_ids)
+        for start in range(0, len(touched), 500):
+            AlbumStats.rebuild(album_ids=touched[start:start + 500])
+        cache.bump_version()
+        transaction.on_commit(cache.bump_version)
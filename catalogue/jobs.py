@@ -0,0 +1,149 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Job
+
+# Local, database-backed job queue.
+#
+# enqueue() inserts a Job row (deduplicated on ``key`` while one is still
+# queued); `manage.py run_workers` runs a pool of processes that claim jobs
+# with a conditional UPDATE, so no two workers ever run the same job. A
+# failing job is retried with exponential backoff until max_attempts, then
+# left as "failed" for inspection (and manual retry) in the admin.
+
+RETRY_BASE_SECONDS = 10
+# a worker whose queue polling fails (e.g. the database is unreachable)
+# backs off up to this long instead of exiting
+MAX_BACKOFF_SECONDS = 60
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register ``func(payload)`` as the handler for jobs of ``kind``."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, key="", delay=0):
+    if key and Job.objects.filter(key=key, status="queued").exists():
+        return None
+    return Job.objects.create(
+        kind=kind, key=key, payload=payload or {},
+        run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker):
+    """Atomically take the next due job, or return None."""
+    now = timezone.now()
+    candidates = (Job.objects.filter(status="queued", run_after__lte=now)
+                  .order_by("run_after", "id")
+                  .values_list("id", flat=True)[:5])
+    for job_id in candidates:
+        claimed = Job.objects.filter(id=job_id, status="queued").update(
+            status="running", locked_by=worker, locked_at=now,
+            updated_at=now)
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    func = HANDLERS.get(job.kind)
+    job.attempts += 1
+    try:
+        if func is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        with transaction.atomic():
+            func(job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = "queued"
+            job.run_after = timezone.now() + timedelta(
+                seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = "failed"
+        logger.warning("Job %s failed (attempt %s/%s)", job.pk,
+                       job.attempts, job.max_attempts, exc_info=True)
+    else:
+        job.status = "done"
+        job.last_error = ""
+    job.locked_by = ""
+    job.locked_at = None
+    job.save(update_fields=["status", "attempts", "run_after", "last_error",
+                            "locked_by", "locked_at", "updated_at"])
+    return job
+
+
+def run_pending(worker=None, limit=None):
+    """Run due jobs in this process until the queue is empty; returns count."""
+    worker = worker or worker_id()
+    count = 0
+    while limit is None or count < limit:
+        job = claim(worker)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def requeue_stale(older_than):
+    """Return jobs left "running" by a worker that died."""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return Job.objects.filter(status="running", locked_at__lt=cutoff).update(
+        status="queued", locked_by="", locked_at=None)
+
+
+def retry(queryset):
+    return queryset.exclude(status="running").update(
+        status="queued", attempts=0, run_after=timezone.now(), last_error="")
+
+
+def worker_loop(poll_interval=1.0, stop=None):
+    """Body of one worker process; runs until ``stop()`` returns true."""
+    worker = worker_id()
+    failures = 0
+    while not (stop and stop()):
+        try:
+            ran = run_pending(worker, limit=100)
+        except Exception:
+            failures += 1
+            delay = min(poll_interval * 2 ** failures, MAX_BACKOFF_SECONDS)
+            logger.exception("Worker %s cannot poll the job queue; retrying "
+                             "in %.0fs", worker, delay)
+            # drop a connection the error may have broken
+            connections.close_all()
+            time.sleep(delay)
+            continue
+        failures = 0
+        if not ran:
+            time.sleep(poll_interval)
+
+
+# ---- handlers -------------------------------------------------------------
+
+
+@handler("cover_variants")
+def _cover_variants(payload):
+    from . import covers
+    from .models import Album
+
+    album = Album.objects.filter(pk=payload["album_id"]).first()
+    if album is not None and covers.needs_variants(album):
+        covers.build_variants(album)
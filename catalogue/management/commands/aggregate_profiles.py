@@ -0,0 +1,65 @@
+import io
+import pstats
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalogue import profiling
+
+
+class Command(BaseCommand):
+    help = ("Sum the request profiles captured by ProfilingMiddleware and "
+            "print the hottest functions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Capture directory (default: "
+                                          "CATALOGUE_PROFILING['DIR']).")
+        parser.add_argument("--url-name", help="Only captures of this URL name.")
+        parser.add_argument("--limit", type=int, default=25)
+        parser.add_argument("--sort", default="cumulative",
+                            choices=["cumulative", "tottime", "ncalls"])
+        parser.add_argument("--folded-out",
+                            help="Also write the merged collapsed stacks here.")
+
+    def handle(self, *args, **options):
+        directory = Path(options["dir"]) if options["dir"] else profiling.capture_dir()
+        prefix = f"{options['url_name']}-" if options["url_name"] else ""
+        prof_files = sorted(directory.glob(f"{prefix}*.prof"))
+        folded_files = sorted(directory.glob(f"{prefix}*.folded"))
+        if not prof_files and not folded_files:
+            raise CommandError(f"No captures in {directory}.")
+
+        if prof_files:
+            self.stdout.write(f"📊 {len(prof_files)} cProfile capture(s)")
+            out = io.StringIO()
+            stats = pstats.Stats(*map(str, prof_files), stream=out)
+            stats.strip_dirs().sort_stats(options["sort"]).print_stats(
+                options["limit"])
+            self.stdout.write(out.getvalue())
+
+        if folded_files:
+            stacks = Counter()
+            for path in folded_files:
+                for line in path.read_text().splitlines():
+                    stack, _, count = line.rpartition(" ")
+                    if stack:
+                        stacks[stack] += int(count)
+            total = sum(stacks.values()) or 1
+            # a function's samples: every stack it appears on (inclusive)
+            inclusive, leaf = Counter(), Counter()
+            for stack, n in stacks.items():
+                frames = stack.split(";")
+                leaf[frames[-1]] += n
+                for frame in set(frames):
+                    inclusive[frame] += n
+            self.stdout.write(f"📊 {len(folded_files)} sampled capture(s), "
+                              f"{total} samples")
+            self.stdout.write(f"{'incl%':>7} {'self%':>7}  function")
+            for frame, n in inclusive.most_common(options["limit"]):
+                self.stdout.write(f"{100 * n / total:7.1f} "
+                                  f"{100 * leaf[frame] / total:7.1f}  {frame}")
+            if options["folded_out"]:
+                Path(options["folded_out"]).write_text(
+                    "".join(f"{s} {n}\n" for s, n in stacks.items()))
+                self.stdout.write(f"✅ Wrote {options['folded_out']}")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from catalogue import covers
+from catalogue.models import Album
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants for album covers that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Rebuild variants for every album with a cover.")
+
+    def handle(self, *args, **options):
+        built = 0
+        albums = Album.objects.exclude(cover_image="").exclude(
+            cover_image__isnull=True).only("id", "cover_image", "cover_variants")
+        for album in albums.iterator():
+            if options["force"] or covers.needs_variants(album):
+                variants = covers.build_variants(album)
+                built += 1
+                self.stdout.write(
+                    f"🖼  {album.pk}: {len(variants['widths'])} width(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 Built variants for {built} album(s)."))
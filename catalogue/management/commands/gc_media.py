@@ -0,0 +1,105 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalogue import cache
+from catalogue.covers import variant_digest
+from catalogue.models import Album
+from catalogue.storage import (CAS_PREFIX, VARIANTS_PREFIX, is_content_addressed,
+                               reference_counts)
+
+LEGACY_PREFIX = "album_covers/"
+
+
+class Command(BaseCommand):
+    help = ("Delete content-addressed cover blobs and resized variants no "
+            "album references. "
+            "With --adopt, first move legacy covers into the blob store.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace", type=int, default=3600,
+            help="Keep unreferenced blobs younger than this many seconds "
+                 "(their album may not be committed yet).")
+        parser.add_argument(
+            "--adopt", action="store_true",
+            help="Re-store legacy album_covers/ files by digest, repoint "
+                 "albums at them and delete the unreferenced originals.")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        storage = Album.cover_image.field.storage
+        dry_run = options["dry_run"]
+        if options["adopt"]:
+            self._adopt(storage, dry_run)
+
+        refs = reference_counts()
+        digests = set(Album.objects.values_list("cover_variants__digest",
+                                                flat=True))
+        cutoff = time.time() - options["grace"]
+        freed = deleted = 0
+        orphans = [(name, path) for name, path in self._walk(storage, CAS_PREFIX)
+                   if name not in refs]
+        orphans += [(name, path)
+                    for name, path in self._walk(storage, VARIANTS_PREFIX)
+                    if variant_digest(name) not in digests]
+        for name, path in orphans:
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            freed += stat.st_size
+            deleted += 1
+            self.stdout.write(f"🗑  {name}")
+            if not dry_run:
+                os.unlink(path)
+
+        if options["adopt"]:
+            for name, path in self._walk(storage, LEGACY_PREFIX):
+                if (is_content_addressed(name) or name.startswith(VARIANTS_PREFIX)
+                        or name in refs):
+                    continue
+                freed += os.stat(path).st_size
+                deleted += 1
+                self.stdout.write(f"🗑  {name}")
+                if not dry_run:
+                    os.unlink(path)
+
+        verb = "Would free" if dry_run else "Freed"
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 {verb} {freed / 1024:.1f} KiB in {deleted} file(s)."))
+
+    def _walk(self, storage, prefix):
+        root = storage.path(prefix)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+                yield name, path
+
+    def _adopt(self, storage, dry_run):
+        albums = (Album.objects.exclude(cover_image="")
+                  .exclude(cover_image__isnull=True)
+                  .only("id", "cover_image", "cover_variants"))
+        adopted = 0
+        for album in albums.iterator():
+            name = album.cover_image.name
+            if is_content_addressed(name) or not storage.exists(name):
+                continue
+            if dry_run:
+                self.stdout.write(f"📦 would adopt {name}")
+                continue
+            with storage.open(name, "rb") as fh:
+                new_name = storage.save(name, fh)
+            variants = album.cover_variants or {}
+            if variants.get("source") == name:
+                # same bytes, so the resized variants stay valid
+                variants = dict(variants, source=new_name)
+            Album.objects.filter(pk=album.pk).update(
+                cover_image=new_name, cover_variants=variants,
+                updated_at=timezone.now())
+            adopted += 1
+            self.stdout.write(f"📦 {name} -> {new_name}")
+        if adopted:
+            cache.bump_version()
@@ -0,0 +1,102 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.text import slugify
+
+from catalogue import cache
+from catalogue.models import Album, AlbumStats, AlbumTracklistItem, Song
+
+WORDS = (
+    "red blue golden silver night morning city river ocean electric velvet "
+    "broken hidden endless paper glass summer winter neon quiet wild lost "
+    "house dream light heart stereo fire rain road echo garden machine"
+).split()
+ARTISTS = 500
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic catalogue of N albums with M tracks each "
+            "(deterministic for a given --seed), written with bulk inserts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--albums", type=int, default=1000)
+        parser.add_argument("--tracks-per-album", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--clear", action="store_true",
+            help="Delete existing albums, songs and tracks first.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        n_albums = options["albums"]
+        per_album = options["tracks_per_album"]
+        batch_size = options["batch_size"]
+        started = time.monotonic()
+
+        if options["clear"]:
+            self._clear()
+            self.stdout.write("💥 Cleared albums, songs and tracks.")
+
+        # albums are numbered from the current max id so repeated runs
+        # without --clear do not trip the (title, artist, format) constraint
+        offset = (Album.objects.order_by("-id")
+                  .values_list("id", flat=True).first() or 0)
+        for start in range(0, n_albums, batch_size):
+            count = min(batch_size, n_albums - start)
+            self._write_batch(rng, offset + start, count, per_album)
+            self.stdout.write(
+                f"💿 {start + count}/{n_albums} albums", ending="\r")
+
+        cache.bump_version()
+        transaction.on_commit(cache.bump_version)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"\n📊 Generated {n_albums} albums and {n_albums * per_album} "
+            f"tracks in {elapsed:.1f}s"))
+
+    def _clear(self):
+        # plain DELETEs: going through the ORM would fire the per-row
+        # AlbumStats/cache signals for every track
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (AlbumStats, AlbumTracklistItem, Song, Album):
+                cursor.execute(
+                    f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+
+    def _title(self, rng, words):
+        return " ".join(rng.choice(WORDS) for _ in range(words)).title()
+
+    @transaction.atomic
+    def _write_batch(self, rng, first, count, per_album):
+        albums = []
+        for n in range(first, first + count):
+            title = f"{self._title(rng, 2)} {n}"
+            albums.append(Album(
+                title=title,
+                description=" ".join(rng.choice(WORDS)
+                                     for _ in range(rng.randint(5, 60))),
+                artist=f"Artist {rng.randrange(ARTISTS)}",
+                price=Decimal(rng.randint(99, 9999)) / 100,
+                format=rng.choice(Album.FORMAT_CHOICES)[0],
+                release_date=date(1960, 1, 1) + timedelta(
+                    days=rng.randrange(23000)),
+                cover_image="",
+                slug=slugify(title),
+            ))
+        Album.objects.bulk_create(albums)
+
+        songs = [Song(title=self._title(rng, 3), artist=album.artist,
+                      length=rng.randint(30, 600))
+                 for album in albums for _ in range(per_album)]
+        Song.objects.bulk_create(songs)
+
+        items = [AlbumTracklistItem(album=album, song=songs[i * per_album + p],
+                                    position=p + 1)
+                 for i, album in enumerate(albums) for p in range(per_album)]
+        AlbumTracklistItem.objects.bulk_create(items)
+        AlbumStats.rebuild(album_ids=[a.id for a in albums])
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalogue.importing import (BATCH_SIZE, CatalogueImporter,
+                                 CatalogueImportError, open_records)
+
+
+class Command(BaseCommand):
+    help = ("Stream a catalogue file (JSON in the sample_data.json shape, "
+            "NDJSON or CSV) into the database with batched upserts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format", choices=["json", "ndjson", "jsonl", "csv"],
+            help="Input format (default: from the file extension).")
+        parser.add_argument(
+            "--kind", choices=["user", "album", "song"],
+            help="Record type of every row in a CSV file.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--quiet", action="store_true", help="No per-batch progress.")
+
+    def handle(self, *args, **options):
+        progress = None if options["quiet"] else (
+            lambda message: self.stdout.write(f"⏳ {message}"))
+        importer = CatalogueImporter(
+            batch_size=options["batch_size"], progress=progress)
+        try:
+            fh, records = open_records(
+                options["path"], options["format"], options["kind"])
+            with fh:
+                counts = importer.run(records)
+        except (OSError, KeyError, ValueError) as e:  # incl. CatalogueImportError
+            raise CommandError(f"Import failed: {e}")
+
+        rows_per_sec, elapsed = importer.rate()
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 Imported users={counts['user']}, albums={counts['album']}, "
+            f"songs={counts['song']}, tracks={counts['track']} "
+            f"in {elapsed:.1f}s ({rows_per_sec:,.0f} rows/s)"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from catalogue import profiling
+
+
+class Command(BaseCommand):
+    help = (f"Print a token for the {profiling.HEADER} header, which profiles "
+            f"a request on demand (valid for {profiling.TOKEN_MAX_AGE // 60} "
+            "minutes).")
+
+    def handle(self, *args, **options):
+        self.stdout.write(profiling.make_token())
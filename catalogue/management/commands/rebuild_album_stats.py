@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from catalogue.models import AlbumStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized AlbumStats rows from the tracklists."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--album", type=int, action="append", dest="albums",
+            help="Only rebuild this album id (repeatable).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = AlbumStats.rebuild(
+            album_ids=options["albums"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 Rebuilt stats for {written} album(s)."))
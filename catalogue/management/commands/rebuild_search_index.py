@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from catalogue import search
+
+
+class Command(BaseCommand):
+    help = ("Recreate the album/song full-text index and its sync triggers, "
+            "then rebuild it from the current tables (SQLite only).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stdout.write(
+                "⚠ Full-text index is SQLite-only; search uses icontains here.")
+            return
+        search.install()
+        self.stdout.write(self.style.SUCCESS("🔎 Search index rebuilt."))
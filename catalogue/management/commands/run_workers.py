@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from catalogue import jobs
+
+
+def _child(poll_interval):
+    # each process opens its own database connection
+    connections.close_all()
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    jobs.worker_loop(poll_interval, stop=lambda: bool(stopping))
+
+
+class Command(BaseCommand):
+    help = ("Run background jobs (cover variants, ...) in a pool of worker "
+            "processes, one per CPU by default.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--poll", type=float, default=1.0,
+            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument(
+            "--stale-after", type=int, default=600,
+            help="Requeue jobs stuck in 'running' for this many seconds.")
+        parser.add_argument(
+            "--burst", action="store_true",
+            help="Run everything queued in this process, then exit.")
+
+    def handle(self, *args, **options):
+        stale = jobs.requeue_stale(options["stale_after"])
+        if stale:
+            self.stdout.write(f"♻ Requeued {stale} stale job(s).")
+
+        if options["burst"]:
+            count = jobs.run_pending()
+            self.stdout.write(self.style.SUCCESS(f"✅ Ran {count} job(s)."))
+            return
+
+        connections.close_all()
+        workers = [multiprocessing.Process(target=_child,
+                                           args=(options["poll"],),
+                                           daemon=True)
+                   for _ in range(max(1, options["processes"]))]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"👷 {len(workers)} worker(s) running; Ctrl-C to stop.")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            self.stdout.write("🛑 Stopping workers...")
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
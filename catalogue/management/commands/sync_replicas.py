@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from catalogue import cache, routers
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database into every read replica "
+            "(CATALOGUE_READ_REPLICAS) with SQLite's online backup API.")
+
+    def handle(self, *args, **options):
+        aliases = routers.replicas()
+        if not aliases:
+            raise CommandError("No read replicas configured (MUSICDB_REPLICAS).")
+
+        primary = connections[routers.PRIMARY]
+        primary.ensure_connection()
+        for alias in aliases:
+            # readers keep working; the copy lands in one locked step
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f"🔁 {alias} synced.")
+
+        # album responses cached from the stale replicas are now outdated
+        cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(f"✅ Synced {len(aliases)} replica(s)."))
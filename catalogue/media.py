@@ -0,0 +1,182 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotAllowed, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import is_content_addressed
+
+# Serving MEDIA_ROOT (album covers) without DEBUG.
+#
+# Unlike django.views.static.serve this is meant for production traffic:
+#   * strong ETags and Last-Modified, answered with 304 when they match;
+#   * content-addressed names (covers and their variants) never change
+#     meaning, so they are sent with a one-year `immutable` Cache-Control;
+#   * a single `Range: bytes=...` is answered with 206 (If-Range aware);
+#   * `<file>.br` / `<file>.gz` siblings are sent when the client accepts
+#     that encoding;
+#   * full responses are FileResponses, which WSGI servers turn into
+#     sendfile() via wsgi.file_wrapper. With CATALOGUE_MEDIA_ACCEL_REDIRECT
+#     set (e.g. "/protected-media/") nginx serves the bytes instead and
+#     Django only checks the path and sets the headers.
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+CHUNK_SIZE = 64 * 1024
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def is_immutable(name):
+    return is_content_addressed(name) or name.startswith("album_covers/variants/")
+
+
+def _etag(name, st):
+    if is_immutable(name):
+        # the digest is already in the name
+        return f'"{os.path.basename(name)}-{st.st_size:x}"'
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _accepted_encodings(request):
+    header = request.headers.get("Accept-Encoding", "")
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _precompressed(request, fullpath):
+    accepted = _accepted_encodings(request)
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(fullpath + suffix):
+            return coding, fullpath + suffix
+    return None, fullpath
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, else None.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None  # malformed or multiple ranges: send the whole file
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or (last and int(last) < start):
+            raise ValueError(header)
+    else:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        start, end = max(0, size - length), size - 1
+    return start, end
+
+
+def _file_range(path, start, length):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(mtime) <= since
+
+
+def serve_media(request, path):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    name = path.lstrip("/")
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, name)
+        st = os.stat(fullpath)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404("No such media file")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("No such media file")
+
+    encoding, sendpath = _precompressed(request, fullpath)
+    if encoding:
+        st = os.stat(sendpath)
+    etag = _etag(name, st)
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        "Cache-Control": (
+            f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+            if is_immutable(name) else "public, max-age=0, must-revalidate"),
+    }
+    if _not_modified(request, etag, st.st_mtime):
+        response = HttpResponseNotModified()
+        for key in ("ETag", "Last-Modified", "Cache-Control", "Vary"):
+            response[key] = headers[key]
+        return response
+
+    content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+    size = st.st_size
+    start, end = 0, size - 1
+    status = 200
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            requested = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        if requested is not None:
+            start, end = requested
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    length = end - start + 1 if size else 0
+
+    accel = getattr(settings, "CATALOGUE_MEDIA_ACCEL_REDIRECT", None)
+    if request.method == "HEAD":
+        response = HttpResponse(status=status, content_type=content_type)
+    elif accel:
+        # nginx does the I/O (including ranges) from the internal location
+        response = HttpResponse(content_type=content_type)
+        internal = os.path.relpath(sendpath, settings.MEDIA_ROOT)
+        response["X-Accel-Redirect"] = accel.rstrip("/") + "/" + internal.replace(os.sep, "/")
+        headers.pop("Content-Range", None)
+    elif status == 206:
+        response = StreamingHttpResponse(
+            _file_range(sendpath, start, length),
+            status=206, content_type=content_type)
+    else:
+        response = FileResponse(open(sendpath, "rb"), content_type=content_type)
+    for key, value in headers.items():
+        response[key] = value
+    if encoding:
+        response["Content-Encoding"] = encoding
+    if not accel or request.method == "HEAD":
+        response["Content-Length"] = str(length)
+    return response
@@ -0,0 +1,321 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Per-endpoint request metrics, exposed at /metrics in Prometheus text format.
+#
+# MetricsMiddleware times every request and, through an execute_wrapper()
+# kept on every connection, its SQL. Numbers are aggregated per resolved URL name
+# and method in per-thread shards: a thread only ever writes its own shard,
+# so recording takes no lock, and a scrape sums the shards (folding those of
+# finished threads into one retired total). Aggregates are per process;
+# scrape each worker when running several.
+#
+# Requests slower than CATALOGUE_SLOW_REQUEST_MS (default 500) are logged to
+# "catalogue.slow" with their SQL.
+#
+# /metrics answers staff users, and scrapers at CATALOGUE_METRICS_ALLOWED_IPS
+# (default: none). Behind a reverse proxy every request comes from the
+# proxy's address, so the client is taken from the last X-Forwarded-For hop
+# when REMOTE_ADDR is one of CATALOGUE_TRUSTED_PROXIES, and a direct
+# request from the proxy host itself is not trusted by default.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_LOGGED_QUERIES = 50
+
+slow_logger = logging.getLogger("catalogue.slow")
+
+_current = contextvars.ContextVar("catalogue_request_stats", default=None)
+_shards = []  # [(thread, {(endpoint, method): EndpointStats})]
+_retired = {}
+_scrape_lock = threading.Lock()  # scrapes only; recording never locks
+_local = threading.local()
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "serialize_seconds", "sql")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.sql = []
+
+
+class EndpointStats:
+    __slots__ = ("buckets", "count", "seconds", "statuses", "queries",
+                 "db_seconds", "response_bytes", "serialize_seconds")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.statuses = {}
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.response_bytes = 0
+        self.serialize_seconds = 0.0
+
+    def merge(self, other):
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.seconds += other.seconds
+        for status, n in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + n
+        self.queries += other.queries
+        self.db_seconds += other.db_seconds
+        self.response_bytes += other.response_bytes
+        self.serialize_seconds += other.serialize_seconds
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {}
+        _shards.append((threading.current_thread(), shard))
+    return shard
+
+
+def record(endpoint, method, status, seconds, stats, response_bytes):
+    entry = _shard().get((endpoint, method))
+    if entry is None:
+        entry = _shard()[(endpoint, method)] = EndpointStats()
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            entry.buckets[i] += 1
+            break
+    entry.count += 1
+    entry.seconds += seconds
+    entry.statuses[status] = entry.statuses.get(status, 0) + 1
+    entry.queries += stats.queries
+    entry.db_seconds += stats.db_seconds
+    entry.response_bytes += response_bytes
+    entry.serialize_seconds += stats.serialize_seconds
+
+
+def _merge_into(totals, shard):
+    for key, entry in list(shard.items()):
+        totals.setdefault(key, EndpointStats()).merge(entry)
+
+
+def snapshot():
+    """{(endpoint, method): EndpointStats} summed over every thread."""
+    with _scrape_lock:
+        for item in list(_shards):
+            thread, shard = item
+            if not thread.is_alive():
+                _merge_into(_retired, shard)
+                _shards.remove(item)
+        totals = {}
+        _merge_into(totals, _retired)
+        for _, shard in list(_shards):
+            _merge_into(totals, shard)
+        return totals
+
+
+def reset():
+    with _scrape_lock:
+        _retired.clear()
+        for _, shard in list(_shards):
+            shard.clear()
+
+
+@contextmanager
+def serialization():
+    """Count the block as serialization time (minus any SQL it ran)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started, db_before = time.perf_counter(), stats.db_seconds
+    try:
+        yield
+    finally:
+        stats.serialize_seconds += (time.perf_counter() - started
+                                    - (stats.db_seconds - db_before))
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if len(stats.sql) < MAX_LOGGED_QUERIES:
+            stats.sql.append((elapsed, sql))
+
+
+def install_recorder(conn):
+    # connections are per thread; an async request's ORM calls run on a
+    # sync_to_async thread, so the recorder stays on every connection and
+    # finds the request through the (copied) context variable
+    if _record_query not in conn.execute_wrappers:
+        conn.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def _connection_created(sender, connection, **kwargs):
+    install_recorder(connection)
+
+
+def _response_bytes(response):
+    if response.streaming:
+        return int(response.get("Content-Length", 0) or 0)
+    return len(response.content)
+
+
+def _slow_ms():
+    return getattr(settings, "CATALOGUE_SLOW_REQUEST_MS", 500)
+
+
+class MetricsMiddleware:
+    """Record latency, SQL, size and serialization time per URL name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        for conn in connections.all(initialized_only=True):
+            install_recorder(conn)  # opened before this module was loaded
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _finish(self, request, response, stats, seconds):
+        match = getattr(request, "resolver_match", None)
+        endpoint = (match.url_name or match.view_name) if match else "<unresolved>"
+        if endpoint != "metrics":
+            record(endpoint, request.method, response.status_code, seconds,
+                   stats, _response_bytes(response))
+        if seconds * 1000 >= _slow_ms():
+            slow_logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms\n%s",
+                request.method, request.get_full_path(), endpoint,
+                seconds * 1000, stats.queries, stats.db_seconds * 1000,
+                "\n".join(f"  {elapsed * 1000:7.1f} ms  {sql}"
+                          for elapsed, sql in stats.sql))
+
+
+# ---- Prometheus text exposition -------------------------------------------
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+
+
+def render():
+    # A streamed response (?stream=1 exports) is recorded when the view
+    # returns it, before its body is generated: its duration covers only the
+    # view, and the SQL and bytes of the body itself are not counted.
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    totals = sorted(snapshot().items())
+
+    family("musicdb_request_duration_seconds", "histogram",
+           "Request latency by URL name.")
+    for (endpoint, method), entry in totals:
+        labels = _labels(endpoint=endpoint, method=method)
+        cumulative = 0
+        for bound, n in zip(BUCKETS, entry.buckets):
+            cumulative += n
+            lines.append(f'musicdb_request_duration_seconds_bucket'
+                         f'{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'musicdb_request_duration_seconds_bucket'
+                     f'{{{labels},le="+Inf"}} {entry.count}')
+        lines.append(f"musicdb_request_duration_seconds_sum{{{labels}}} "
+                     f"{entry.seconds:.6f}")
+        lines.append(f"musicdb_request_duration_seconds_count{{{labels}}} "
+                     f"{entry.count}")
+
+    family("musicdb_requests_total", "counter",
+           "Requests by URL name and status code.")
+    for (endpoint, method), entry in totals:
+        for status, n in sorted(entry.statuses.items()):
+            labels = _labels(endpoint=endpoint, method=method, status=status)
+            lines.append(f"musicdb_requests_total{{{labels}}} {n}")
+
+    for name, attr, help_text, fmt in (
+        ("musicdb_db_queries_total", "queries",
+         "SQL queries run (not those of streamed bodies).", "{}"),
+        ("musicdb_db_query_seconds_total", "db_seconds",
+         "Time spent in SQL.", "{:.6f}"),
+        ("musicdb_response_bytes_total", "response_bytes",
+         "Response body bytes (streamed bodies count as 0).", "{}"),
+        ("musicdb_serialization_seconds_total", "serialize_seconds",
+         "Time spent building response payloads.", "{:.6f}"),
+    ):
+        family(name, "counter", help_text)
+        for (endpoint, method), entry in totals:
+            labels = _labels(endpoint=endpoint, method=method)
+            lines.append(f"{name}{{{labels}}} "
+                         + fmt.format(getattr(entry, attr)))
+    return "\n".join(lines) + "\n"
+
+
+def client_ip(request):
+    """The client's address, seen through CATALOGUE_TRUSTED_PROXIES."""
+    addr = request.META.get("REMOTE_ADDR")
+    if addr in getattr(settings, "CATALOGUE_TRUSTED_PROXIES", []):
+        # the proxy appends the address it saw; earlier hops are the client's
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        return hops[-1] if hops else None
+    return addr
+
+
+def _allowed(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    return client_ip(request) in getattr(
+        settings, "CATALOGUE_METRICS_ALLOWED_IPS", [])
+
+
+def metrics_view(request):
+    if not _allowed(request):
+        return HttpResponseForbidden("Metrics are not public.")
+    return HttpResponse(render(),
+                        content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,80 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+
+from . import routers
+from .permissions import resolve_role
+
+
+class RoleMiddleware:
+    """
+    Attach ``request.mm_user``: the signed-in user's Role, resolved lazily and
+    at most once per request (see permissions.py). Goes after
+    AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # lazy, so async views that never look at it touch no database
+        request.mm_user = SimpleLazyObject(lambda: resolve_role(request))
+        return self.get_response(request)  # a coroutine in async mode
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the reads of safe requests to a read replica (see routers.py).
+    A successful unsafe request sets a short-lived cookie that keeps the
+    client on the primary, so it always reads its own writes.
+    """
+
+    COOKIE = "musicdb_primary"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _alias(self, request):
+        if self._safe(request) and self.COOKIE not in request.COOKIES:
+            return routers.pick_replica()
+        return None
+
+    def _safe(self, request):
+        return request.method in ("GET", "HEAD", "OPTIONS")
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = routers.route_reads(self._alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            # streamed bodies are read after this point, from the primary
+            routers.reset_reads(token)
+        return self._remember_write(request, response)
+
+    async def __acall__(self, request):
+        # the contextvar is copied into the threads sync_to_async runs ORM
+        # calls in, so they see the alias too
+        token = routers.route_reads(self._alias(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.reset_reads(token)
+        return self._remember_write(request, response)
+
+    def _remember_write(self, request, response):
+        if not self._safe(request) and response.status_code < 400:
+            response.set_cookie(self.COOKIE, "1",
+                                max_age=routers.read_your_writes_window(),
+                                httponly=True, samesite="Lax")
+        return response
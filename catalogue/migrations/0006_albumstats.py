@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_album_stats(apps, schema_editor):
+    Album = apps.get_model('catalogue', 'Album')
+    AlbumStats = apps.get_model('catalogue', 'AlbumStats')
+    albums = Album.objects.annotate(
+        n=Count('albumtracklistitem'),
+        playtime=Coalesce(Sum('albumtracklistitem__song__length'), 0),
+    )
+    AlbumStats.objects.bulk_create(
+        [AlbumStats(album_id=a.id, track_count=a.n, total_playtime=a.playtime)
+         for a in albums.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0005_remove_song_duration_song_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlbumStats',
+            fields=[
+                ('album', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='catalogue.album')),
+                ('track_count', models.PositiveIntegerField(default=0)),
+                ('total_playtime', models.PositiveIntegerField(default=0)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_album_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:32
+
+from django.db import migrations, models
+
+from catalogue import search
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # SQLite adds this column by remaking catalogue_album, which drops the
+    # full-text sync triggers along with the old table
+    search.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(reinstall_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:34
+
+import catalogue.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0010_job'),
+    ]
+
+    # storage is not part of the schema; altering only the state avoids
+    # SQLite remaking catalogue_album (and dropping its search triggers)
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='album',
+                    name='cover_image',
+                    field=models.ImageField(blank=True, default='default_cover.jpg', null=True, storage=catalogue.storage.cover_storage, upload_to='album_covers/'),
+                ),
+            ],
+        ),
+    ]
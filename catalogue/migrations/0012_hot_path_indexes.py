@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0011_album_cover_storage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['artist', 'title'], name='album_artist_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['title'], name='album_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['release_date'], name='album_release_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='albumtracklistitem',
+            index=models.Index(fields=['album', 'position', 'id'], name='tracklist_album_position_idx'),
+        ),
+    ]
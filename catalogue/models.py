@@ -4,6 +4,11 @@ from django.utils.text import slugify
 from django.contrib.auth.models import User
 from datetime import date, timedelta
 from django.core.validators import MinValueValidator
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .storage import cover_storage
 
 
 class Song(models.Model):
@@ -14,6 +19,7 @@ class Song(models.Model):
         validators=[MinValueValidator(10)],
         help_text="Length in seconds (minimum 10)", default=10
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def clean(self):
         if self.length < 10:
@@ -25,6 +31,26 @@ class Song(models.Model):
         return self.title
 
 
+class AlbumQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Annotate track_count and total_playtime (seconds) in SQL."""
+        return self.annotate(
+            track_count=Count("albumtracklistitem"),
+            total_playtime=Coalesce(
+                Sum("albumtracklistitem__song__length"), 0),
+        )
+
+    def with_cached_stats(self):
+        """
+        Same annotations as with_stats(), read from the AlbumStats table
+        (a one-to-one join) instead of aggregating the tracklist.
+        """
+        return self.annotate(
+            track_count=Coalesce("stats__track_count", 0),
+            total_playtime=Coalesce("stats__total_playtime", 0),
+        )
+
+
 class Album(models.Model):
     FORMAT_CHOICES = [
         ('DD', 'Digital Download'),
@@ -39,15 +65,28 @@ class Album(models.Model):
     format = models.CharField(max_length=2, choices=FORMAT_CHOICES)
     release_date = models.DateField()
     cover_image = models.ImageField(
-        upload_to='album_covers/', blank=True, null=True, default='default_cover.jpg')
+        upload_to='album_covers/', storage=cover_storage, blank=True, null=True,
+        default='default_cover.jpg')
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(blank=True, editable=False)
     tracks = models.ManyToManyField(Song, through='AlbumTracklistItem')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = AlbumQuerySet.as_manager()
 
     class Meta:
         constraints = [
             models.UniqueConstraint(
                 fields=['title', 'artist', 'format'], name='unique_album_per_artist_format')
         ]
+        indexes = [
+            # artist logins list their own albums, ordered by title
+            models.Index(fields=['artist', 'title'],
+                         name='album_artist_title_idx'),
+            models.Index(fields=['title'], name='album_title_idx'),
+            models.Index(fields=['release_date'],
+                         name='album_release_date_idx'),
+        ]
 
     def clean(self):
         if self.release_date and self.release_date > date.today():
@@ -60,6 +99,12 @@ class Album(models.Model):
             self.slug = slugify(self.title)
         super().save(*args, **kwargs)
 
+    @property
+    def cover_srcset(self):
+        """{"webp": srcset, "jpeg": srcset} of the resized cover variants."""
+        from .covers import srcsets
+        return srcsets(self.cover_variants or {})
+
     def __str__(self):
         return f"{self.title} by {self.artist}"
 
@@ -68,15 +113,74 @@ class AlbumTracklistItem(models.Model):
     album = models.ForeignKey(Album, on_delete=models.CASCADE)
     song = models.ForeignKey(Song, on_delete=models.CASCADE)
     position = models.PositiveIntegerField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('album', 'song')
         ordering = ['position']
+        indexes = [
+            # tracklists are read per album in (position, id) order
+            models.Index(fields=['album', 'position', 'id'],
+                         name='tracklist_album_position_idx'),
+        ]
 
     def __str__(self):
         return f"{self.song.title} in {self.album.title} (Position: {self.position})"
 
 
+class AlbumStats(models.Model):
+    """
+    Denormalized per-album totals, kept current by the signals in
+    catalogue/signals.py. Rebuild with `manage.py rebuild_album_stats`.
+    """
+    album = models.OneToOneField(
+        Album, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    track_count = models.PositiveIntegerField(default=0)
+    total_playtime = models.PositiveIntegerField(default=0)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def refresh(cls, album_id):
+        """Recompute the (existing) row for one album from its tracklist."""
+        totals = AlbumTracklistItem.objects.filter(album_id=album_id).aggregate(
+            track_count=Count("id"),
+            total_playtime=Coalesce(Sum("song__length"), 0),
+        )
+        cls.objects.filter(album_id=album_id).update(
+            last_modified=timezone.now(), **totals)
+
+    @classmethod
+    def rebuild(cls, album_ids=None, batch_size=1000):
+        """Recompute (and create missing) rows; returns the number written."""
+        albums = Album.objects.with_stats().order_by("id")
+        if album_ids is not None:
+            albums = albums.filter(id__in=album_ids)
+        now = timezone.now()
+        written = 0
+        batch = []
+        for album in albums.iterator(chunk_size=batch_size):
+            batch.append(cls(album_id=album.id,
+                             track_count=album.track_count,
+                             total_playtime=album.total_playtime,
+                             last_modified=now))
+            if len(batch) == batch_size:
+                written += cls._upsert(batch)
+                batch = []
+        if batch:
+            written += cls._upsert(batch)
+        return written
+
+    @classmethod
+    def _upsert(cls, rows):
+        cls.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=["album"],
+            update_fields=["track_count", "total_playtime", "last_modified"])
+        return len(rows)
+
+    def __str__(self):
+        return f"{self.album_id}: {self.track_count} tracks, {self.total_playtime}s"
+
+
 class MusicManagerUser(models.Model):
     PERMISSION_CHOICES = [
         ('viewer', 'Viewer'),
@@ -90,3 +194,37 @@ class MusicManagerUser(models.Model):
 
     def __str__(self):
         return f"{self.display_name} ({self.permission})"
+
+
+class Job(models.Model):
+    """A unit of background work, run by `manage.py run_workers`."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    key = models.CharField(max_length=100, blank=True, db_index=True,
+                           help_text="Dedupe key: one queued job per key")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
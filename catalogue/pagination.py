@@ -0,0 +1,119 @@
+import base64
+import binascii
+import json
+
+# Keyset (cursor) pagination for the list endpoints.
+#
+# Pages are seeks on the primary key (``WHERE id > <last id> ORDER BY id``)
+# rather than OFFSET scans, so every page costs the same no matter how deep
+# into the table the client is. Pagination is opt-in: it only kicks in when
+# the request carries ``limit`` or ``cursor``.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class PaginationError(ValueError):
+    pass
+
+
+class Page:
+    def __init__(self, rows, next_url, prev_url):
+        self.rows = rows
+        self.next = next_url
+        self.prev = prev_url
+
+
+def encode_cursor(pk, direction):
+    raw = json.dumps({"id": pk, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (pk, direction) from an opaque cursor string."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        pk, direction = int(data["id"]), data["d"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise PaginationError("Invalid cursor.")
+    if direction not in ("next", "prev"):
+        raise PaginationError("Invalid cursor.")
+    return pk, direction
+
+
+def _parse_limit(value):
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError("limit must be an integer.")
+    if limit < 1:
+        raise PaginationError("limit must be at least 1.")
+    return min(limit, MAX_LIMIT)
+
+
+def _page_url(request, cursor, limit):
+    params = request.GET.copy()
+    params["cursor"] = cursor
+    params["limit"] = limit
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+def is_paginated(request):
+    return "limit" in request.GET or "cursor" in request.GET
+
+
+def _page_query(request, queryset):
+    limit = _parse_limit(request.GET.get("limit"))
+    cursor = request.GET.get("cursor")
+    pk, direction = decode_cursor(cursor) if cursor else (None, "next")
+
+    if direction == "prev":
+        qs = queryset.filter(id__lt=pk).order_by("-id")
+    elif pk is not None:
+        qs = queryset.filter(id__gt=pk).order_by("id")
+    else:
+        qs = queryset.order_by("id")
+    # fetch one extra row to learn whether there is another page
+    return qs[:limit + 1], limit, pk, direction
+
+
+def _make_page(request, rows, limit, pk, direction):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == "prev":
+        rows.reverse()
+
+    if direction == "next":
+        has_next, has_prev = has_more, pk is not None
+    else:
+        has_next, has_prev = True, has_more
+
+    next_url = prev_url = None
+    if rows and has_next:
+        next_url = _page_url(request, encode_cursor(rows[-1].id, "next"), limit)
+    if rows and has_prev:
+        prev_url = _page_url(request, encode_cursor(rows[0].id, "prev"), limit)
+    return Page(rows, next_url, prev_url)
+
+
+def keyset_paginate(request, queryset):
+    """
+    Return a Page of ``queryset`` ordered by id, or None when the request
+    did not ask for pagination. Raises PaginationError on a bad limit/cursor.
+    """
+    if not is_paginated(request):
+        return None
+    qs, limit, pk, direction = _page_query(request, queryset)
+    return _make_page(request, list(qs), limit, pk, direction)
+
+
+async def akeyset_paginate(request, queryset):
+    """Async keyset_paginate() for the ASGI views."""
+    if not is_paginated(request):
+        return None
+    qs, limit, pk, direction = _page_query(request, queryset)
+    rows = [row async for row in qs]
+    return _make_page(request, rows, limit, pk, direction)
@@ -0,0 +1,75 @@
+# The signed-in user's catalogue role (MusicManagerUser), resolved once per
+# request by catalogue.middleware.RoleMiddleware as ``request.mm_user``.
+#
+# The role is read from the request's user, which RoleModelBackend loads
+# with its MusicManagerUser joined on, so it costs no extra query and is
+# never older than the request: a demotion or a deleted profile takes
+# effect on the user's next request, in every worker.
+
+
+class Role:
+    """What permission checks need from a MusicManagerUser."""
+
+    __slots__ = ("user_id", "display_name", "permission")
+
+    def __init__(self, user_id=None, display_name="", permission=""):
+        self.user_id = user_id
+        self.display_name = display_name
+        self.permission = permission
+
+    @classmethod
+    def from_profile(cls, profile):
+        return cls(profile.user_id, profile.display_name, profile.permission)
+
+    def __bool__(self):
+        # anonymous users and users without a profile have no role
+        return bool(self.permission)
+
+    def __str__(self):
+        return f"{self.display_name} ({self.permission})" if self else ""
+
+    @property
+    def is_editor(self):
+        return self.permission == "editor"
+
+    @property
+    def can_create(self):
+        return self.is_editor
+
+    def can_edit(self, album):
+        # editor OR owning artist
+        return self.is_editor or (self.permission == "artist"
+                                  and album.artist == self.display_name)
+
+    def can_delete(self, album):
+        # editors only
+        return self.is_editor
+
+
+NO_ROLE = Role()
+
+
+def resolve_role(request):
+    """Return the request's Role (NO_ROLE when there is none)."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return NO_ROLE
+    # a missing profile raises RelatedObjectDoesNotExist, an AttributeError
+    profile = getattr(user, "musicmanageruser", None)
+    return Role.from_profile(profile) if profile else NO_ROLE
+
+
+def annotate_albums(role, albums):
+    """Set can_edit / can_delete on a page of albums in one pass."""
+    can_delete = role.is_editor
+    if role.is_editor:
+        owner = None
+    elif role.permission == "artist":
+        owner = role.display_name
+    else:
+        owner = False  # nobody's albums
+    for album in albums:
+        album.can_edit = owner is None or (owner is not False
+                                           and album.artist == owner)
+        album.can_delete = can_delete
+    return albums
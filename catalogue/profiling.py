@@ -0,0 +1,187 @@
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.urls import Resolver404, resolve
+
+# Opt-in request profiling.
+#
+# ProfilingMiddleware profiles 1 in SAMPLE_RATE requests to the configured
+# URL names while CATALOGUE_PROFILING["ENABLED"] is on. Any single request
+# can also be profiled on demand, in production and without a redeploy, by
+# sending a signed header:
+#
+#     X-Catalogue-Profile: <token from `manage.py profile_token`>
+#
+# MODE "cprofile" writes a pstats file (<url name>-<time>-<pid>-<thread>.prof);
+# MODE "sample" runs a stack sampler thread and writes collapsed stacks
+# (.folded, the flamegraph.pl / speedscope input). Only the newest KEEP
+# files are kept in DIR. `manage.py aggregate_profiles` sums the captures.
+#
+# One capture runs at a time per process: cProfile cannot run on two
+# threads at once (Python 3.12+ raises ValueError), so a request sampled
+# while another is being profiled is served unprofiled.
+#
+# Profiling is WSGI only. Under ASGI the view runs in a worker thread (or
+# interleaved with other requests on the event loop), which neither
+# profiler would attribute to the request, so the middleware passes async
+# requests straight through.
+
+HEADER = "X-Catalogue-Profile"
+TOKEN_SALT = "catalogue.profiling"
+TOKEN_MAX_AGE = 3600
+SAMPLE_INTERVAL = 0.001
+
+DEFAULTS = {
+    "ENABLED": False,
+    "URL_NAMES": [],  # empty: every URL
+    "SAMPLE_RATE": 100,
+    "MODE": "cprofile",
+    "DIR": "profiles",
+    "KEEP": 500,
+}
+
+_counters = {}
+_capture_lock = threading.Lock()
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "CATALOGUE_PROFILING", {})}
+
+
+def make_token():
+    return signing.dumps({"profile": True}, salt=TOKEN_SALT)
+
+
+def _token_valid(token):
+    try:
+        signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _sampled(url_name, rate):
+    counter = _counters.get(url_name)
+    if counter is None:
+        counter = _counters.setdefault(url_name, itertools.count())
+    return next(counter) % max(rate, 1) == 0
+
+
+class StackSampler:
+    """Sample one thread's Python stack every SAMPLE_INTERVAL seconds."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                             f":{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.items())
+
+
+def _prune(directory, keep):
+    files = sorted(directory.glob("*.prof")) + sorted(directory.glob("*.folded"))
+    files.sort(key=lambda p: p.stat().st_mtime)
+    for path in files[:max(0, len(files) - keep)]:
+        path.unlink(missing_ok=True)
+
+
+def capture_dir(conf=None):
+    directory = Path((conf or config())["DIR"])
+    if not directory.is_absolute():
+        directory = Path(settings.BASE_DIR) / directory
+    return directory
+
+
+def _capture_path(conf, url_name, suffix):
+    directory = capture_dir(conf)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = int(time.time() * 1000)
+    return directory / (f"{url_name}-{stamp}-{os.getpid()}-"
+                        f"{threading.get_ident()}{suffix}")
+
+
+def profile_call(func, url_name, conf):
+    """
+    Run ``func()`` under the configured profiler and write the capture, or
+    just run it if another capture is in progress.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        return func()
+    try:
+        if conf["MODE"] == "sample":
+            with StackSampler(threading.get_ident()) as sampler:
+                result = func()
+            path = _capture_path(conf, url_name, ".folded")
+            path.write_text(sampler.collapsed())
+        else:
+            profiler = cProfile.Profile()
+            result = profiler.runcall(func)
+            path = _capture_path(conf, url_name, ".prof")
+            profiler.dump_stats(path)
+        _prune(path.parent, conf["KEEP"])
+    finally:
+        _capture_lock.release()
+    return result
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            # WSGI only (see above)
+            return self.get_response(request)
+        conf = config()
+        token = request.headers.get(HEADER)
+        forced = bool(token) and _token_valid(token)
+        if not (forced or conf["ENABLED"]):
+            return self.get_response(request)
+
+        try:
+            url_name = resolve(request.path_info).url_name or "unnamed"
+        except Resolver404:
+            return self.get_response(request)
+        if not forced and (
+                (conf["URL_NAMES"] and url_name not in conf["URL_NAMES"])
+                or not _sampled(url_name, conf["SAMPLE_RATE"])):
+            return self.get_response(request)
+        return profile_call(lambda: self.get_response(request), url_name, conf)
@@ -0,0 +1,76 @@
+import contextvars
+import random
+
+from django.conf import settings
+
+# Read-replica routing.
+#
+# Replicas are only used where it is known to be safe: the
+# ReplicaRoutingMiddleware marks a safe (GET/HEAD) request with a replica
+# alias, picked once so the whole request reads one snapshot. Everything
+# else -- writes, requests that write, management commands, job workers,
+# and reads from a client that wrote within the last
+# CATALOGUE_READ_YOUR_WRITES_SECONDS -- reads from the primary.
+#
+# Sessions, users and roles are always read from the primary: a replica
+# that lags behind a login or a revoked permission would log the user out
+# or keep authorizing them.
+#
+# Settings: CATALOGUE_READ_REPLICAS (database aliases) and
+# CATALOGUE_READ_YOUR_WRITES_SECONDS (default 5).
+
+PRIMARY = "default"
+PRIMARY_APPS = {"auth", "sessions"}
+PRIMARY_MODELS = {("catalogue", "musicmanageruser")}
+_read_alias = contextvars.ContextVar("catalogue_read_alias", default=None)
+
+
+def replicas():
+    return list(getattr(settings, "CATALOGUE_READ_REPLICAS", []))
+
+
+def read_your_writes_window():
+    return getattr(settings, "CATALOGUE_READ_YOUR_WRITES_SECONDS", 5)
+
+
+def route_reads(alias):
+    """Send this context's reads to ``alias`` (None for the primary);
+    returns a token for reset_reads()."""
+    return _read_alias.set(alias)
+
+
+def reset_reads(token):
+    _read_alias.reset(token)
+
+
+def read_alias():
+    """The alias this context reads from, or None for the primary."""
+    return _read_alias.get()
+
+
+def pick_replica():
+    aliases = replicas()
+    return random.choice(aliases) if aliases else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        meta = model._meta
+        if (meta.app_label in PRIMARY_APPS
+                or (meta.app_label, meta.model_name) in PRIMARY_MODELS):
+            return PRIMARY
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        pool = {PRIMARY, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary, never migrated directly
+        return False if db in replicas() else None
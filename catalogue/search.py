@@ -0,0 +1,174 @@
+import re
+
+from django.db import connection
+
+# Full-text search over albums and songs.
+#
+# On SQLite the index is a pair of external-content FTS5 tables
+# (catalogue_album_fts, catalogue_song_fts) that store only the inverted
+# index and read column values from the real tables. Triggers keep them in
+# sync, so bulk_create/update() and raw SQL writes are covered as well as the
+# ORM. Migration 0008 installs them; `manage.py rebuild_search_index`
+# reinstalls the triggers and rebuilds the index (needed after a migration
+# that remakes catalogue_album or catalogue_song, since SQLite drops a
+# table's triggers with it).
+#
+# Other database backends fall back to icontains filtering.
+
+FTS_TABLES = {
+    "catalogue_album_fts": ("catalogue_album", ("title", "artist", "description")),
+    "catalogue_song_fts": ("catalogue_song", ("title", "artist")),
+}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def install_sql(fts, source, columns):
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete = (f"INSERT INTO {fts}({fts}, rowid, {cols}) "
+              f"VALUES ('delete', old.id, {old});")
+    insert = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+        f"content='{source}', content_rowid='id', prefix='2 3', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"DROP TRIGGER IF EXISTS {fts}_ai",
+        f"DROP TRIGGER IF EXISTS {fts}_ad",
+        f"DROP TRIGGER IF EXISTS {fts}_au",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {source} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {source} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {source} "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def uninstall_sql(fts):
+    return [f"DROP TRIGGER IF EXISTS {fts}_{suffix}"
+            for suffix in ("ai", "ad", "au")] + [f"DROP TABLE IF EXISTS {fts}"]
+
+
+def install(schema_connection=None):
+    conn = schema_connection or connection
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for fts, (source, columns) in FTS_TABLES.items():
+            for statement in install_sql(fts, source, columns):
+                cursor.execute(statement)
+
+
+def uninstall(schema_connection=None):
+    conn = schema_connection or connection
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for fts in FTS_TABLES:
+            for statement in uninstall_sql(fts):
+                cursor.execute(statement)
+
+
+def match_expression(q):
+    """User text -> FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r"\w+", q or "")
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def _album_filters(fmt, year, alias):
+    sql, params = [], []
+    if fmt:
+        sql.append(f"{alias}.format = %s")
+        params.append(fmt)
+    if year:
+        sql.append(f"{alias}.release_date BETWEEN %s AND %s")
+        params += [f"{year:04d}-01-01", f"{year:04d}-12-31"]
+    return sql, params
+
+
+def _search_albums_fts(expr, fmt, year, limit):
+    where, params = _album_filters(fmt, year, "a")
+    where = "".join(f" AND {w}" for w in where)
+    sql = (
+        "SELECT a.id, a.title, a.artist, a.format, a.release_date, "
+        "bm25(catalogue_album_fts, 10.0, 5.0, 1.0) AS score "
+        "FROM catalogue_album_fts JOIN catalogue_album a "
+        "ON a.id = catalogue_album_fts.rowid "
+        f"WHERE catalogue_album_fts MATCH %s{where} "
+        "ORDER BY score LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expr, *params, limit])
+        return cursor.fetchall()
+
+
+def _search_songs_fts(expr, fmt, year, limit):
+    where, params = _album_filters(fmt, year, "a")
+    on_album = ""
+    if where:
+        on_album = (
+            " AND EXISTS (SELECT 1 FROM catalogue_albumtracklistitem t "
+            "JOIN catalogue_album a ON a.id = t.album_id "
+            f"WHERE t.song_id = s.id AND {' AND '.join(where)})"
+        )
+    sql = (
+        "SELECT s.id, s.title, s.artist, s.length, "
+        "bm25(catalogue_song_fts, 10.0, 5.0) AS score "
+        "FROM catalogue_song_fts JOIN catalogue_song s "
+        "ON s.id = catalogue_song_fts.rowid "
+        f"WHERE catalogue_song_fts MATCH %s{on_album} "
+        "ORDER BY score LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expr, *params, limit])
+        return cursor.fetchall()
+
+
+def _search_fallback(q, fmt, year, limit, kinds):
+    from django.db.models import Q
+
+    from .models import Album, Song
+
+    words = re.findall(r"\w+", q or "")
+    albums, songs = [], []
+    if "album" in kinds:
+        qs = Album.objects.all()
+        for w in words:
+            qs = qs.filter(Q(title__icontains=w) | Q(artist__icontains=w)
+                           | Q(description__icontains=w))
+        if fmt:
+            qs = qs.filter(format=fmt)
+        if year:
+            qs = qs.filter(release_date__year=year)
+        albums = [(*row, None) for row in qs.values_list(
+            "id", "title", "artist", "format", "release_date")[:limit]]
+    if "song" in kinds:
+        qs = Song.objects.all()
+        for w in words:
+            qs = qs.filter(Q(title__icontains=w) | Q(artist__icontains=w))
+        if fmt:
+            qs = qs.filter(albumtracklistitem__album__format=fmt)
+        if year:
+            qs = qs.filter(albumtracklistitem__album__release_date__year=year)
+        songs = [(*row, None) for row in qs.distinct().values_list(
+            "id", "title", "artist", "length")[:limit]]
+    return albums, songs
+
+
+def search(q, fmt=None, year=None, limit=DEFAULT_LIMIT,
+           kinds=("album", "song")):
+    """
+    Return (albums, songs) ranked best first. Album rows are
+    (id, title, artist, format, release_date, score) and song rows
+    (id, title, artist, length, score); a lower score is a better match.
+    """
+    expr = match_expression(q)
+    if not expr:
+        return [], []
+    if connection.vendor != "sqlite":
+        return _search_fallback(q, fmt, year, limit, kinds)
+    albums = _search_albums_fts(expr, fmt, year, limit) if "album" in kinds else []
+    songs = _search_songs_fts(expr, fmt, year, limit) if "song" in kinds else []
+    return albums, songs
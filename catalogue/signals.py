@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, covers, jobs
+from .models import Album, AlbumStats, AlbumTracklistItem, Song
+
+# Keep AlbumStats in step with the tracklist. Signals only ever update
+# existing rows (created alongside the album), so a cascading album delete
+# cannot resurrect its stats row half-way through.
+
+
+@receiver(post_save, sender=Album)
+def create_album_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AlbumStats.objects.get_or_create(album=instance)
+
+
+@receiver(post_save, sender=Album)
+def queue_cover_variants(sender, instance, raw=False, **kwargs):
+    # decoding and resizing takes far too long for the request; a
+    # run_workers process picks this up
+    if not raw and covers.needs_variants(instance):
+        jobs.enqueue("cover_variants", {"album_id": instance.pk},
+                     key=f"cover_variants:{instance.pk}")
+
+
+@receiver(pre_save, sender=AlbumTracklistItem)
+def remember_tracklist_album(sender, instance, raw=False, **kwargs):
+    instance._previous_album_id = None
+    if instance.pk and not raw:
+        instance._previous_album_id = (AlbumTracklistItem.objects
+                                       .filter(pk=instance.pk)
+                                       .values_list("album_id", flat=True)
+                                       .first())
+
+
+@receiver(post_save, sender=AlbumTracklistItem)
+def tracklist_item_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    AlbumStats.refresh(instance.album_id)
+    previous = getattr(instance, "_previous_album_id", None)
+    if previous and previous != instance.album_id:
+        AlbumStats.refresh(previous)
+
+
+@receiver(post_delete, sender=AlbumTracklistItem)
+def tracklist_item_deleted(sender, instance, **kwargs):
+    AlbumStats.refresh(instance.album_id)
+
+
+@receiver(pre_save, sender=Song)
+def remember_song_length(sender, instance, raw=False, **kwargs):
+    instance._previous_length = None
+    if instance.pk and not raw:
+        instance._previous_length = (Song.objects
+                                     .filter(pk=instance.pk)
+                                     .values_list("length", flat=True)
+                                     .first())
+
+
+@receiver(post_save, sender=Song)
+def song_length_changed(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, "_previous_length", None)
+    if created or raw or previous is None or previous == instance.length:
+        return
+    # apply the difference to every album the song is on in one UPDATE
+    AlbumStats.objects.filter(album__albumtracklistitem__song=instance).update(
+        total_playtime=F("total_playtime") + (instance.length - previous),
+        last_modified=timezone.now(),
+    )
+
+
+# Any catalogue write invalidates the cached album collection. The version
+# is bumped again once the transaction commits, so a reader that cached the
+# pre-commit state in between does not keep serving it.
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+@receiver(post_save, sender=Song)
+@receiver(post_delete, sender=Song)
+@receiver(post_save, sender=AlbumTracklistItem)
+@receiver(post_delete, sender=AlbumTracklistItem)
+def invalidate_album_cache(sender, **kwargs):
+    cache.bump_version()
+    transaction.on_commit(cache.bump_version)
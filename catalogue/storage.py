@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+from pathlib import PurePosixPath
+
+from django.core.files.storage import FileSystemStorage
+
+# Content-addressed storage for album covers.
+#
+# Uploads are hashed while they stream to a temporary file and then stored
+# once under their SHA-256 digest:
+#     album_covers/cas/<digest[:2]>/<digest><ext>
+# Re-uploading (or re-seeding) the same image reuses the existing blob
+# instead of writing another copy with a random suffix, and because a name
+# can only ever hold one content its URL is safe to cache forever.
+#
+# A blob's reference count is the number of Album rows naming it
+# (reference_counts()); `manage.py gc_media` deletes blobs that have dropped
+# to zero once their mtime is older than its grace period, so reusing a blob
+# touches it. Names from before this storage existed keep working.
+#
+# Resized cover variants (covers.py) are named by their source's digest
+# already; they are written through the same temporary file but keep their
+# name.
+
+CAS_PREFIX = "album_covers/cas/"
+VARIANTS_PREFIX = "album_covers/variants/"
+CHUNK_SIZE = 64 * 1024
+
+
+def is_content_addressed(name):
+    return bool(name) and name.startswith(CAS_PREFIX)
+
+
+def _touch(path):
+    """Restart an existing blob's gc grace period; False if there is none."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:  # never stored, or collected meanwhile
+        return False
+    return True
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # the final name is chosen from the content in _save()
+        return name
+
+    def _save(self, name, content):
+        ext = PurePosixPath(name).suffix.lower()
+        tmp_dir = self.path(CAS_PREFIX + "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+            if name.startswith(VARIANTS_PREFIX):
+                final = name
+            else:
+                hexdigest = digest.hexdigest()
+                final = f"{CAS_PREFIX}{hexdigest[:2]}/{hexdigest}{ext}"
+            final_path = self.path(final)
+            if _touch(final_path):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return final
+
+    def delete(self, name):
+        # blobs are shared; only gc_media removes them
+        if not (is_content_addressed(name) or name.startswith(VARIANTS_PREFIX)):
+            super().delete(name)
+
+
+def cover_storage():
+    # no explicit location: follows MEDIA_ROOT/MEDIA_URL (and test overrides)
+    return ContentAddressedStorage()
+
+
+def reference_counts():
+    """{stored name: number of albums using it} for every cover in use."""
+    from django.db.models import Count
+
+    from .models import Album
+
+    return dict(Album.objects.exclude(cover_image="")
+                .exclude(cover_image__isnull=True)
+                .values_list("cover_image")
+                .annotate(n=Count("id"))
+                .values_list("cover_image", "n"))
@@ -0,0 +1,99 @@
+from django.http import StreamingHttpResponse
+
+from .encoding import CONTENT_TYPE, dumps, separators
+
+# Streaming responses for full-collection exports.
+#
+# Rows are pulled from the database with a server-side ``.iterator()`` and
+# serialized one chunk at a time, so peak memory is bounded by the chunk
+# size rather than the table size and the first bytes leave immediately.
+# Clients opt in with ``?stream=1`` (chunked JSON array, same shape as the
+# regular response) or ``Accept: application/x-ndjson`` (one object per line).
+# The async views use astream_response(), which reads with ``.aiterator()``.
+
+NDJSON = "application/x-ndjson"
+STREAM_CHUNK_SIZE = 2000
+
+
+def _accepts_ndjson(request):
+    return NDJSON in request.headers.get("Accept", "")
+
+
+def wants_stream(request):
+    return (request.GET.get("stream") in ("1", "true")
+            or _accepts_ndjson(request))
+
+
+def _batches(queryset, size):
+    batch = []
+    for row in queryset.iterator(chunk_size=size):
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _abatches(queryset, size):
+    batch = []
+    async for row in queryset.aiterator(chunk_size=size):
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ndjson_chunk(batch, request, serialize):
+    return b"".join(dumps(obj) + b"\n" for obj in serialize(batch, request))
+
+
+def _array_chunk(batch, request, serialize):
+    return separators()[0].join(dumps(obj) for obj in serialize(batch, request))
+
+
+def stream_response(request, queryset, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream ``queryset`` through ``serialize(rows, request)`` (the same
+    serializers the list endpoints use) as NDJSON or a JSON array.
+    """
+    batches = _batches(queryset, chunk_size)
+    item_sep = separators()[0]
+
+    if _accepts_ndjson(request):
+        def body():
+            for batch in batches:
+                yield _ndjson_chunk(batch, request, serialize)
+        return StreamingHttpResponse(body(), content_type=NDJSON)
+
+    def body():
+        yield b"["
+        sep = b""
+        for batch in batches:
+            yield sep + _array_chunk(batch, request, serialize)
+            sep = item_sep
+        yield b"]"
+    return StreamingHttpResponse(body(), content_type=CONTENT_TYPE)
+
+
+def astream_response(request, queryset, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """stream_response() fed by ``aiterator()``, for the ASGI views."""
+    batches = _abatches(queryset, chunk_size)
+    item_sep = separators()[0]
+
+    if _accepts_ndjson(request):
+        async def body():
+            async for batch in batches:
+                yield _ndjson_chunk(batch, request, serialize)
+        return StreamingHttpResponse(body(), content_type=NDJSON)
+
+    async def body():
+        yield b"["
+        sep = b""
+        async for batch in batches:
+            yield sep + _array_chunk(batch, request, serialize)
+            sep = item_sep
+        yield b"]"
+    return StreamingHttpResponse(body(), content_type=CONTENT_TYPE)
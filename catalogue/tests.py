@@ -1,3 +1,1524 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from io import BytesIO, StringIO
+from pathlib import Path
+from datetime import date
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404, HttpResponse
+from django.db import connection
+from django.test import (AsyncRequestFactory, RequestFactory, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (async_api_views, cache, encoding, jobs, metrics, profiling,
+               routers)
+from .permissions import NO_ROLE, Role, annotate_albums
+from .utils import require_permission
+from .models import (Album, AlbumStats, AlbumTracklistItem, Job,
+                     MusicManagerUser, Song)
+
+
+
+def setUpModule():
+    # a shared cache like the real one, but not the dev server's directory
+    tmp = tempfile.TemporaryDirectory()
+    override = override_settings(CACHES={
+        **settings.CACHES,
+        settings.CATALOGUE_API_CACHE: {
+            **settings.CACHES[settings.CATALOGUE_API_CACHE],
+            "LOCATION": tmp.name}})
+    override.enable()
+    unittest.addModuleCleanup(tmp.cleanup)
+    unittest.addModuleCleanup(override.disable)
+
+
+def _make_album(title, n_tracks=2, artist="Test Artist"):
+    album = Album.objects.create(
+        title=title, description="Some description", artist=artist,
+        price="9.99", format="CD", release_date=date(2020, 1, 1))
+    for i in range(n_tracks):
+        song = Song.objects.create(
+            title=f"{title} {i}", length=100 + i, artist=artist)
+        AlbumTracklistItem.objects.create(
+            album=album, song=song, position=i + 1)
+    return album
+
+
+def _make_user(username, permission, display_name="Test Artist"):
+    user = User.objects.create_user(username=username, password="pass")
+    MusicManagerUser.objects.create(
+        user=user, display_name=display_name, permission=permission)
+    return user
+
+
+class AlbumApiQueryCountTests(TestCase):
+    def test_album_list_payload(self):
+        album = _make_album("Morning Sun", n_tracks=3)
+        _make_album("Empty", n_tracks=0)
+
+        data = self.client.get(reverse("api_albums")).json()
+        by_id = {a["id"]: a for a in data}
+
+        self.assertEqual(by_id[album.id]["total_playtime"], 303)
+        self.assertEqual([t["length"] for t in by_id[album.id]["tracks"]],
+                         [100, 101, 102])
+        self.assertEqual(
+            by_id[album.id]["tracks"][0]["url"],
+            "http://testserver" + reverse(
+                "api_song_detail", args=[by_id[album.id]["tracks"][0]["id"]]))
+        self.assertEqual(
+            by_id[album.id]["url"],
+            "http://testserver" + reverse("api_album_detail", args=[album.id]))
+        self.assertEqual(len(data), 2)
+
+    def test_album_list_query_count_is_constant(self):
+        # one query for albums (with playtime) and one for all tracklists;
+        # the collection ETag comes from the cache version token
+        _make_album("First")
+        with self.assertNumQueries(2):
+            self.client.get(reverse("api_albums"))
+
+        for i in range(10):
+            _make_album(f"Album {i}", n_tracks=3)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("api_albums"))
+
+    def test_album_detail_query_count(self):
+        album = _make_album("Night Beats", n_tracks=5)
+        # ETag lookup, album, tracklist
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse("api_album_detail", args=[album.id]))
+        self.assertEqual(response.json()["total_playtime"], 510)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.songs = [Song.objects.create(title=f"Song {i}", length=120)
+                      for i in range(7)]
+
+    def test_unpaginated_list_is_bare_array(self):
+        data = self.client.get(reverse("api_songs")).json()
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 7)
+
+    def test_walk_forward_and_back(self):
+        first = self.client.get(reverse("api_songs"), {"limit": 3}).json()
+        self.assertEqual([s["id"] for s in first["results"]],
+                         [s.id for s in self.songs[:3]])
+        self.assertIsNone(first["prev"])
+
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([s["id"] for s in second["results"]],
+                         [s.id for s in self.songs[3:6]])
+
+        third = self.client.get(second["next"]).json()
+        self.assertEqual([s["id"] for s in third["results"]],
+                         [self.songs[6].id])
+        self.assertIsNone(third["next"])
+
+        back = self.client.get(third["prev"]).json()
+        self.assertEqual(back["results"], second["results"])
+        self.assertEqual(self.client.get(back["prev"]).json()["results"],
+                         first["results"])
+
+    def test_album_pages_keep_constant_query_count(self):
+        for i in range(4):
+            _make_album(f"Album {i}")
+        with self.assertNumQueries(2):
+            data = self.client.get(reverse("api_albums"), {"limit": 2}).json()
+        self.assertEqual(len(data["results"]), 2)
+        self.assertEqual(data["results"][0]["total_playtime"], 201)
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse("api_tracklists"),
+                                   {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamingExportTests(TestCase):
+    def test_stream_matches_regular_response(self):
+        for i in range(3):
+            _make_album(f"Album {i}")
+        for name in ("api_songs", "api_albums", "api_tracklists"):
+            regular = self.client.get(reverse(name)).json()
+            response = self.client.get(reverse(name), {"stream": "1"})
+            self.assertTrue(response.streaming)
+            body = b"".join(response.streaming_content)
+            self.assertEqual(json.loads(body), regular)
+
+    def test_ndjson(self):
+        songs = [Song.objects.create(title=f"Song {i}", length=120)
+                 for i in range(3)]
+        response = self.client.get(reverse("api_songs"),
+                                   HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines],
+                         [s.id for s in songs])
+
+    def test_empty_stream_is_valid_json(self):
+        response = self.client.get(reverse("api_songs"), {"stream": "1"})
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), [])
+
+
+class AlbumStatsTests(TestCase):
+    def setUp(self):
+        self.short = _make_album("Short", n_tracks=1)
+        self.long = _make_album("Long", n_tracks=4)
+        self.empty = _make_album("Empty", n_tracks=0)
+
+    def test_with_stats(self):
+        stats = {a.id: (a.track_count, a.total_playtime)
+                 for a in Album.objects.with_stats()}
+        self.assertEqual(stats[self.short.id], (1, 100))
+        self.assertEqual(stats[self.long.id], (4, 406))
+        self.assertEqual(stats[self.empty.id], (0, 0))
+
+    def test_api_filter_and_ordering(self):
+        data = self.client.get(reverse("api_albums"),
+                               {"min_playtime": 50}).json()
+        self.assertEqual({a["id"] for a in data},
+                         {self.short.id, self.long.id})
+
+        data = self.client.get(reverse("api_albums"),
+                               {"ordering": "-total_playtime"}).json()
+        self.assertEqual([a["id"] for a in data],
+                         [self.long.id, self.short.id, self.empty.id])
+
+        data = self.client.get(reverse("api_albums"),
+                               {"max_tracks": 0}).json()
+        self.assertEqual([a["id"] for a in data], [self.empty.id])
+
+    def test_api_rejects_bad_params(self):
+        for params in ({"min_playtime": "x"}, {"ordering": "description"},
+                       {"ordering": "title", "limit": 2}):
+            response = self.client.get(reverse("api_albums"), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_album_list_view_filters_on_stats(self):
+        self.client.force_login(_make_user("editor", "editor"))
+        response = self.client.get(reverse("album_list"),
+                                   {"min_tracks": 1, "ordering": "-track_count"})
+        albums = response.context["albums"]
+        self.assertEqual([a.id for a in albums], [self.long.id, self.short.id])
+        self.assertContains(response, "4 tracks")
+
+
+class AlbumStatsTableTests(TestCase):
+    def _stats(self, album):
+        stats = AlbumStats.objects.get(album=album)
+        return stats.track_count, stats.total_playtime
+
+    def test_tracklist_changes_update_stats(self):
+        album = _make_album("Album", n_tracks=2)
+        self.assertEqual(self._stats(album), (2, 201))
+
+        song = Song.objects.create(title="Extra", length=60)
+        item = AlbumTracklistItem.objects.create(album=album, song=song)
+        self.assertEqual(self._stats(album), (3, 261))
+
+        other = _make_album("Other", n_tracks=0)
+        item.album = other
+        item.save()
+        self.assertEqual(self._stats(album), (2, 201))
+        self.assertEqual(self._stats(other), (1, 60))
+
+        item.delete()
+        self.assertEqual(self._stats(other), (0, 0))
+
+    def test_song_length_change_updates_every_album(self):
+        first = _make_album("First", n_tracks=1)
+        second = _make_album("Second", n_tracks=0)
+        song = first.tracks.get()
+        AlbumTracklistItem.objects.create(album=second, song=song)
+
+        song.length = 150
+        song.save()
+        self.assertEqual(self._stats(first), (1, 150))
+        self.assertEqual(self._stats(second), (1, 150))
+
+        song.delete()
+        self.assertEqual(self._stats(first), (0, 0))
+
+    def test_album_delete_removes_stats(self):
+        album = _make_album("Gone", n_tracks=2)
+        album.delete()
+        self.assertFalse(AlbumStats.objects.exists())
+
+    def test_rebuild_command(self):
+        album = _make_album("Album", n_tracks=3)
+        AlbumStats.objects.all().delete()
+        call_command("rebuild_album_stats", stdout=StringIO())
+        self.assertEqual(self._stats(album), (3, 303))
+
+
+class ConditionalGetTests(TestCase):
+    def test_album_detail_etag(self):
+        album = _make_album("Album", n_tracks=2)
+        url = reverse("api_album_detail", args=[album.id])
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        # ETag lookup only: no album or tracklist queries
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        song = album.tracks.first()
+        song.title = "Renamed"
+        song.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_album_detail_etag_depends_on_fields(self):
+        album = _make_album("Album", n_tracks=2)
+        url = reverse("api_album_detail", args=[album.id])
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, {"fields": "id,title"},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()), ["id", "title"])
+        # the tag follows the normalized field list, not the raw query
+        self.assertEqual(
+            self.client.get(url, {"fields": "title,id"},
+                            HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+            304)
+        response = self.client.get(url, {"fields": "nope"},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 400)
+
+    def test_album_detail_etag_changes_on_track_removal(self):
+        album = _make_album("Album", n_tracks=2)
+        url = reverse("api_album_detail", args=[album.id])
+        etag = self.client.get(url)["ETag"]
+        AlbumTracklistItem.objects.filter(album=album).first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_song_detail_if_modified_since(self):
+        song = Song.objects.create(title="Song", length=120)
+        url = reverse("api_song_detail", args=[song.id])
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_collection_etag(self):
+        _make_album("Album", n_tracks=1)
+        url = reverse("api_albums")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # a different representation gets a different tag
+        self.assertNotEqual(self.client.get(url, {"limit": 1})["ETag"], etag)
+
+        _make_album("Another", n_tracks=0)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_collection_etag_changes_on_delete(self):
+        album = _make_album("Album", n_tracks=1)
+        url = reverse("api_albums")
+        response = self.client.get(url)
+        # no timestamp moves on a delete, so collections don't send one
+        self.assertFalse(response.has_header("Last-Modified"))
+        album.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_missing_album_is_still_404(self):
+        url = reverse("api_album_detail", args=[999])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AlbumResponseCacheTests(TestCase):
+    def setUp(self):
+        self.album = _make_album("Cached", n_tracks=2)
+        cache.stats.update(hits=0, misses=0)
+
+    def test_hit_skips_album_queries(self):
+        url = reverse("api_albums")
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        stats = self.client.get(reverse("api_albums_cache")).json()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_writes_invalidate(self):
+        url = reverse("api_albums")
+        self.client.get(url)
+        song = self.album.tracks.first()
+        song.title = "Renamed"
+        song.save()
+        titles = [t["title"] for t in self.client.get(url).json()[0]["tracks"]]
+        self.assertIn("Renamed", titles)
+
+    def test_errors_are_not_cached(self):
+        url = reverse("api_albums")
+        self.client.get(url, {"min_playtime": "x"})
+        self.client.get(url, {"min_playtime": "x"})
+        self.assertEqual(cache.stats["hits"], 0)
+
+    def test_counters_are_thread_safe(self):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(cache._count, [b"{}", None] * 2000))
+        self.assertEqual((cache.stats["hits"], cache.stats["misses"]),
+                         (2000, 2000))
+
+    def test_local_memory_cache_warns(self):
+        self.assertEqual(cache.check_shared_cache(None), [])
+        with override_settings(CATALOGUE_API_CACHE="default"):
+            self.assertEqual([w.id for w in cache.check_shared_cache(None)],
+                             ["catalogue.W001"])
+
+
+class BulkEndpointTests(TestCase):
+    def _post(self, name, payload, **params):
+        url = reverse(name)
+        if params:
+            url += "?" + "&".join(f"{k}={v}" for k, v in params.items())
+        return self.client.post(url, json.dumps(payload),
+                                content_type="application/json")
+
+    def test_bulk_songs(self):
+        existing = Song.objects.create(title="Old", length=100)
+        response = self._post("api_songs_bulk", [
+            {"title": "New", "length": 200},
+            {"id": existing.id, "length": 150},
+            {"title": "Too short", "length": 5},
+            {"id": 9999, "title": "Ghost"},
+        ])
+        data = response.json()
+        self.assertEqual([r["status"] for r in data["results"]],
+                         ["created", "updated", "error", "error"])
+        self.assertEqual((data["created"], data["updated"], data["errors"]),
+                         (1, 1, 2))
+        self.assertEqual(Song.objects.get(id=data["results"][0]["id"]).title,
+                         "New")
+        existing.refresh_from_db()
+        self.assertEqual(existing.length, 150)
+
+    def test_bulk_song_length_update_refreshes_stats(self):
+        album = _make_album("Album", n_tracks=1)
+        song = album.tracks.get()
+        self._post("api_songs_bulk", [{"id": song.id, "length": 300}])
+        self.assertEqual(AlbumStats.objects.get(album=album).total_playtime, 300)
+
+    def test_bulk_tracklist_constant_queries(self):
+        album = _make_album("Album", n_tracks=0)
+        songs = [Song.objects.create(title=f"S{i}", length=100)
+                 for i in range(20)]
+        payload = [{"album": album.id, "song": s.id, "position": i + 1}
+                   for i, s in enumerate(songs)]
+        # 3 validation reads, insert, id lookup, stats rebuild (2),
+        # savepoint + release: the same for 20 items or 2000
+        with self.assertNumQueries(9):
+            data = self._post("api_tracklists_bulk", payload).json()
+        self.assertEqual(data["created"], 20)
+        self.assertEqual(AlbumStats.objects.get(album=album).track_count, 20)
+        item = AlbumTracklistItem.objects.get(album=album, song=songs[0])
+        self.assertEqual(data["results"][0]["id"], item.id)
+
+    def test_bulk_tracklist_conflicts(self):
+        album = _make_album("Album", n_tracks=1)
+        song = album.tracks.get()
+        other = Song.objects.create(title="Other", length=100)
+        payload = [
+            {"album": album.id, "song": song.id, "position": 7},
+            {"album": album.id, "song": other.id, "position": 2},
+            {"album": album.id, "song": other.id, "position": 3},
+            {"album": 9999, "song": song.id},
+        ]
+        data = self._post("api_tracklists_bulk", payload).json()
+        self.assertEqual([r["status"] for r in data["results"]],
+                         ["skipped", "created", "error", "error"])
+        self.assertEqual(
+            AlbumTracklistItem.objects.get(album=album, song=song).position, 1)
+
+        data = self._post("api_tracklists_bulk", payload[:1],
+                          on_conflict="update").json()
+        self.assertEqual(data["results"][0]["status"], "updated")
+        self.assertEqual(
+            AlbumTracklistItem.objects.get(album=album, song=song).position, 7)
+
+    def test_bulk_rejects_non_array(self):
+        response = self._post("api_tracklists_bulk", {"album": 1})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportCatalogueTests(TestCase):
+    def _import(self, path, *args):
+        call_command("import_catalogue", path, "--quiet", *args,
+                     stdout=StringIO())
+
+    def test_sample_data_import_is_idempotent(self):
+        self._import("sample_data.json")
+        counts = (Album.objects.count(), Song.objects.count(),
+                  AlbumTracklistItem.objects.count(), User.objects.count())
+        self.assertEqual(counts[:2], (3, 5))
+
+        self._import("sample_data.json")
+        self.assertEqual((Album.objects.count(), Song.objects.count(),
+                          AlbumTracklistItem.objects.count(),
+                          User.objects.count()), counts)
+
+        album = Album.objects.get(title="Night Beats")
+        self.assertEqual((album.format, album.slug), ("VL", "night-beats"))
+        stats = AlbumStats.objects.get(album=album)
+        self.assertEqual(stats.track_count, album.tracks.count())
+        self.assertEqual(MusicManagerUser.objects.get(
+            user__username="testArtist").permission, "artist")
+
+    def test_small_read_chunks(self):
+        from . import importing
+        with open("sample_data.json") as fh:
+            expected = json.load(fh)
+        original = importing.READ_SIZE
+        importing.READ_SIZE = 7
+        try:
+            with open("sample_data.json") as fh:
+                records = list(importing.read_json(fh))
+        finally:
+            importing.READ_SIZE = original
+        self.assertEqual([item for kind, item in records if kind == "song"],
+                         expected["songs"])
+
+    def test_ndjson_and_csv(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            ndjson = f"{tmp}/albums.ndjson"
+            with open(ndjson, "w") as fh:
+                fh.write(json.dumps({
+                    "type": "album", "title": "Imported", "artist": "X",
+                    "price": 5, "format": "CD",
+                    "release_date": "2020-01-01"}) + "\n")
+            csv_path = f"{tmp}/songs.csv"
+            with open(csv_path, "w") as fh:
+                fh.write("title,runtime,albums\nOne,120,Imported\n"
+                         "Two,130,Imported\n")
+            self._import(ndjson)
+            self._import(csv_path, "--kind", "song")
+            self._import(csv_path, "--kind", "song")
+
+        album = Album.objects.get(title="Imported")
+        self.assertEqual(
+            list(album.albumtracklistitem_set.order_by("position")
+                 .values_list("song__title", "song__artist", "position")),
+            [("One", "X", 1), ("Two", "X", 2)])
+        self.assertEqual(AlbumStats.objects.get(album=album).total_playtime,
+                         250)
+
+    def _write(self, tmp, name, records):
+        path = f"{tmp}/{name}"
+        with open(path, "w") as fh:
+            fh.writelines(json.dumps(r) + "\n" for r in records)
+        return path
+
+    def test_albums_keyed_by_title_artist_and_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self._import(self._write(tmp, "albums.ndjson", [
+                {"type": "album", "title": "Greatest Hits", "artist": artist,
+                 "price": 5, "format": "CD", "release_date": "2020-01-01"}
+                for artist in ("A", "B")]))
+            self._import(self._write(tmp, "songs.ndjson", [
+                {"type": "song", "title": "From A", "artist": "A",
+                 "runtime": 100, "albums": ["Greatest Hits"]},
+                {"type": "song", "title": "From B", "runtime": 100,
+                 "albums": [{"title": "Greatest Hits", "artist": "B",
+                             "format": "CD"}]}]))
+            with self.assertRaisesMessage(CommandError, "ambiguous"):
+                self._import(self._write(tmp, "anon.ndjson", [
+                    {"type": "song", "title": "Anon", "runtime": 100,
+                     "albums": ["Greatest Hits"]}]))
+
+        self.assertEqual(
+            sorted(AlbumTracklistItem.objects.values_list(
+                "album__artist", "song__title")),
+            [("A", "From A"), ("B", "From B")])
+
+    def test_later_runs_append_to_tracklists(self):
+        album = _make_album("Existing", n_tracks=2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._write(tmp, "songs.ndjson", [
+                {"type": "song", "title": "Bonus", "runtime": 100,
+                 "albums": ["Existing"]}])
+            self._import(path)
+            self._import(path)
+        self.assertEqual(
+            list(album.albumtracklistitem_set.order_by("position")
+                 .values_list("position", flat=True)), [1, 2, 3])
+        self.assertEqual(album.albumtracklistitem_set.get(
+            song__title="Bonus").position, 3)
+
+    def test_failed_import_leaves_committed_batches_consistent(self):
+        version = cache.current_version()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._write(tmp, "bad.ndjson", [
+                {"type": "album", "title": "Zed", "artist": "Z", "price": 5,
+                 "release_date": "2020-01-01"},
+                {"type": "song", "title": "s1", "runtime": 100,
+                 "albums": ["Zed"]},
+                {"type": "song", "title": "s2", "runtime": 100,
+                 "albums": ["Nope"]}])
+            with self.assertRaisesMessage(CommandError, "unknown album"):
+                self._import(path, "--batch-size", "1")
+        stats = AlbumStats.objects.get(album__title="Zed")
+        self.assertEqual((stats.track_count, stats.total_playtime), (1, 100))
+        self.assertNotEqual(cache.current_version(), version)
+
+    def test_invalid_price_is_reported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._write(tmp, "albums.ndjson", [
+                {"type": "album", "title": "Priceless", "price": "free",
+                 "release_date": "2020-01-01"}])
+            with self.assertRaisesMessage(
+                    CommandError, "Album 'Priceless': invalid price 'free'."):
+                self._import(path)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.sun = Album.objects.create(
+            title="Morning Sun", artist="Test Artist", price="9.99",
+            format="DD", release_date=date(2024, 5, 1),
+            description="Bright and uplifting tracks.")
+        self.beats = Album.objects.create(
+            title="Night Beats", artist="Test Artist", price="12.50",
+            format="VL", release_date=date(2023, 11, 15),
+            description="Smooth evening tunes for the morning after.")
+        self.song = Song.objects.create(title="Sunrise Melody", length=180)
+        AlbumTracklistItem.objects.create(album=self.sun, song=self.song)
+
+    def _search(self, **params):
+        return self.client.get(reverse("api_search"), params).json()
+
+    def test_prefix_match_and_ranking(self):
+        data = self._search(q="morn")
+        # a title match outranks a description match
+        self.assertEqual([a["id"] for a in data["albums"]],
+                         [self.sun.id, self.beats.id])
+        self.assertEqual([s["id"] for s in self._search(q="sunr")["songs"]],
+                         [self.song.id])
+
+    def test_filters(self):
+        data = self._search(q="morning", format="VL")
+        self.assertEqual([a["id"] for a in data["albums"]], [self.beats.id])
+        data = self._search(q="morning", year=2024)
+        self.assertEqual([a["id"] for a in data["albums"]], [self.sun.id])
+        self.assertEqual(self._search(q="sunrise", format="VL")["songs"], [])
+        self.assertEqual(len(self._search(q="sunrise", year=2024)["songs"]), 1)
+
+    def test_index_follows_writes(self):
+        self.sun.title = "Evening Moon"
+        self.sun.save()
+        self.assertEqual(self._search(q="sun", type="album")["albums"], [])
+        self.assertEqual(len(self._search(q="moon")["albums"]), 1)
+        # bulk writes bypass signals but not the triggers
+        Song.objects.bulk_create([Song(title="Moonlight Dance", length=200)])
+        self.assertEqual(len(self._search(q="moonl")["songs"]), 1)
+        self.song.delete()
+        self.assertEqual(self._search(q="sunrise")["songs"], [])
+
+    def test_junk_query(self):
+        self.assertEqual(self._search(q='"*:)('),
+                         {"query": '"*:)(', "albums": [], "songs": []})
+        response = self.client.get(reverse("api_search"), {"q": "x", "year": "y"})
+        self.assertEqual(response.status_code, 400)
+
+
+def _png(width=800, height=600, color="red"):
+    from PIL import Image
+    buf = BytesIO()
+    Image.new("RGB", (width, height), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class CoverVariantTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = Path(tmp.name)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _album(self, title, png):
+        album = _make_album(title, n_tracks=0)
+        album.cover_image = SimpleUploadedFile("cover.png", png)
+        album.save()
+        jobs.run_pending()
+        album.refresh_from_db()
+        return album
+
+    def test_variants_built_on_save(self):
+        album = self._album("Covered", _png())
+        self.assertEqual(album.cover_variants["widths"], [160, 320, 640])
+        digest = album.cover_variants["digest"]
+        variant = self.media / "album_covers/variants" / digest[:2] / \
+            f"{digest}-320.webp"
+        self.assertTrue(variant.exists())
+
+        data = self.client.get(
+            reverse("api_album_detail", args=[album.id])).json()
+        self.assertIn(f"{digest}-160.webp 160w", data["cover_srcset"]["webp"])
+        self.assertIn(f"{digest}-640.jpeg 640w", data["cover_srcset"]["jpeg"])
+
+    def test_identical_covers_share_variants(self):
+        first = self._album("First", _png())
+        second = self._album("Second", _png())
+        self.assertEqual(first.cover_variants["digest"],
+                         second.cover_variants["digest"])
+        self.assertEqual(
+            len(list((self.media / "album_covers/variants").rglob("*.*"))), 6)
+
+    def test_small_and_broken_covers(self):
+        small = self._album("Small", _png(100, 100))
+        self.assertEqual(small.cover_variants["widths"], [])
+        self.assertEqual(small.cover_srcset, {})
+        with self.assertLogs("catalogue.covers", "WARNING"):
+            broken = self._album("Broken", b"not an image")
+        self.assertEqual(broken.cover_variants["digest"], "")
+
+
+class JobQueueTests(TestCase):
+    def test_cover_upload_is_queued_not_processed(self):
+        album = _make_album("Queued", n_tracks=0)
+        album.cover_image = SimpleUploadedFile("cover.png", b"png")
+        with tempfile.TemporaryDirectory() as tmp, self.settings(MEDIA_ROOT=tmp):
+            album.save()
+            album.save()
+            album.refresh_from_db()
+            self.assertEqual(album.cover_variants.get("source", ""), "")
+            # deduplicated while queued
+            self.assertEqual(Job.objects.filter(
+                kind="cover_variants", status="queued",
+                payload__album_id=album.id).count(), 1)
+
+    def test_retry_then_fail(self):
+        calls = []
+
+        @jobs.handler("flaky")
+        def flaky(payload):
+            calls.append(payload)
+            raise RuntimeError("boom")
+        self.addCleanup(jobs.HANDLERS.pop, "flaky")
+
+        job = jobs.enqueue("flaky", {"n": 1})
+        job.max_attempts = 2
+        job.save()
+        with self.assertLogs("catalogue.jobs", "WARNING"):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("queued", 1))
+        self.assertIn("boom", job.last_error)
+        # backoff: not due yet
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        with self.assertLogs("catalogue.jobs", "WARNING"):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+
+        jobs.retry(Job.objects.filter(pk=job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("queued", 0))
+
+    def test_claim_is_exclusive(self):
+        job = jobs.enqueue("noop")
+        self.assertEqual(jobs.claim("a").pk, job.pk)
+        self.assertIsNone(jobs.claim("b"))
+
+    def test_worker_survives_queue_errors(self):
+        results = [RuntimeError("database is locked"), 1, 0]
+
+        def run_pending(worker, limit):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with mock.patch.object(jobs, "run_pending", run_pending), \
+                mock.patch.object(jobs.connections, "close_all") as close_all, \
+                mock.patch.object(jobs.time, "sleep") as sleep, \
+                self.assertLogs("catalogue.jobs", "ERROR"):
+            jobs.worker_loop(poll_interval=1, stop=lambda: not results)
+        close_all.assert_called_once()
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [2, 1])
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = Path(tmp.name)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _upload(self, album, data, filename="cover.png"):
+        album.cover_image = SimpleUploadedFile(filename, data)
+        album.save()
+        return album.cover_image.name
+
+    def _blobs(self):
+        return sorted(p.name for p in (self.media / "album_covers/cas").rglob("*")
+                      if p.is_file())
+
+    def test_duplicate_uploads_share_one_blob(self):
+        png = _png()
+        first = self._upload(_make_album("First", n_tracks=0), png)
+        second = self._upload(_make_album("Second", n_tracks=0), png,
+                              "other-name.png")
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith("album_covers/cas/"))
+        self.assertEqual(len(self._blobs()), 1)
+
+    def test_gc_deletes_only_orphans(self):
+        keep = _make_album("Keep", n_tracks=0)
+        self._upload(keep, _png(color="blue"))
+        gone = _make_album("Gone", n_tracks=0)
+        self._upload(gone, _png(color="green"))
+        gone.delete()
+
+        call_command("gc_media", "--grace", "0", stdout=StringIO())
+        keep.refresh_from_db()
+        self.assertEqual(self._blobs(), [Path(keep.cover_image.name).name])
+
+    def test_reused_blob_restarts_grace_period(self):
+        png = _png()
+        name = self._upload(_make_album("First", n_tracks=0), png)
+        path = self.media / name
+        os.utime(path, (0, 0))
+        self._upload(_make_album("Second", n_tracks=0), png)
+        self.assertGreater(path.stat().st_mtime, time.time() - 60)
+
+    def test_gc_deletes_orphaned_variants(self):
+        keep = _make_album("Keep", n_tracks=0)
+        self._upload(keep, _png(color="blue"))
+        gone = _make_album("Gone", n_tracks=0)
+        self._upload(gone, _png(color="green"))
+        jobs.run_pending()
+        gone.refresh_from_db()
+        orphan = gone.cover_variants["digest"]
+        gone.delete()
+
+        call_command("gc_media", "--grace", "0", stdout=StringIO())
+        keep.refresh_from_db()
+        left = {p.name.split("-")[0]
+                for p in (self.media / "album_covers/variants").rglob("*.*")}
+        self.assertEqual(left, {keep.cover_variants["digest"]})
+        self.assertNotEqual(orphan, keep.cover_variants["digest"])
+
+    def test_adopt_legacy_covers(self):
+        legacy = self.media / "album_covers"
+        legacy.mkdir()
+        png = _png()
+        (legacy / "dripping-stereo.png").write_bytes(png)
+        (legacy / "dripping-stereo_1uChkx4.png").write_bytes(png)
+        a = _make_album("A", n_tracks=0)
+        b = _make_album("B", n_tracks=0)
+        Album.objects.filter(pk=a.pk).update(
+            cover_image="album_covers/dripping-stereo.png")
+        Album.objects.filter(pk=b.pk).update(
+            cover_image="album_covers/dripping-stereo_1uChkx4.png")
+
+        call_command("gc_media", "--adopt", "--grace", "0", stdout=StringIO())
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual(a.cover_image.name, b.cover_image.name)
+        self.assertEqual(len(self._blobs()), 1)
+        self.assertFalse((legacy / "dripping-stereo.png").exists())
+
+
+@override_settings(DEBUG=False)
+class MediaServingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = Path(tmp.name)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        cas = self.media / "album_covers/cas/ab"
+        cas.mkdir(parents=True)
+        (cas / "abcdef.png").write_bytes(b"0123456789")
+        (self.media / "album_covers/legacy.png").write_bytes(b"legacy")
+
+    def _get(self, name, **headers):
+        response = self.client.get(f"/media/{name}", headers=headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_hashed_names_are_immutable_and_revalidate(self):
+        response, body = self._get("album_covers/cas/ab/abcdef.png")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, b"0123456789")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Content-Type"], "image/png")
+
+        again, _ = self._get("album_covers/cas/ab/abcdef.png",
+                             if_none_match=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+        legacy, _ = self._get("album_covers/legacy.png")
+        self.assertNotIn("immutable", legacy["Cache-Control"])
+
+    def test_range_requests(self):
+        name = "album_covers/cas/ab/abcdef.png"
+        response, body = self._get(name, range="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+
+        response, body = self._get(name, range="bytes=-3")
+        self.assertEqual(body, b"789")
+
+        response, _ = self._get(name, range="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+
+        # a stale If-Range gets the whole file
+        response, body = self._get(name, range="bytes=2-5", if_range='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, b"0123456789")
+
+    def test_precompressed_sibling(self):
+        (self.media / "album_covers/legacy.png.gz").write_bytes(b"gz")
+        response, body = self._get("album_covers/legacy.png",
+                                   accept_encoding="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(body, b"gz")
+        response, body = self._get("album_covers/legacy.png")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(body, b"legacy")
+
+    def test_rejects_traversal_and_missing(self):
+        self.assertEqual(self._get("../settings.py")[0].status_code, 404)
+        self.assertEqual(self._get("album_covers/nope.png")[0].status_code, 404)
+        self.assertEqual(self._get("album_covers")[0].status_code, 404)
+
+
+class AsyncApiViewTests(TestCase):
+    # the async views are only routed under ASGI, so call them directly and
+    # compare with what the sync views serve through the URLconf
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.album = _make_album("Album", n_tracks=3)
+        _make_album("Other", n_tracks=1)
+
+    async def _body(self, response):
+        if not response.streaming:
+            return response.content
+        if response.is_async:
+            return b"".join([chunk async for chunk in response.streaming_content])
+        # a sync stream reads the database as it goes
+        return await sync_to_async(b"".join)(response.streaming_content)
+
+    async def _call(self, view, url, *args, headers=None):
+        response = await view(self.factory.get(url, headers=headers), *args)
+        return response, await self._body(response)
+
+    async def test_same_payloads_as_sync_views(self):
+        album_url = reverse("api_album_detail", args=[self.album.id])
+        song = await Song.objects.afirst()
+        song_url = reverse("api_song_detail", args=[song.id])
+        cases = [
+            (async_api_views.api_albums, reverse("api_albums"), ()),
+            (async_api_views.api_albums, reverse("api_albums") + "?limit=1", ()),
+            (async_api_views.api_albums,
+             reverse("api_albums") + "?min_tracks=2&ordering=-track_count", ()),
+            (async_api_views.api_albums,
+             reverse("api_albums") + "?fields=id,title&include=tracks", ()),
+            (async_api_views.api_album_detail, album_url, (self.album.id,)),
+            (async_api_views.api_album_detail, album_url + "?fields=price",
+             (self.album.id,)),
+            (async_api_views.api_songs, reverse("api_songs"), ()),
+            (async_api_views.api_songs, reverse("api_songs") + "?stream=1", ()),
+            (async_api_views.api_song_detail, song_url, (song.id,)),
+        ]
+        for view, url, args in cases:
+            with self.subTest(url=url):
+                expected = await self.async_client.get(url)
+                expected_body = await self._body(expected)
+                response, body = await self._call(view, url, *args)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(body), json.loads(expected_body))
+                self.assertEqual(response["ETag"], expected["ETag"])
+
+    async def test_conditional_get_and_missing(self):
+        url = reverse("api_album_detail", args=[self.album.id])
+        response, _ = await self._call(
+            async_api_views.api_album_detail, url, self.album.id)
+        response, _ = await self._call(
+            async_api_views.api_album_detail, url, self.album.id,
+            headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertRaises(Http404):
+            await self._call(async_api_views.api_album_detail,
+                             reverse("api_album_detail", args=[999]), 999)
+
+    async def test_bad_cursor(self):
+        response, _ = await self._call(
+            async_api_views.api_songs, reverse("api_songs") + "?cursor=nope")
+        self.assertEqual(response.status_code, 400)
+
+
+class RoleTests(TestCase):
+    def test_role_joined_to_user(self):
+        _make_album("Album", n_tracks=1)
+        user = _make_user("editor", "editor")
+        self.client.force_login(user)
+        url = reverse("album_list")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertTrue(response.context["can_create"])
+        # no separate MusicManagerUser query: it is joined onto the user row
+        self.assertFalse([q for q in ctx.captured_queries
+                          if 'FROM "catalogue_musicmanageruser"' in q["sql"]])
+
+    def test_role_changes_apply_on_next_request(self):
+        _make_album("Album", n_tracks=1)
+        user = _make_user("editor", "editor")
+        self.client.force_login(user)
+        url = reverse("album_list")
+        self.assertTrue(self.client.get(url).context["can_create"])
+
+        # even a write that bypasses signals (another process, a bulk update)
+        MusicManagerUser.objects.filter(user=user).update(permission="viewer")
+        response = self.client.get(url)
+        self.assertFalse(response.context["can_create"])
+        self.assertFalse(response.context["albums"][0].can_delete)
+        self.assertEqual(response.context["mm_user"].permission, "viewer")
+
+        MusicManagerUser.objects.filter(user=user).delete()
+        response = self.client.get(url)
+        self.assertFalse(response.context["mm_user"])
+        self.assertEqual(self.client.post(reverse("create_album")).status_code,
+                         403)
+
+    def test_annotate_albums(self):
+        mine = _make_album("Mine", n_tracks=0, artist="Me")
+        theirs = _make_album("Theirs", n_tracks=0, artist="Someone")
+        annotate_albums(Role(1, "Me", "artist"), [mine, theirs])
+        self.assertEqual((mine.can_edit, theirs.can_edit), (True, False))
+        self.assertFalse(mine.can_delete)
+
+        annotate_albums(NO_ROLE, [mine])
+        self.assertEqual((mine.can_edit, mine.can_delete), (False, False))
+
+    def test_require_permission_without_profile(self):
+        user = User.objects.create_user(username="plain", password="pass")
+        self.assertEqual(require_permission(user, ["editor"]).status_code, 403)
+        request = RequestFactory().get("/")
+        request.user = _make_user("viewer", "viewer")
+        self.assertIsNone(require_permission(request.user, ["viewer"]))
+
+
+def _query_plan(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[3] for row in cursor.fetchall()]
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN QUERY PLAN every hot queryset and fail on a full table scan
+    (``SCAN <table>`` without an index) or a sort in a temp B-tree. Add new
+    hot paths to hot_querysets().
+    """
+
+    def hot_querysets(self):
+        from .api_views import (_album_queryset, _album_row_querysets,
+                                _tracklist_queryset)
+        tracklist = (AlbumTracklistItem.objects.select_related("song")
+                     .order_by("position", "id"))
+        return {
+            "album_list (editor)":
+                Album.objects.with_cached_stats().order_by("title", "id"),
+            "album_list (artist)":
+                Album.objects.filter(artist="Me").with_cached_stats()
+                .order_by("title", "id"),
+            "albums by release_date":
+                Album.objects.with_cached_stats().order_by("release_date", "id"),
+            "albums released in a year":
+                Album.objects.filter(release_date__year=2020),
+            "api album page": _album_queryset().filter(id__gt=10)
+                .order_by("id")[:51],
+            "album detail tracklist": tracklist.filter(album_id=1),
+            "tracklist prefetch":
+                _tracklist_queryset().filter(album_id__in=[1, 2, 3]),
+            "album collection tracklists":
+                _album_row_querysets(_album_queryset())[1],
+            "api song page": Song.objects.filter(id__gt=10).order_by("id")[:51],
+            "api tracklist page": AlbumTracklistItem.objects
+                .filter(id__gt=10).order_by("id")[:51],
+            "job claim": Job.objects.filter(status="queued",
+                                            run_after__lte=timezone.now())
+                .order_by("run_after", "id")[:5],
+        }
+
+    def test_hot_querysets_use_indexes(self):
+        for name, queryset in self.hot_querysets().items():
+            with self.subTest(name):
+                plan = _query_plan(queryset)
+                for step in plan:
+                    self.assertNotIn("TEMP B-TREE", step, plan)
+                    if step.startswith("SCAN "):
+                        self.assertIn("INDEX", step, plan)
+
+
+@skipUnless(settings.DB_PROFILE == "production", "basic database profile")
+class DatabaseProfileTests(TestCase):
+    def test_production_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -64 * 1024)
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+
+@override_settings(CATALOGUE_READ_REPLICAS=["replica"])
+class ReplicaRoutingTests(TestCase):
+    def _reads(self, method, *args, **kwargs):
+        """Send a request; return it and the alias each of its reads chose."""
+        seen = []
+
+        def spy(router, model, **hints):
+            seen.append(routers.read_alias())
+            return None  # the test database has no replica alias
+
+        with mock.patch.object(routers.ReplicaRouter, "db_for_read", spy):
+            response = getattr(self.client, method)(*args, **kwargs)
+        return response, seen
+
+    def test_outside_requests_reads_use_primary(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Album))
+        self.assertEqual(router.db_for_write(Album), "default")
+        self.assertFalse(router.allow_migrate("replica", "catalogue"))
+
+    def test_sessions_users_and_roles_read_primary(self):
+        from django.contrib.sessions.models import Session
+        router = routers.ReplicaRouter()
+        token = routers.route_reads("replica")
+        try:
+            self.assertEqual(router.db_for_read(Album), "replica")
+            for model in (Session, User, MusicManagerUser):
+                self.assertEqual(router.db_for_read(model), "default")
+        finally:
+            routers.reset_reads(token)
+
+    def test_safe_requests_read_replica_until_client_writes(self):
+        _make_album("Album", n_tracks=1)
+        _, seen = self._reads("get", reverse("api_albums"))
+        self.assertEqual(set(seen), {"replica"})
+
+        response, seen = self._reads(
+            "post", reverse("api_songs"), json.dumps({"title": "New"}),
+            content_type="application/json")
+        self.assertIn("musicdb_primary", response.cookies)
+        self.assertNotIn("replica", seen)
+
+        # within the window this client reads its own writes from the primary
+        _, seen = self._reads("get", reverse("api_albums"))
+        self.assertEqual(set(seen), {None})
+
+    def test_album_cache_is_keyed_by_replica(self):
+        request = RequestFactory().get(reverse("api_albums"))
+        token = routers.route_reads("replica")
+        try:
+            replica_key = cache.albums_key(request)
+        finally:
+            routers.reset_reads(token)
+        self.assertNotEqual(replica_key, cache.albums_key(request))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.album = _make_album("Album", n_tracks=2)
+
+    def _sample(self, body, name, **labels):
+        wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        prefix = f"{name}{{{wanted}}} "
+        for line in body.splitlines():
+            if line.startswith(prefix):
+                return float(line[len(prefix):])
+        self.fail(f"{prefix!r} not in metrics")
+
+    def test_per_endpoint_metrics(self):
+        url = reverse("api_album_detail", args=[self.album.id])
+        for _ in range(2):
+            self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.client.get(reverse("api_albums"))
+
+        with override_settings(CATALOGUE_METRICS_ALLOWED_IPS=["127.0.0.1"]):
+            response = self.client.get("/metrics")
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        detail = {"endpoint": "api_album_detail", "method": "GET"}
+        self.assertEqual(self._sample(
+            body, "musicdb_request_duration_seconds_count", **detail), 2)
+        self.assertEqual(self._sample(
+            body, "musicdb_requests_total", **detail, status=200), 2)
+        # ETag lookup, album and tracklist per request
+        self.assertEqual(self._sample(
+            body, "musicdb_db_queries_total", **detail), 6)
+        self.assertGreater(self._sample(
+            body, "musicdb_response_bytes_total", **detail), 0)
+        self.assertGreater(self._sample(
+            body, "musicdb_serialization_seconds_total", **detail), 0)
+        self.assertIn('endpoint="api_albums"', body)
+        self.assertNotIn('endpoint="metrics"', body)
+
+    def test_metrics_not_public(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code,
+                         403)
+        # the proxy host itself is not trusted by default
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="127.0.0.1").status_code,
+                         403)
+        staff = User.objects.create_user("ops", password="pass", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code,
+                         200)
+
+    @override_settings(CATALOGUE_METRICS_ALLOWED_IPS=["10.0.0.5"],
+                       CATALOGUE_TRUSTED_PROXIES=["127.0.0.1"])
+    def test_metrics_behind_proxy(self):
+        url = reverse("metrics")
+
+        def status(client_addr, remote="127.0.0.1"):
+            return self.client.get(url, REMOTE_ADDR=remote,
+                                    HTTP_X_FORWARDED_FOR=client_addr).status_code
+
+        self.assertEqual(status("203.0.113.9"), 403)
+        self.assertEqual(status("10.0.0.5"), 200)
+        # a client-supplied X-Forwarded-For is not the last hop
+        self.assertEqual(status("10.0.0.5, 203.0.113.9"), 403)
+        # only trusted proxies can forward
+        self.assertEqual(status("10.0.0.5", remote="203.0.113.9"), 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    async def test_async_requests_recorded(self):
+        from .middleware import ReplicaRoutingMiddleware, RoleMiddleware
+        from .profiling import ProfilingMiddleware
+
+        async def view(request):
+            return HttpResponse("ok")
+
+        # no middleware of ours forces ASGI requests through a thread
+        for middleware in (metrics.MetricsMiddleware, ProfilingMiddleware,
+                           ReplicaRoutingMiddleware, RoleMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(view)), middleware)
+
+        # as connection_created does for connections opened from now on
+        await sync_to_async(metrics.install_recorder)(connection)
+        await self.async_client.get(
+            reverse("api_album_detail", args=[self.album.id]))
+        entry = (await sync_to_async(metrics.snapshot)())[
+            ("api_album_detail", "GET")]
+        self.assertEqual(entry.count, 1)
+        self.assertGreater(entry.queries, 0)
+
+    @override_settings(CATALOGUE_SLOW_REQUEST_MS=0)
+    def test_slow_requests_logged_with_sql(self):
+        with self.assertLogs("catalogue.slow", "WARNING") as logs:
+            self.client.get(reverse("api_album_detail", args=[self.album.id]))
+        self.assertIn("api_album_detail", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        profiling._counters.clear()
+        _make_album("Album", n_tracks=2)
+
+    def _settings(self, **overrides):
+        return override_settings(CATALOGUE_PROFILING={
+            "ENABLED": True, "URL_NAMES": ["api_albums"], "SAMPLE_RATE": 2,
+            "MODE": "cprofile", "DIR": self.dir, "KEEP": 10, **overrides})
+
+    def test_samples_one_in_n_of_chosen_urls(self):
+        with self._settings():
+            for _ in range(4):
+                self.client.get(reverse("api_albums"))
+            self.client.get(reverse("api_songs"))
+        captures = sorted(p.name for p in self.dir.iterdir())
+        self.assertEqual(len(captures), 2)
+        self.assertTrue(all(name.startswith("api_albums-") for name in captures))
+
+        out = StringIO()
+        call_command("aggregate_profiles", "--dir", str(self.dir), stdout=out)
+        self.assertIn("_encode_album_rows", out.getvalue())
+
+    def test_signed_header_profiles_on_demand(self):
+        url = reverse("api_songs")
+        with self._settings(ENABLED=False):
+            self.client.get(url, headers={profiling.HEADER: "forged"})
+            self.assertEqual(list(self.dir.iterdir()), [])
+            self.client.get(url, headers={profiling.HEADER: profiling.make_token()})
+        self.assertEqual(len(list(self.dir.glob("api_songs-*.prof"))), 1)
+
+    def test_sampler_mode_and_rotation(self):
+        with self._settings(MODE="sample", SAMPLE_RATE=1, KEEP=2):
+            for _ in range(3):
+                self.client.get(reverse("api_albums"))
+        self.assertEqual(len(list(self.dir.glob("*.folded"))), 2)
+        out = StringIO()
+        call_command("aggregate_profiles", "--dir", str(self.dir), stdout=out)
+        self.assertIn("samples", out.getvalue())
+
+    def test_one_capture_at_a_time(self):
+        conf = {**profiling.config(), "DIR": self.dir}
+        inner = []
+        outer = profiling.profile_call(
+            lambda: profiling.profile_call(lambda: inner.append(1) or "inner",
+                                           "inner", conf),
+            "outer", conf)
+        self.assertEqual((outer, inner), ("inner", [1]))
+        [capture] = self.dir.iterdir()
+        self.assertTrue(capture.name.startswith("outer-"))
+        self.assertTrue(capture.stem.endswith(f"-{threading.get_ident()}"))
+
+
+@override_settings(CATALOGUE_JSON_COMPACT=False)
+class JsonEncodingTests(TestCase):
+    def setUp(self):
+        self.album = _make_album("Ünïcode “quotes”", n_tracks=3)
+        Album.objects.filter(id=self.album.id).update(
+            description="Long, \"quoted\" & 100% ünïcode… " * 10,
+            cover_variants={"digest": "ab" * 32, "widths": [160, 320]})
+        _make_album("Empty", n_tracks=0)
+
+    def _formats(self):
+        formats = [{"CATALOGUE_JSON_BACKEND": "stdlib"},
+                   {"CATALOGUE_JSON_BACKEND": "stdlib",
+                    "CATALOGUE_JSON_COMPACT": True}]
+        if encoding.orjson:
+            formats.append({"CATALOGUE_JSON_BACKEND": "orjson",
+                            "CATALOGUE_JSON_COMPACT": True})
+        return formats
+
+    def test_album_rows_match_dict_serializer(self):
+        from .api_views import (_album_queryset, _album_row_querysets,
+                                _encode_album_rows, _serialize_albums)
+        request = RequestFactory().get(reverse("api_albums"))
+        albums = _album_queryset().order_by("-title")
+        for conf in self._formats():
+            with self.subTest(**conf), override_settings(**conf):
+                self.assertEqual(
+                    _encode_album_rows(*_album_row_querysets(albums), request),
+                    encoding.dumps(_serialize_albums(albums, request)))
+
+    def test_responses_declare_utf8(self):
+        urls = [reverse("api_albums"),
+                reverse("api_album_detail", args=[self.album.id]),
+                reverse("api_songs") + "?stream=1"]
+        for url in urls:
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertEqual(response["Content-Type"],
+                                 "application/json; charset=utf-8")
+                self.assertIn(json.dumps("Ünïcode “quotes”")[1:-1].encode(),
+                              b"".join(response) if response.streaming
+                              else response.content)
+
+    def test_default_format_matches_django(self):
+        from django.http import JsonResponse as DjangoJsonResponse
+
+        from .api_views import (_album_queryset, _serialize_album,
+                                _serialize_albums, _serialize_songs)
+        request = RequestFactory().get("/")
+        albums = _album_queryset().order_by("id")
+        cases = [
+            (reverse("api_albums"), _serialize_albums(albums, request)),
+            (reverse("api_album_detail", args=[self.album.id]),
+             _serialize_album(albums.get(id=self.album.id), request)),
+            (reverse("api_songs") + "?stream=1",
+             _serialize_songs(Song.objects.order_by("id"), request)),
+        ]
+        for url, data in cases:
+            with self.subTest(url):
+                response = self.client.get(url)
+                body = (b"".join(response) if response.streaming
+                        else response.content)
+                self.assertEqual(
+                    body, DjangoJsonResponse(data, safe=False).content)
+
+    @skipUnless(encoding.orjson, "orjson is not installed")
+    def test_backends_write_the_same_bytes(self):
+        urls = [reverse("api_albums"), reverse("api_albums") + "?limit=1",
+                reverse("api_album_detail", args=[self.album.id]),
+                reverse("api_songs") + "?stream=1"]
+        for url in urls:
+            bodies = []
+            for name in ("stdlib", "orjson"):
+                with override_settings(CATALOGUE_JSON_BACKEND=name,
+                                       CATALOGUE_JSON_COMPACT=True):
+                    cache.bump_version()
+                    response = self.client.get(url)
+                bodies.append(b"".join(response) if response.streaming
+                              else response.content)
+            with self.subTest(url=url):
+                self.assertEqual(bodies[0], bodies[1])
+                json.loads(bodies[0])
+
+    def test_backend_setting(self):
+        data = {"price": Decimal("9.99"), "day": date(2020, 1, 2), "é": "ü"}
+        with override_settings(CATALOGUE_JSON_BACKEND="stdlib"):
+            self.assertEqual(
+                encoding.dumps(data),
+                b'{"price": "9.99", "day": "2020-01-02", "\\u00e9": "\\u00fc"}')
+        with override_settings(CATALOGUE_JSON_BACKEND="stdlib",
+                               CATALOGUE_JSON_COMPACT=True):
+            self.assertEqual(encoding.dumps(data),
+                             '{"price":"9.99","day":"2020-01-02","é":"ü"}'.encode())
+        with override_settings(CATALOGUE_JSON_BACKEND="orjson",
+                               CATALOGUE_JSON_COMPACT=False):
+            with self.assertRaises(ImproperlyConfigured):
+                encoding.dumps({})
+        with override_settings(CATALOGUE_JSON_BACKEND="auto",
+                               CATALOGUE_JSON_COMPACT=False):
+            self.assertEqual(encoding.backend(), "stdlib")
+        with override_settings(CATALOGUE_JSON_BACKEND="simdjson"):
+            with self.assertRaises(ImproperlyConfigured):
+                encoding.dumps({})
+        with mock.patch.object(encoding, "orjson", None), \
+                override_settings(CATALOGUE_JSON_BACKEND="auto"):
+            self.assertEqual(encoding.backend(), "stdlib")
+
+
+class LeanListTests(TestCase):
+    def setUp(self):
+        _make_album("Lean “quoted” ünïcode", n_tracks=3)
+        AlbumTracklistItem.objects.filter(position=2).update(position=None)
+        self.request = RequestFactory().get(reverse("api_songs"))
+
+    def test_row_encoders_match_model_serializers(self):
+        from .api_views import (_encode_song_rows, _encode_tracklist_rows,
+                                _serialize_songs, _serialize_tracklist_items,
+                                _song_rows, _tracklist_rows)
+        cases = [
+            (_encode_song_rows, _song_rows(), _serialize_songs,
+             Song.objects.all()),
+            (_encode_tracklist_rows, _tracklist_rows(),
+             _serialize_tracklist_items,
+             AlbumTracklistItem.objects.order_by("id")),
+        ]
+        for encode, rows, serialize, instances in cases:
+            with self.subTest(encode.__name__):
+                expected = encoding.dumps(serialize(instances, self.request))
+                self.assertEqual(encode(rows, self.request), expected)
+                # pages and streams serialize the named rows
+                self.assertEqual(encoding.dumps(serialize(rows, self.request)),
+                                 expected)
+
+    def test_lists_build_no_model_instances(self):
+        urls = [reverse("api_songs"), reverse("api_songs") + "?limit=2",
+                reverse("api_songs") + "?stream=1", reverse("api_tracklists"),
+                reverse("api_tracklists") + "?limit=2"]
+        for url in urls:
+            with self.subTest(url), \
+                    mock.patch.object(Song, "from_db") as song_from_db, \
+                    mock.patch.object(AlbumTracklistItem, "from_db") as item_from_db:
+                response = self.client.get(url)
+                if response.streaming:
+                    b"".join(response)
+                self.assertEqual(response.status_code, 200)
+                song_from_db.assert_not_called()
+                item_from_db.assert_not_called()
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.album = _make_album("Sparse", n_tracks=3)
+        _make_album("Single", n_tracks=1)
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        album_sql = [q["sql"] for q in queries
+                     if 'FROM "catalogue_album"' in q["sql"]
+                     and "MAX(" not in q["sql"]]
+        return response, album_sql, len(queries)
+
+    def test_list_skips_tracks_and_stats(self):
+        url = reverse("api_albums") + "?fields=id,title,artist,price"
+        response, album_sql, n_queries = self._get(url)
+        data = response.json()
+        self.assertEqual([list(a) for a in data],
+                         [["id", "title", "artist", "price"]] * 2)
+        # the albums alone
+        self.assertEqual(n_queries, 1)
+        self.assertNotIn("albumstats", album_sql[0])
+        self.assertNotIn("description", album_sql[0])
+
+    def test_include_tracks_and_pages(self):
+        url = reverse("api_albums") + "?fields=title&include=tracks&limit=1"
+        data = self.client.get(url).json()
+        self.assertEqual(list(data["results"][0]), ["tracks", "title"])
+        self.assertEqual(len(data["results"][0]["tracks"]), 3)
+        self.assertIn("fields=title", data["next"])
+        self.assertIn("include=tracks", data["next"])
+
+    def test_stats_filters_without_stats_fields(self):
+        url = (reverse("api_albums")
+               + "?fields=id&min_tracks=2&ordering=-total_playtime")
+        self.assertEqual(self.client.get(url).json(), [{"id": self.album.id}])
+
+    def test_detail(self):
+        url = reverse("api_album_detail", args=[self.album.id])
+        response, album_sql, n_queries = self._get(
+            url + "?fields=title,total_playtime")
+        self.assertEqual(response.json(), {"total_playtime": 303,
+                                           "title": "Sparse"})
+        self.assertEqual(n_queries, 2)  # ETag lookup, album
+
+    def test_bad_fields(self):
+        for query in ("fields=id,nope", "include=songs"):
+            with self.subTest(query):
+                for url in (reverse("api_albums"),
+                            reverse("api_album_detail", args=[self.album.id])):
+                    response = self.client.get(f"{url}?{query}")
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("error", response.json())
+
+    def test_row_encoder_matches_dict_serializer(self):
+        from .api_views import (_album_queryset, _album_row_querysets,
+                                _encode_album_rows, _serialize_albums)
+        request = RequestFactory().get(reverse("api_albums"))
+        for fields in (("id",), ("title", "tracks"),
+                       ("total_playtime", "cover_image", "release_date")):
+            with self.subTest(fields):
+                albums = _album_queryset(fields).order_by("id")
+                self.assertEqual(
+                    _encode_album_rows(*_album_row_querysets(albums, fields),
+                                       request, fields),
+                    encoding.dumps(_serialize_albums(albums, request, fields)))
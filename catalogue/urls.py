@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import api_views
+from . import async_api_views
+from . import metrics
 from django.contrib.auth import views as auth_views
 from catalogue.views import logout_then_home
+# read endpoints with an ASGI-native twin (see async_api_views.py)
+reads = async_api_views if getattr(settings, "CATALOGUE_ASYNC_API", False) else api_views
+
 urlpatterns = [
     # Web views
     path('', views.album_list_view, name='album_list'),
@@ -19,22 +25,33 @@ urlpatterns = [
     path('albums/<int:id>/<slug:slug>/',
          views.album_detail_slug_view, name='album_detail_slug'),
 
+    # Prometheus metrics (catalogue/metrics.py)
+    path('metrics', metrics.metrics_view, name="metrics"),
+
     # API root
     path('api/', api_views.api_home, name="api_home"),
 
     # API - Songs
-    path('api/songs/', api_views.api_songs, name="api_songs"),
-    path('api/songs/<int:id>/', api_views.api_song_detail, name="api_song_detail"),
+    path('api/songs/', reads.api_songs, name="api_songs"),
+    path('api/songs/bulk/', api_views.api_songs_bulk, name="api_songs_bulk"),
+    path('api/songs/<int:id>/', reads.api_song_detail, name="api_song_detail"),
 
     # API - Albums
-    path('api/albums/', api_views.api_albums, name="api_albums"),
-    path('api/albums/<int:id>/', api_views.api_album_detail,
+    path('api/albums/', reads.api_albums, name="api_albums"),
+    path('api/albums/<int:id>/', reads.api_album_detail,
          name="api_album_detail"),
+    path('api/albums/cache/', api_views.api_albums_cache,
+         name="api_albums_cache"),
 
     # API - Tracklists
     path('api/tracklist/', api_views.api_tracklists, name="api_tracklists"),
+    path('api/tracklist/bulk/', api_views.api_tracklists_bulk,
+         name="api_tracklists_bulk"),
     path('api/tracklist/<int:id>/', api_views.api_tracklist_detail,
          name="api_tracklist_detail"),
+
+    # API - Search
+    path('api/search/', api_views.api_search, name="api_search"),
     path('accounts/login/', auth_views.LoginView.as_view(
          template_name='catalogue/login.html'), name='login'),
     path('accounts/logout/', logout_then_home, name='logout'),
@@ -1,3 +1,4 @@
+from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponseForbidden
 
 
@@ -11,10 +12,56 @@ def require_permission(user, allowed_roles):
 
     try:
         role = user.musicmanageruser.permission
-    except Exception:
+    except ObjectDoesNotExist:
         return HttpResponseForbidden("No profile found")
 
     if role not in allowed_roles:
         return HttpResponseForbidden("You do not have permission for this action")
 
     return None
+
+
+# query params -> lookups on the Album.objects.with_stats() /
+# with_cached_stats() annotations
+ALBUM_STATS_FILTERS = {
+    "min_playtime": "total_playtime__gte",
+    "max_playtime": "total_playtime__lte",
+    "min_tracks": "track_count__gte",
+    "max_tracks": "track_count__lte",
+}
+ALBUM_ORDERINGS = {"title", "artist", "price", "release_date",
+                   "total_playtime", "track_count"}
+ALBUM_STATS_ORDERINGS = {"total_playtime", "track_count"}
+
+
+def uses_album_stats(params):
+    """True when filter_albums_by_stats() reads the stats annotations."""
+    ordering = (params.get("ordering") or "").lstrip("-")
+    return (ordering in ALBUM_STATS_ORDERINGS
+            or any(params.get(param) not in (None, "")
+                   for param in ALBUM_STATS_FILTERS))
+
+
+def filter_albums_by_stats(queryset, params, default_ordering=None):
+    """
+    Apply ?min_playtime= / ?max_playtime= / ?min_tracks= / ?max_tracks=
+    and ?ordering= (optionally prefixed with "-") to a stats-annotated
+    queryset.
+    Raises ValueError on a bad value.
+    """
+    lookups = {}
+    for param, lookup in ALBUM_STATS_FILTERS.items():
+        if params.get(param) not in (None, ""):
+            try:
+                lookups[lookup] = int(params[param])
+            except ValueError:
+                raise ValueError(f"{param} must be an integer.")
+    if lookups:
+        queryset = queryset.filter(**lookups)
+
+    ordering = params.get("ordering") or default_ordering
+    if ordering:
+        if ordering.lstrip("-") not in ALBUM_ORDERINGS:
+            raise ValueError(f"Cannot order by {ordering!r}.")
+        queryset = queryset.order_by(ordering, "id")
+    return queryset
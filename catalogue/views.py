@@ -7,29 +7,26 @@ from django.contrib.auth import logout
 from django.shortcuts import redirect
 from .forms import AlbumForm, TracklistItemForm
 from .models import Album, AlbumTracklistItem, Song
+from .permissions import annotate_albums, resolve_role
+from .utils import filter_albums_by_stats
 
 # ---- helpers --------------------------------------------------------------
 
 
 def _mm_user(request):
-    """Return attached MusicManagerUser or None."""
-    user = getattr(request, "user", None)
-    return getattr(user, "musicmanageruser", None) if (user and user.is_authenticated) else None
+    """Return the request's Role (falsy when there is no MusicManagerUser)."""
+    if not hasattr(request, "mm_user"):  # RoleMiddleware not installed
+        request.mm_user = resolve_role(request)
+    return request.mm_user
 
 
 def _can_edit_album(mm_user, album: Album) -> bool:
-    if not mm_user:
-        return False
-    if mm_user.permission == "editor":
-        return True
-    if mm_user.permission == "artist" and album.artist == mm_user.display_name:
-        return True
-    return False
+    return mm_user.can_edit(album)
 
 
 def _can_delete_album(mm_user, album: Album) -> bool:
     # Only editors can delete (per brief / mockups)
-    return bool(mm_user and mm_user.permission == "editor")
+    return mm_user.can_delete(album)
 
 
 def _artist_only_queryset(mm_user):
@@ -48,19 +45,19 @@ def _artist_only_queryset(mm_user):
 
 def album_list_view(request):
     mm_user = _mm_user(request)
-    qs = _artist_only_queryset(mm_user).order_by("title", "id")
+    qs = _artist_only_queryset(mm_user).with_cached_stats()
+    try:
+        qs = filter_albums_by_stats(qs, request.GET, default_ordering="title")
+    except ValueError as e:
+        messages.error(request, str(e))
+        qs = qs.order_by("title", "id")
 
-    albums = list(qs)
-    for a in albums:
-        # editor OR owning artist
-        a.can_edit = _can_edit_album(mm_user, a)
-        a.can_delete = bool(mm_user and mm_user.permission ==
-                            "editor")  # editors only
+    albums = annotate_albums(mm_user, list(qs))
 
     return render(request, "catalogue/album_list.html", {
         "albums": albums,
         "mm_user": mm_user,
-        "can_create": bool(mm_user and mm_user.permission == "editor"),
+        "can_create": mm_user.can_create,
     })
 
 
@@ -71,9 +68,7 @@ def album_detail_view(request, id):
     mm_user = _mm_user(request)
     # editor OR owning artist
     can_edit = _can_edit_album(mm_user, album)
-    can_delete = bool(mm_user and mm_user.permission ==
-                      "editor")  # editors only
-    print(f"can_edit: {can_edit}, can_delete: {can_delete}")
+    can_delete = _can_delete_album(mm_user, album)  # editors only
     return render(request, "catalogue/album_detail.html", {
         "album": album,
         "tracklist": tracklist,
@@ -89,7 +84,7 @@ def album_detail_view(request, id):
 @require_http_methods(["GET", "POST"])
 def create_album_view(request):
     mm_user = _mm_user(request)
-    if not mm_user or mm_user.permission != "editor":
+    if not mm_user.can_create:
         raise PermissionDenied()
 
     if request.method == "POST":
@@ -1,15 +1,33 @@
+import { useState } from "react";
 import { useQuery } from "react-query";
-import { Table, Spinner, Alert } from "react-bootstrap";
+import { Table, Spinner, Alert, Button } from "react-bootstrap";
 import { Link } from "react-router-dom";
 
+const PAGE_SIZE = 25;
+// only what the table shows: no tracklists, descriptions or playtime
+const FIELDS = "id,title,artist,price";
+
+// the API returns absolute next/prev links; we only need their cursor
+function cursorOf(url) {
+  return url ? new URL(url).searchParams.get("cursor") : null;
+}
+
 export default function AlbumList() {
-  const { data, isLoading, error } = useQuery("albums", () =>
-    fetch("/api/albums/", { headers: { Accept: "application/json" } }).then(
-      (r) => {
+  const [cursor, setCursor] = useState(null);
+
+  const { data, isLoading, error } = useQuery(
+    ["albums", cursor],
+    () => {
+      const params = new URLSearchParams({ limit: PAGE_SIZE, fields: FIELDS });
+      if (cursor) params.set("cursor", cursor);
+      return fetch(`/api/albums/?${params}`, {
+        headers: { Accept: "application/json" },
+      }).then((r) => {
         if (!r.ok) throw new Error(`HTTP ${r.status}`);
         return r.json();
-      }
-    )
+      });
+    },
+    { keepPreviousData: true }
   );
 
   if (isLoading) return <Spinner animation="border" />;
@@ -27,7 +45,7 @@ export default function AlbumList() {
           </tr>
         </thead>
         <tbody>
-          {data.map((album) => (
+          {data.results.map((album) => (
             <tr key={album.id}>
               <td>
                 <Link to={`/albums/${album.id}`}>{album.title}</Link>
@@ -38,6 +56,22 @@ export default function AlbumList() {
           ))}
         </tbody>
       </Table>
+      <div className="d-flex gap-2">
+        <Button
+          variant="outline-secondary"
+          disabled={!data.prev}
+          onClick={() => setCursor(cursorOf(data.prev))}
+        >
+          Previous
+        </Button>
+        <Button
+          variant="outline-secondary"
+          disabled={!data.next}
+          onClick={() => setCursor(cursorOf(data.next))}
+        >
+          Next
+        </Button>
+      </div>
     </div>
   );
 }
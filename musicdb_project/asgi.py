@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'musicdb_project.settings')
+# serve the read API from the async views (catalogue/async_api_views.py)
+os.environ.setdefault('CATALOGUE_ASYNC_API', '1')
+# connections are per thread and async requests hop threads; don't persist
+os.environ.setdefault('MUSICDB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
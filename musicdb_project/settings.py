@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,11 +44,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalogue.metrics.MetricsMiddleware',
+    'catalogue.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'catalogue.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'catalogue.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,12 +81,93 @@ WSGI_APPLICATION = 'musicdb_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# MUSICDB_DB_PROFILE selects how SQLite is driven:
+#   basic (default)  Django's defaults (rollback journal, new connection per
+#       request)
+#   production  WAL journal (readers never wait for the writer),
+#       synchronous=NORMAL (safe with WAL, no fsync per commit), a 128 MiB
+#       mmap and 64 MiB page cache, a busy timeout instead of instant
+#       "database is locked", persistent connections, and BEGIN IMMEDIATE so
+#       a transaction that reads then writes takes the write lock up front
+#       rather than deadlocking on the lock upgrade
+# production switches the database file to WAL for good (it leaves -wal and
+# -shm files beside it), so deployments opt in with MUSICDB_DB_PROFILE.
+# benchmarks/sqlite_bench.py compares the two under mixed load.
+DB_PROFILE = os.environ.get('MUSICDB_DB_PROFILE', 'basic')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative = KiB
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('MUSICDB_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        # asgi.py sets 0: async requests do not reuse a thread's connection
+        'CONN_MAX_AGE': int(os.environ.get('MUSICDB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,  # busy timeout, seconds
+            'init_command': ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    })
+
+# Read replicas: MUSICDB_REPLICAS=/srv/replica1.sqlite3,/srv/replica2.sqlite3
+# Safe requests read catalogue data from one of them (sessions, users and
+# roles always come from the primary); see catalogue/routers.py. Replicas
+# must be refreshed continuously, e.g. `manage.py sync_replicas` run by a
+# timer every few seconds, not by hand: the read-your-writes cookie only
+# covers CATALOGUE_READ_YOUR_WRITES_SECONDS, after which whatever the
+# replica holds is served.
+for _i, _path in enumerate(filter(None, os.environ.get('MUSICDB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{_i}'] = {
+        **DATABASES['default'],
+        'NAME': _path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+CATALOGUE_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+CATALOGUE_READ_YOUR_WRITES_SECONDS = 5
+DATABASE_ROUTERS = ['catalogue.routers.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The album response cache and its version token must be shared by every
+# process that serves or writes albums (web workers, `manage.py
+# run_workers`), so CATALOGUE_API_CACHE names a file cache rather than the
+# per-process local memory one. Across hosts, point it at Redis or
+# Memcached instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'musicdb',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    'catalogue': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('MUSICDB_CACHE_DIR', str(BASE_DIR / 'cache')),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+CATALOGUE_API_CACHE = 'catalogue'
+CATALOGUE_API_CACHE_TTL = 300
 
 
 # Password validation
@@ -124,6 +210,46 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+AUTHENTICATION_BACKENDS = [
+    'catalogue.backends.RoleModelBackend',
+    # sessions created before RoleModelBackend still name this one
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 LOGIN_URL = '/accounts/login/'
+
+# Media is served by catalogue.media.serve_media. Behind nginx, set this to an
+# `internal` location aliased to MEDIA_ROOT so nginx sends the file bytes.
+CATALOGUE_MEDIA_ACCEL_REDIRECT = None
+
+# Route the read API endpoints to catalogue/async_api_views.py (async ORM).
+# asgi.py turns this on; under WSGI the sync views avoid a per-request loop.
+CATALOGUE_ASYNC_API = os.environ.get("CATALOGUE_ASYNC_API", "") == "1"
+
+# Requests slower than this are logged to "catalogue.slow" with their SQL.
+CATALOGUE_SLOW_REQUEST_MS = 500
+
+# /metrics answers staff users and these client addresses only (e.g. the
+# Prometheus server). Behind nginx, list the proxy's own address in
+# CATALOGUE_TRUSTED_PROXIES so the client is read from X-Forwarded-For.
+CATALOGUE_METRICS_ALLOWED_IPS = []
+CATALOGUE_TRUSTED_PROXIES = []
+
+# Request profiling (catalogue/profiling.py). Off by default; a request can
+# also be profiled on demand with the X-Catalogue-Profile header.
+CATALOGUE_PROFILING = {
+    'ENABLED': os.environ.get('MUSICDB_PROFILING', '') == '1',
+    'URL_NAMES': ['api_albums', 'api_album_detail'],
+    'SAMPLE_RATE': 100,
+    'MODE': 'cprofile',
+    'DIR': BASE_DIR / 'profiles',
+    'KEEP': 500,
+}
+
+# JSON encoder for API responses (catalogue/encoding.py). Responses match
+# django.http.JsonResponse byte for byte unless CATALOGUE_JSON_COMPACT opts
+# in to "," / ":" separators and raw UTF-8; 'auto' then uses orjson when it
+# is installed (pip install orjson), and the stdlib encoder otherwise.
+CATALOGUE_JSON_COMPACT = os.environ.get('MUSICDB_JSON_COMPACT', '') == '1'
+CATALOGUE_JSON_BACKEND = os.environ.get('MUSICDB_JSON_BACKEND', 'auto')
@@ -1,8 +1,11 @@
+import re
+
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views  # ✅ required
 from django.conf import settings
-from django.conf.urls.static import static
+from django.urls import re_path
+from catalogue.media import serve_media
 from catalogue.views import logout_then_home
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,6 +16,11 @@ urlpatterns = [
         template_name='catalogue/login.html'), name='login'),
     path('accounts/logout/', logout_then_home, name='logout'),
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
+# ✅ Media (album covers) is served in every mode, not only with DEBUG on;
+# see catalogue/media.py for the caching and Range handling.
+if settings.MEDIA_URL.startswith("/"):
+    urlpatterns += [
+        re_path(r"^%s(?P<path>.+)$"
+                % re.escape(settings.MEDIA_URL.lstrip("/")),
+                serve_media, name="media"),
+    ]